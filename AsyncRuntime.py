@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from apis.Config import ASYNC_IO_WORKERS, DeviceStatus, ControlModes
+from apis.DatabaseAccess.DbTables import SharedDataColumns
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+from TemperatureSensorThread import DELAY_BETWEEN_READS, HISTORY_BATCH_SIZE
+from ThermoStatThread import WATCHED_COLUMNS, MINIMUM_WAIT
+from ZoneSchedulerThread import (
+    Zone,
+    needs_decision,
+    register_sim_zone,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """
+    Runs the sensor reads, thermostat decisions and relay commands of every
+    zone as coroutines on one asyncio event loop. Blocking storage and
+    hardware calls are offloaded to a small thread pool, so the number of
+    threads doesn't grow with the number of zones. Stopped by cancelling
+    the task running AsyncRuntime::run.
+    """
+
+    def __init__(
+        self,
+        target_temperatures: dict,
+        db_interface: DbInterface,
+        read_interval=None,
+        max_workers=None,
+    ):
+        if not read_interval:
+            self.read_interval = DELAY_BETWEEN_READS
+        else:
+            self.read_interval = read_interval
+
+        if not max_workers:
+            self.max_workers = ASYNC_IO_WORKERS
+        else:
+            self.max_workers = max_workers
+
+        self.db_interface: DbInterface = db_interface
+        self.db_interface.add_zones(target_temperatures.keys())
+        self.zones: dict = {
+            zone_id: Zone(zone_id, db_interface.for_zone(zone_id), target_temperature)
+            for zone_id, target_temperature in target_temperatures.items()
+        }
+        self.__executor: ThreadPoolExecutor = None
+        self.__wake_ups: dict = dict()  # zone id -> asyncio.Event for the thermostat
+
+    async def run(self):
+        """
+        runs every zone until cancelled, then stores the buffered
+        history and shuts the thread pool down
+        """
+        self.__executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="AsyncRuntimeIO"
+        )
+        tasks: list = []
+        try:
+            for zone in self.zones.values():
+                self.__wake_ups[zone.zone_id] = asyncio.Event()
+                tasks.append(asyncio.create_task(self.__sensor_loop(zone)))
+                tasks.append(asyncio.create_task(self.__thermostat_loop(zone)))
+            await asyncio.gather(*tasks)
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for zone in self.zones.values():
+                await self.__offload(zone.sensor.flush_history)
+            self.__executor.shutdown(wait=True)
+            logger.info("AsyncRuntime::run stopped")
+
+    async def __sensor_loop(self, zone: Zone):
+        """
+        takes a read every read_interval seconds and wakes the
+        zone's thermostat up when a watched column changes
+        """
+        while True:
+            device_status = zone.sensor.cached_columns.read_column(
+                SharedDataColumns.DEVICE_STATUS.value
+            )
+            running_avg = await self.__offload(zone.sensor.take_sample, device_status)
+            if len(zone.sensor.history_buffer) >= HISTORY_BATCH_SIZE:
+                await self.__offload(zone.sensor.flush_history)
+            if running_avg is not None:
+                await self.__offload(
+                    zone.db_interface.update_column,
+                    SharedDataColumns.LAST_TEMPERATURE.value,
+                    running_avg,
+                )
+            if (
+                zone.db_interface.get_update_version(WATCHED_COLUMNS)
+                > zone.last_version
+            ):
+                self.__wake_ups[zone.zone_id].set()
+            await asyncio.sleep(self.read_interval)
+
+    async def __thermostat_loop(self, zone: Zone):
+        """
+        makes a decision whenever the sensor loop wakes it up, otherwise
+        only wakes up to enforce the device's maximum on time
+        """
+        wake_up: asyncio.Event = self.__wake_ups[zone.zone_id]
+        while True:
+            wake_up.clear()
+            zone.last_version = zone.db_interface.get_update_version(WATCHED_COLUMNS)
+            timeout = await self.__decide(zone)
+            try:
+                await asyncio.wait_for(wake_up.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass  # maximum on time check is due
+
+    async def __decide(self, zone: Zone):
+        """
+        reads the zone's state once and switches the relay if it may have
+        to change. Returns the seconds until the next maximum on time
+        check, or None if the device is off
+        """
+        state: dict = await self.__offload(zone.db_interface.read_device_state)
+        device_status = state[SharedDataColumns.DEVICE_STATUS.value]
+        time_left = zone.thermostat.get_time_until_maximum_on(
+            device_status, state[SharedDataColumns.LAST_TURNED_ON.value]
+        )
+        # the predictive mode learns from every update, so it always decides
+        if zone.thermostat.control_mode == ControlModes.PREDICTIVE or needs_decision(
+            state[SharedDataColumns.LAST_TEMPERATURE.value],
+            state[SharedDataColumns.TARGET_TEMPERATURE.value],
+            device_status,
+            time_left,
+        ):
+            return await self.__switch_relay(zone, state)
+        if time_left is None:
+            return None
+        return max(time_left, MINIMUM_WAIT)
+
+    async def __switch_relay(self, zone: Zone, state: dict):
+        """
+        runs the thermostat's decision on the state snapshot and the relay
+        command it leads to on the thread pool, returns the seconds until
+        the next maximum on time check
+        """
+        await self.__offload(zone.thermostat.evaluate, state)
+        return await self.__offload(zone.thermostat.get_wait_timeout)
+
+    async def __offload(self, function, *args):
+        """
+        runs a blocking call on the thread pool
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.__executor, partial(function, *args)
+        )
+
+
+if __name__ == "__main__":
+    from apis.Simulation.SimulationRunner import prepare_database
+
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the database and records out of the way
+        prepare_database()
+        DbInterface.register_shared_backend(InMemoryBackend())
+        db_api = DbInterface()
+        register_sim_zone(db_api, 1, 10.0, 0.02, 0.03)
+        register_sim_zone(db_api, 2, 25.0, 0.02, 0.03)
+        runtime = AsyncRuntime(
+            {1: 17.0, 2: 17.0}, db_interface=db_api, read_interval=0.005, max_workers=2
+        )
+        threads_before = threading.active_count()
+
+        async def run_for(seconds: float):
+            runtime_task = asyncio.create_task(runtime.run())
+            await asyncio.sleep(seconds)
+            runtime_task.cancel()
+            try:
+                await runtime_task
+            except asyncio.CancelledError:
+                pass
+            return runtime_task
+
+        runtime_task = asyncio.run(run_for(0.5))
+
+        ## test that cancelling shuts everything down cleanly
+        assert runtime_task.cancelled(), "AsyncRuntime::run swallowed the cancellation"
+        assert (
+            threading.active_count() == threads_before
+        ), "AsyncRuntime left threads behind"
+
+        ## test that every zone was read, stored and switched on its own
+        for zone_id in (1, 2):
+            zone_interface = db_api.for_zone(zone_id)
+            assert (
+                len(list(zone_interface.get_history())) >= 10
+            ), f"AsyncRuntime didn't store zone {zone_id}'s reads"
+            assert zone_interface.read_column(
+                SharedDataColumns.LAST_TEMPERATURE.value
+            ), f"AsyncRuntime didn't publish zone {zone_id}'s temperature"
+        assert (
+            db_api.for_zone(1).read_column(SharedDataColumns.DEVICE_STATUS.value)
+            == DeviceStatus.ON.value
+        ), "AsyncRuntime didn't turn on the cold zone"
+        assert (
+            db_api.for_zone(2).read_column(SharedDataColumns.DEVICE_STATUS.value)
+            == DeviceStatus.OFF.value
+        ), "AsyncRuntime turned on the warm zone"
+
+        os.chdir(original_dir)
+
+    print("AsyncRuntime class: all unit tests passed")
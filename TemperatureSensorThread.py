@@ -1,15 +1,29 @@
 from threading import Thread
-import time
 import logging
+import time
 
 from apis.DatabaseAccess.DbTables import SharedDataColumns
+from apis.DatabaseAccess.CachedColumns import CachedColumns
+from apis.DatabaseAccess.RollupEngine import RollupEngine
+from apis.DatabaseAccess.SampleCapture import CaptureWriter, get_capture_file
 from apis.Config import DeviceStatus
 from apis.Registrar import Registrar
-from apis.Config import RUNNING_MODE
+from apis.Config import RUNNING_MODE, FILTER_WINDOW, FILTER_PUBLISH_DELTA
+from apis.Config import RAW_HISTORY_STORAGE, HistoryStorages
+from apis.Filters.TemperatureFilter import TemperatureFilter
+from apis.Filters.FilterFactory import create_filter
 from apis.Sensors.TemperatureSensor import TemperatureSensor
+from apis.Clock import Clock
+from apis.Metrics import Metrics, LOOP_ITERATION_SECONDS
 
 DELAY_BETWEEN_READS = 1  # take a read every n seconds
-SAMPLE_SIZE = 5  # take average of n reads before taking any action
+SAMPLE_SIZE = FILTER_WINDOW  # take average of n reads before taking any action
+HISTORY_BATCH_SIZE = 60  # store raw samples in the history n at a time
+SENSOR_LOOP_LABELS: tuple = (("loop", "sensor"),)
+## looked up once, read_sensor runs every second and 86400 times per simulated day
+DEVICE_STATUS_COLUMN = SharedDataColumns.DEVICE_STATUS.value
+LAST_TEMPERATURE_COLUMN = SharedDataColumns.LAST_TEMPERATURE.value
+DEVICE_ON = DeviceStatus.ON.value
 
 logger = logging.getLogger(__name__)
 
@@ -20,15 +34,36 @@ class TemperatureSensorThread(Thread):
     value in a regular cadence
     """
 
-    def __init__(self, db_interface, thread_name="TemperatureSensorThread"):
+    def __init__(
+        self,
+        db_interface,
+        thread_name="TemperatureSensorThread",
+        temperature_filter: TemperatureFilter = None,
+    ):
         Thread.__init__(self)
         self.thermo_stat: TemperatureSensor = Registrar.get_temperature_sensor(
-            RUNNING_MODE
+            RUNNING_MODE, db_interface.zone_id
         )
         self.thread_name = thread_name
         self.keep_me_alive = True
         self.db_interface = db_interface
-        self.temperature_history: list = []
+        if not temperature_filter:
+            self.temperature_filter: TemperatureFilter = create_filter()
+        else:
+            self.temperature_filter = temperature_filter
+        self.__last_published: float = None
+        self.__reads_since_publish: int = 0
+        self.history_buffer: list = []  # raw samples waiting to be stored
+        self.history_batch_size: int = HISTORY_BATCH_SIZE
+        self.rollup_engine = RollupEngine(
+            db_name=db_interface.db_name, zone_id=db_interface.zone_id
+        )
+        self.capture_writer: CaptureWriter = None  # raw samples go to the database
+        if RAW_HISTORY_STORAGE == HistoryStorages.CAPTURE:
+            self.capture_writer = CaptureWriter(get_capture_file(db_interface.zone_id))
+        self.clock: Clock = Registrar.get_clock()
+        ## the device status only changes when the relay switches
+        self.cached_columns = CachedColumns(db_interface, (DEVICE_STATUS_COLUMN,))
 
     def run(self):
         """
@@ -36,22 +71,81 @@ class TemperatureSensorThread(Thread):
         with the running average of n sample data
         """
         while self.keep_me_alive:
-            device_status = self.db_interface.read_column(
-                SharedDataColumns.DEVICE_STATUS.value
-            )
-            current_temp: float = self.thermo_stat.get_temperature(
-                device_status == DeviceStatus.ON.value
-            )
-            self.temperature_history.append(current_temp)
-            if len(self.temperature_history) >= SAMPLE_SIZE:
-                running_avg = round(sum(self.temperature_history) / SAMPLE_SIZE, 2)
-
-                self.db_interface.update_column(
-                    SharedDataColumns.LAST_TEMPERATURE.value, running_avg
-                )
-                self.temperature_history = []  # reset batch
-            logging.info(f"Current Temperature: {current_temp}")
-            time.sleep(DELAY_BETWEEN_READS)
+            self.read_sensor()
+            self.clock.sleep(DELAY_BETWEEN_READS)
+
+        self.flush_history()
+
+    def read_sensor(self):
+        """
+        takes one temperature read, publishes the running average
+        once enough samples are collected
+        """
+        device_status = self.cached_columns.read_column(DEVICE_STATUS_COLUMN)
+        running_avg = self.take_sample(device_status)
+        if len(self.history_buffer) >= self.history_batch_size:
+            self.flush_history()
+        if running_avg is not None:
+            self.db_interface.update_column(LAST_TEMPERATURE_COLUMN, running_avg)
+
+    def take_sample(self, device_status):
+        """
+        takes one temperature read with the device in the given status and
+        buffers it for the history. Returns the filtered temperature if it
+        should be published, otherwise None. Filters that produce a value on
+        every read publish as soon as it moved by FILTER_PUBLISH_DELTA, and
+        at least once every window reads, so a slowly drifting temperature
+        costs no more writes than a batch mean.
+        """
+        started = time.perf_counter()
+        filtered_temp = self.__take_sample(device_status)
+        Metrics.observe(
+            LOOP_ITERATION_SECONDS, time.perf_counter() - started, SENSOR_LOOP_LABELS
+        )
+        return filtered_temp
+
+    def __take_sample(self, device_status):
+        """
+        reads and filters one temperature, see take_sample
+        """
+        current_temp: float = self.thermo_stat.get_temperature(
+            device_status == DEVICE_ON
+        )
+        if current_temp is None:
+            logger.warn("TemperatureSensorThread::take_sample no temperature was read")
+            return None
+        self.history_buffer.append((self.clock.time(), current_temp, device_status))
+        logger.info("Current Temperature: %s", current_temp)
+
+        self.__reads_since_publish += 1
+        filtered_temp = self.temperature_filter.add_sample(current_temp)
+        if filtered_temp is None:
+            return None
+        if (
+            self.__last_published is not None
+            and abs(filtered_temp - self.__last_published) < FILTER_PUBLISH_DELTA
+            and self.__reads_since_publish < self.temperature_filter.window
+        ):
+            return None
+        self.__last_published = filtered_temp
+        self.__reads_since_publish = 0
+        return filtered_temp
+
+    def flush_history(self):
+        """
+        stores the buffered raw samples in the temperature history, or
+        appends them to the capture file, merges them into the aggregates
+        and prunes expired raw samples
+        """
+        if self.history_buffer:
+            if self.capture_writer:
+                self.capture_writer.append(self.history_buffer)
+            else:
+                self.db_interface.insert_temperature_samples(self.history_buffer)
+            self.rollup_engine.add_temperature_samples(self.history_buffer)
+            if not self.capture_writer:
+                self.rollup_engine.prune_raw_history()
+            self.history_buffer = []
 
     def terminate(self):
         """
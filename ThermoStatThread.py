@@ -3,14 +3,36 @@ import time
 import logging
 import datetime
 import os
+from collections import deque
 
 from apis.Relays.PowerControlGateKeeper import PowerControlGateKeeper, States
+from apis.Relays.RelayCommandQueue import RelayCommandQueue
 from apis.DatabaseAccess.DbTables import SharedDataColumns
 from apis.DatabaseAccess.DbInterface import DbInterface
-from apis.Utility import Utility
-from apis.Config import MAXIMUM_ON_TIME
+from apis.DatabaseAccess.CachedColumns import CachedColumns
+from apis.Metrics import Metrics, LOOP_ITERATION_SECONDS
+from apis.Config import MAXIMUM_ON_TIME, DeviceStatus, RELAY_COMMAND_QUEUE
+from apis.Config import CONTROL_MODE, ControlModes, PREDICTION_HORIZON, FILTER_WINDOW
+from apis.Registrar import Registrar
+from apis.ThermalModel import ThermalModel
+from TemperatureSensorThread import DELAY_BETWEEN_READS
 
-DELAY_BETWEEN_READS = 10  # take a read every n seconds
+MINIMUM_WAIT = 1  # never re-check the maximum on time more often than every n seconds
+LATENCY_SAMPLES = 100  # decision latencies kept for reporting
+THERMOSTAT_LOOP_LABELS: tuple = (("loop", "thermostat"),)
+## rates observed this soon after a switch still mix both states in the filter
+SETTLE_TIME = FILTER_WINDOW * DELAY_BETWEEN_READS  # seconds
+
+## looked up once, evaluate runs on every published temperature
+LAST_TEMPERATURE_COLUMN = SharedDataColumns.LAST_TEMPERATURE.value
+TARGET_TEMPERATURE_COLUMN = SharedDataColumns.TARGET_TEMPERATURE.value
+DEVICE_STATUS_COLUMN = SharedDataColumns.DEVICE_STATUS.value
+LAST_TURNED_ON_COLUMN = SharedDataColumns.LAST_TURNED_ON.value
+LAST_TURNED_OFF_COLUMN = SharedDataColumns.LAST_TURNED_OFF.value
+DEVICE_ON = DeviceStatus.ON.value
+
+## a write to any of these columns triggers a new decision
+WATCHED_COLUMNS: tuple = (LAST_TEMPERATURE_COLUMN, TARGET_TEMPERATURE_COLUMN)
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +48,11 @@ class ThermoStatThread(Thread):
         target_temperature: float,
         db_interface: DbInterface,
         thread_name="ThermoStatThread",
+        minimum_on_time=None,
+        cool_down_period=None,
+        maximum_on_time=None,
+        control_mode: ControlModes = None,
+        relay_queue: RelayCommandQueue = None,
     ):
         Thread.__init__(self)
         self.target_temp = target_temperature
@@ -33,69 +60,274 @@ class ThermoStatThread(Thread):
         self.keep_me_alive = True
         self.current_temperature: float = None
         self.db_interface: DbInterface = db_interface
-        self.utility = Utility()
+        self.utility = Registrar.get_utility()
+        self.decision_latencies: deque = deque(maxlen=LATENCY_SAMPLES)  # seconds
+
+        if maximum_on_time is None:
+            self.maximum_on_time = MAXIMUM_ON_TIME
+        else:
+            self.maximum_on_time = maximum_on_time
+
+        if not control_mode:
+            self.control_mode = CONTROL_MODE
+        else:
+            self.control_mode = control_mode
+        self.thermal_model = ThermalModel()
+        if relay_queue:
+            self.relay_queue = relay_queue
+        elif RELAY_COMMAND_QUEUE:
+            self.relay_queue = RelayCommandQueue.get_queue()
+        else:
+            self.relay_queue = None  # the relay is switched right away
+        self.__observed_version: int = -1  # temperature update last fed to the model
+        self.__observed_temp: float = None
+        self.__observed_time: float = None
 
         self.__gate_keeper: PowerControlGateKeeper = PowerControlGateKeeper(
-            db_interface=db_interface
+            db_interface=db_interface,
+            minimum_on_time=minimum_on_time,
+            cool_down_period=cool_down_period,
         )
-        self.db_interface.update_column(
-            SharedDataColumns.TARGET_TEMPERATURE.value, self.target_temp
+        self.db_interface.update_column(TARGET_TEMPERATURE_COLUMN, self.target_temp)
+        ## followed between decisions to time the next wake up
+        self.cached_columns = CachedColumns(
+            db_interface,
+            (
+                DEVICE_STATUS_COLUMN,
+                LAST_TURNED_ON_COLUMN,
+            ),
         )
 
     def run(self):
         """
-        main thread that runs continuously. Read current temperature
-        at regular intervals, take running average and trigger relay.
+        main thread that runs continuously. Wakes up whenever the current
+        or target temperature is updated and triggers the relay. Otherwise
+        only wakes up to enforce the device's maximum on time.
         """
+        ## the first decision takes in the updates made so far, the
+        ## target temperature written by __init__ doesn't wake it up again
+        last_version = self.db_interface.get_update_version(WATCHED_COLUMNS)
         while self.keep_me_alive:
-            (
-                self.current_temp,
-                self.target_temp,
-            ) = self.db_interface.read_multiple_columns(
-                (
-                    SharedDataColumns.LAST_TEMPERATURE.value,
-                    SharedDataColumns.TARGET_TEMPERATURE.value,
-                )
+            self.evaluate()
+            last_version = self.db_interface.wait_for_update(
+                WATCHED_COLUMNS, last_version, timeout=self.get_wait_timeout()
             )
-            status = self.__check_device_on_time()
-            if status != States.TURNED_OFF:
-                if self.current_temp:
-                    if self.current_temp <= self.target_temp:
-                        status = self.__gate_keeper.turn_on(
-                            effective_temperature=self.current_temp,
-                            reason="Current Temperature is below target temperature",
-                        )
-                    else:
-                        status = self.__gate_keeper.turn_off(
-                            effective_temperature=self.current_temp,
-                            reason="Current Temperature is above target temperature",
-                        )
-
-            time.sleep(DELAY_BETWEEN_READS)
+
+    def evaluate(self, state: dict = None):
+        """
+        reads the device state once, unless a snapshot is given, and
+        triggers the relay if needed. Every check is made on that snapshot.
+        """
+        started = time.perf_counter()
+        if state is None:
+            state = self.db_interface.read_device_state()
+        self.current_temp = state[LAST_TEMPERATURE_COLUMN]
+        self.target_temp = state[TARGET_TEMPERATURE_COLUMN]
+        if self.control_mode == ControlModes.PREDICTIVE:
+            self.__observe_temperature(state)
+        status = self.__check_device_on_time(state)
+        if status not in (States.TURNED_OFF, States.STATE_CHANGED):
+            if self.current_temp:
+                effective_temp, subject = self.__get_effective_temperature(state)
+                if self.relay_queue:
+                    status = self.__queue_command(effective_temp, subject, state)
+                elif effective_temp <= self.target_temp:
+                    status = self.__gate_keeper.turn_on(
+                        effective_temperature=effective_temp,
+                        reason=f"{subject} Temperature is below target temperature",
+                        state=state,
+                    )
+                else:
+                    status = self.__gate_keeper.turn_off(
+                        effective_temperature=effective_temp,
+                        reason=f"{subject} Temperature is above target temperature",
+                        state=state,
+                    )
+                self.__record_decision_latency(status)
+        Metrics.observe(
+            LOOP_ITERATION_SECONDS,
+            time.perf_counter() - started,
+            THERMOSTAT_LOOP_LABELS,
+        )
+        return status
+
+    def __queue_command(self, effective_temp: float, subject: str, state: dict):
+        """
+        hands the temperature rule's command to the relay command queue,
+        which drops it if the snapshot's device status is already right
+        """
+        turn_on = effective_temp <= self.target_temp
+        side = "below" if turn_on else "above"
+        return self.relay_queue.submit(
+            self.__gate_keeper,
+            turn_on,
+            effective_temperature=effective_temp,
+            reason=f"{subject} Temperature is {side} target temperature",
+            device_status=state[DEVICE_STATUS_COLUMN],
+        )
 
     def terminate(self):
         """
         terminates the thread, inherited from base class
         """
         self.keep_me_alive = False
+        self.db_interface.wake_waiters()
         logging.warn(f"{self.thread_name} is terminated")
 
-    def __check_device_on_time(self):
+    def get_decision_latency_stats(self):
         """
-        checks if device on time has exceeded the max threshold
+        returns min, average and max latency in milliseconds between a
+        temperature update and the relay command it caused
+        """
+        if not self.decision_latencies:
+            return None
+        latencies = [latency * 1000 for latency in self.decision_latencies]
+        return {
+            "count": len(latencies),
+            "min_ms": round(min(latencies), 3),
+            "avg_ms": round(sum(latencies) / len(latencies), 3),
+            "max_ms": round(max(latencies), 3),
+        }
+
+    def __record_decision_latency(self, status):
+        """
+        measures how long ago the temperature that caused a relay command
+        was written
+        """
+        if status not in (States.TURNED_ON, States.TURNED_OFF):
+            return
+        update_times = [
+            self.db_interface.get_last_update_time(column) for column in WATCHED_COLUMNS
+        ]
+        update_times = [update_time for update_time in update_times if update_time]
+        if not update_times:
+            return
+        latency = time.monotonic() - max(update_times)
+        self.decision_latencies.append(latency)
+        logger.info(
+            f"ThermoStatThread::run decision latency: {round(latency * 1000, 3)} ms"
+        )
+
+    def get_wait_timeout(self):
+        """
+        returns how many seconds to wait before re-checking the device's
+        maximum on time, or None if the device is off. In predictive mode,
+        also wakes up for the switch the thermal model expects.
         """
-        last_turned_on: str = self.db_interface.read_column(
-            SharedDataColumns.LAST_TURNED_ON.value
+        device_status, last_turned_on = self.cached_columns.read_multiple_columns(
+            (
+                DEVICE_STATUS_COLUMN,
+                LAST_TURNED_ON_COLUMN,
+            )
+        )
+        time_left = self.get_time_until_maximum_on(device_status, last_turned_on)
+        if self.control_mode == ControlModes.PREDICTIVE:
+            time_to_switch = self.get_time_until_predicted_switch(device_status)
+            if time_to_switch is not None and (
+                time_left is None or time_to_switch < time_left
+            ):
+                time_left = time_to_switch
+        if time_left is None:
+            return None
+        return max(time_left, MINIMUM_WAIT)
+
+    def get_time_until_predicted_switch(self, device_status):
+        """
+        returns in how many seconds the predicted temperature crosses the
+        target, or None if the model can't tell yet, the temperature isn't
+        heading there or the crossing is already due
+        """
+        heater_on = device_status == DEVICE_ON
+        if not self.current_temp or not self.thermal_model.is_ready(heater_on):
+            return None
+        time_to_reach = self.thermal_model.get_time_to_reach(
+            self.current_temp, self.target_temp, heater_on
         )
-        if last_turned_on:
+        if time_to_reach is None:
+            return None
+        elapsed = Registrar.get_clock().time() - self.__observed_time
+        time_left = time_to_reach - elapsed - PREDICTION_HORIZON
+        if time_left <= 0:
+            return None
+        return time_left
+
+    def get_time_until_maximum_on(self, device_status, last_turned_on):
+        """
+        returns how many seconds are left until a device with the given
+        status and last turn on time reaches its maximum on time, negative
+        once it's past it, or None if the device is off
+        """
+        if device_status != DEVICE_ON or last_turned_on is None:
+            return None
+        return (self.maximum_on_time - self.utility.get_time_delta(last_turned_on)) * 60
+
+    def __observe_temperature(self, state: dict):
+        """
+        feeds the rate of change since the previous published temperature
+        to the thermal model, unless the heater switched in between
+        """
+        version = self.db_interface.get_update_version((LAST_TEMPERATURE_COLUMN,))
+        if version == self.__observed_version or self.current_temp is None:
+            return
+        self.__observed_version = version
+        now = Registrar.get_clock().time()
+        previous_temp, previous_time = self.__observed_temp, self.__observed_time
+        self.__observed_temp, self.__observed_time = self.current_temp, now
+        if previous_temp is None or now <= previous_time:
+            return
+
+        switch_times = [
+            switch_time
+            for switch_time in (
+                state[LAST_TURNED_ON_COLUMN],
+                state[LAST_TURNED_OFF_COLUMN],
+            )
+            if switch_time is not None
+        ]
+        if switch_times and max(switch_times) > previous_time - SETTLE_TIME:
+            return
+        self.thermal_model.update(
+            (self.current_temp - previous_temp) / (now - previous_time),
+            state[DEVICE_STATUS_COLUMN] == DEVICE_ON,
+        )
+
+    def __get_effective_temperature(self, state: dict):
+        """
+        returns the temperature the decision is made on, and what it is:
+        the current one, or in predictive mode the one the thermal model
+        expects PREDICTION_HORIZON seconds from now, once it learned the rate
+        """
+        heater_on = state[DEVICE_STATUS_COLUMN] == DEVICE_ON
+        if (
+            self.control_mode != ControlModes.PREDICTIVE
+            or self.__observed_time is None
+            or not self.thermal_model.is_ready(heater_on)
+        ):
+            return self.current_temp, "Current"
+        elapsed = Registrar.get_clock().time() - self.__observed_time
+        predicted_temp = self.thermal_model.predict(
+            self.current_temp, heater_on, elapsed + PREDICTION_HORIZON
+        )
+        return round(predicted_temp, 2), "Predicted"
+
+    def __check_device_on_time(self, state: dict):
+        """
+        checks if device on time has exceeded the max threshold
+        """
+        last_turned_on: float = state[LAST_TURNED_ON_COLUMN]
+        if last_turned_on is not None:
             time_difference = self.utility.get_time_delta(last_turned_on)
-            if time_difference >= MAXIMUM_ON_TIME:
+            if time_difference >= self.maximum_on_time:
                 logger.warn(
                     "ThermoStatThread::__check_heater_on_time Device's maximum on time has exceeded"
                 )
+                if self.relay_queue:
+                    ## the safety rule isn't queued, nor overridden by a queued command
+                    self.relay_queue.cancel(self.db_interface.zone_id)
                 status = self.__gate_keeper.turn_off(
                     effective_temperature=self.current_temp,
                     reason="Device's maximum on time has exceeded",
+                    state=state,
                 )
                 return status
 
@@ -0,0 +1,378 @@
+from threading import Thread
+from functools import partial
+import logging
+import os
+import tempfile
+import time
+
+from apis.Clock import Clock, SimulatedClock
+from apis.Config import RUNNING_MODE, DeviceStatus, ControlModes
+from apis.DatabaseAccess.DbTables import SharedDataColumns
+from apis.DatabaseAccess.DbInterface import DbInterface, DEVICE_STATE_COLUMNS
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+from apis.DatabaseAccess.RollupEngine import RollupEngine
+from apis.Registrar import Registrar
+from apis.Relays.RelayControllerSim import RelayControllerSim
+from apis.Sensors.TemperatureSensorSim import TemperatureSensorSim
+from apis.Simulation.EventScheduler import EventScheduler
+from TemperatureSensorThread import (
+    TemperatureSensorThread,
+    DELAY_BETWEEN_READS,
+    HISTORY_BATCH_SIZE,
+)
+from ThermoStatThread import ThermoStatThread, WATCHED_COLUMNS, MINIMUM_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class Zone:
+    """
+    Everything the scheduler keeps for one zone. The sensor and thermostat
+    threads are never started, the scheduler calls into them instead.
+    """
+
+    def __init__(self, zone_id, db_interface: DbInterface, target_temperature: float):
+        self.zone_id = zone_id
+        self.db_interface: DbInterface = db_interface
+        self.sensor: TemperatureSensorThread = TemperatureSensorThread(
+            db_interface=db_interface, thread_name=f"TemperatureSensorThread-{zone_id}"
+        )
+        self.thermostat: ThermoStatThread = ThermoStatThread(
+            target_temperature=target_temperature,
+            db_interface=db_interface,
+            thread_name=f"ThermoStatThread-{zone_id}",
+        )
+        self.last_version: int = -1  # last update seen by the thermostat
+        self.timeout_event = None  # pending maximum on time check
+
+
+class ZoneSchedulerThread(Thread):
+    """
+    CPU thread that services every zone from a single event scheduler,
+    instead of a sensor and a thermostat thread per zone. Each zone has
+    its own read timer and maximum on time timer, zones due on the same
+    tick share one write of the new temperatures, one read of the decision
+    inputs and one history insert, the device statuses are followed from
+    the sensors' cached columns. The wake up rules are the same the two
+    threads use.
+    """
+
+    def __init__(
+        self,
+        target_temperatures: dict,
+        db_interface: DbInterface,
+        thread_name="ZoneSchedulerThread",
+    ):
+        Thread.__init__(self)
+        self.thread_name = thread_name
+        self.keep_me_alive = True
+        self.db_interface: DbInterface = db_interface
+        self.clock: Clock = Registrar.get_clock()
+        self.scheduler = EventScheduler(self.clock)
+        self.rollup_engine = RollupEngine(db_name=db_interface.db_name)
+        self.zones: dict = dict()  # zone id -> Zone
+
+        self.__due_decisions: dict = dict()  # zones whose timer fired this tick
+        self.__due_reads: dict = dict()  # zones whose sensor is read this tick
+
+        self.db_interface.add_zones(target_temperatures.keys())
+        for zone_id, target_temperature in target_temperatures.items():
+            self.add_zone(zone_id, target_temperature)
+
+    def add_zone(self, zone_id, target_temperature: float):
+        """
+        starts servicing a zone, its sensor and relay controller
+        must already be registered
+        """
+        self.db_interface.add_zones((zone_id,))
+        zone = Zone(zone_id, self.db_interface.for_zone(zone_id), target_temperature)
+        self.zones[zone_id] = zone
+        self.scheduler.schedule_at(
+            self.clock.time(), partial(self.__due_decisions.__setitem__, zone_id, zone)
+        )
+        self.scheduler.schedule_every(
+            DELAY_BETWEEN_READS, partial(self.__due_reads.__setitem__, zone_id, zone)
+        )
+
+    def run(self):
+        """
+        main thread that runs continuously, sleeps until the next timer
+        of any zone is due and services every zone due at that time
+        """
+        while self.keep_me_alive:
+            if not self.run_next_tick():
+                ## no zone yet, check again after a read's delay instead of spinning
+                self.clock.sleep(DELAY_BETWEEN_READS)
+        self.flush_history()
+
+    def run_until(self, end_time: float):
+        """
+        services every tick due up to and including end_time,
+        meant for a simulated clock
+        """
+        next_time = self.scheduler.get_next_event_time()
+        while next_time is not None and next_time <= end_time:
+            self.run_next_tick()
+            next_time = self.scheduler.get_next_event_time()
+        self.clock.sleep(max(end_time - self.clock.time(), 0))
+        self.flush_history()
+
+    def run_next_tick(self):
+        """
+        waits for the earliest timer, then services every zone due by then:
+        decisions for expired timers first, then the sensor reads and the
+        decisions they trigger
+        """
+        next_time = self.scheduler.get_next_event_time()
+        if next_time is None:
+            return False
+        delay = next_time - self.clock.time()
+        if delay > 0:
+            self.clock.sleep(delay)
+        self.scheduler.run_due(next_time)
+
+        if self.__due_decisions:
+            due_decisions = list(self.__due_decisions.values())
+            self.__due_decisions.clear()
+            self.__make_decisions(due_decisions)
+        if self.__due_reads:
+            due_reads = list(self.__due_reads.values())
+            self.__due_reads.clear()
+            self.__make_decisions(self.__read_sensors(due_reads))
+        return True
+
+    def flush_history(self):
+        """
+        stores the buffered samples of every zone
+        """
+        self.__flush_history(list(self.zones.values()))
+
+    def terminate(self):
+        """
+        terminates the thread, inherited from base class
+        """
+        self.keep_me_alive = False
+        logging.info(f"{self.thread_name} is terminated")
+
+    def __read_sensors(self, zones: list):
+        """
+        takes one read in every zone, publishes the new running averages
+        and returns the zones whose thermostat has to wake up
+        """
+        new_averages: dict = dict()
+        for zone in zones:
+            device_status = zone.sensor.cached_columns.read_column(
+                SharedDataColumns.DEVICE_STATUS.value
+            )
+            running_avg = zone.sensor.take_sample(device_status)
+            if running_avg is not None:
+                new_averages[zone.zone_id] = (running_avg,)
+
+        full_zones = [
+            zone
+            for zone in zones
+            if len(zone.sensor.history_buffer) >= HISTORY_BATCH_SIZE
+        ]
+        if full_zones:
+            self.__flush_history(full_zones)
+        if new_averages:
+            self.db_interface.update_zones(
+                (SharedDataColumns.LAST_TEMPERATURE.value,), new_averages
+            )
+
+        return [
+            zone
+            for zone in zones
+            if zone.db_interface.get_update_version(WATCHED_COLUMNS) > zone.last_version
+        ]
+
+    def __make_decisions(self, zones: list):
+        """
+        runs the thermostat of every zone whose relay may have to change and
+        schedules the next maximum on time check of every zone that is on
+        """
+        if not zones:
+            return
+        for zone in zones:
+            zone.last_version = zone.db_interface.get_update_version(WATCHED_COLUMNS)
+        snapshot: dict = self.db_interface.read_device_states(
+            self.__get_zone_ids(zones)
+        )
+
+        for zone in zones:
+            state = snapshot.get(zone.zone_id, dict.fromkeys(DEVICE_STATE_COLUMNS))
+            device_status = state[SharedDataColumns.DEVICE_STATUS.value]
+            time_left = zone.thermostat.get_time_until_maximum_on(
+                device_status, state[SharedDataColumns.LAST_TURNED_ON.value]
+            )
+            # the predictive mode learns from every update, so it always decides
+            if (
+                zone.thermostat.control_mode == ControlModes.PREDICTIVE
+                or needs_decision(
+                    state[SharedDataColumns.LAST_TEMPERATURE.value],
+                    state[SharedDataColumns.TARGET_TEMPERATURE.value],
+                    device_status,
+                    time_left,
+                )
+            ):
+                zone.thermostat.evaluate(state)
+                timeout = zone.thermostat.get_wait_timeout()
+            elif time_left is not None:
+                timeout = max(time_left, MINIMUM_WAIT)
+            else:
+                timeout = None
+
+            if zone.timeout_event:
+                self.scheduler.cancel(zone.timeout_event)
+                zone.timeout_event = None
+            if timeout is not None:
+                zone.timeout_event = self.scheduler.schedule_at(
+                    self.clock.time() + timeout,
+                    partial(self.__due_decisions.__setitem__, zone.zone_id, zone),
+                )
+
+    def __flush_history(self, zones: list):
+        """
+        stores the buffered samples of the given zones with one insert,
+        zones that capture their raw samples append them to their file
+        """
+        samples_by_zone: dict = {
+            zone.zone_id: zone.sensor.history_buffer
+            for zone in zones
+            if zone.sensor.history_buffer
+        }
+        if not samples_by_zone:
+            return
+        stored_zones: dict = dict()  # zone id -> samples stored in the database
+        for zone in zones:
+            if not zone.sensor.history_buffer:
+                continue
+            if zone.sensor.capture_writer:
+                zone.sensor.capture_writer.append(zone.sensor.history_buffer)
+            else:
+                stored_zones[zone.zone_id] = zone.sensor.history_buffer
+        if stored_zones:
+            self.db_interface.insert_zone_temperature_samples(stored_zones)
+        self.rollup_engine.add_zone_temperature_samples(samples_by_zone)
+        if stored_zones:
+            self.rollup_engine.prune_zone_raw_history(stored_zones.keys())
+        for zone in zones:
+            zone.sensor.history_buffer = []
+
+    @staticmethod
+    def __get_zone_ids(zones: list):
+        return tuple([zone.zone_id for zone in zones])
+
+
+def needs_decision(current_temp, target_temp, device_status, time_left):
+    """
+    tells whether ThermoStatThread::evaluate could change the relay of a
+    zone in the given state, every other outcome is already on or already off
+    """
+    if device_status == DeviceStatus.ON.value:
+        if time_left is not None and time_left <= 0:
+            return True  # maximum on time reached, evaluate turns it off
+        return bool(current_temp) and current_temp > target_temp
+    return bool(current_temp) and current_temp <= target_temp
+
+
+def register_sim_zone(
+    db_interface: DbInterface, zone_id, start_temp, drop_rate, rise_rate
+):
+    """
+    registers a simulated sensor with the given parameters
+    and a simulated relay controller for a zone
+    """
+    sensor = TemperatureSensorSim()
+    sensor.start_temp, sensor.drop_rate, sensor.rise_rate = (
+        start_temp,
+        drop_rate,
+        rise_rate,
+    )
+    Registrar.register_temperature_sensor(sensor, RUNNING_MODE, zone_id)
+    Registrar.register_relay_controllers(
+        RelayControllerSim(db_interface=db_interface.for_zone(zone_id)),
+        RUNNING_MODE,
+        zone_id,
+    )
+
+
+if __name__ == "__main__":
+    from apis.Simulation.SimulationRunner import prepare_database
+    from apis.Simulation.BatchSimulator import BatchSimulator
+
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the simulation's database and records out of the way
+        prepare_database()
+        start_time = 1000.0
+        Registrar.register_clock(SimulatedClock(start_time=start_time))
+        DbInterface.register_shared_backend(InMemoryBackend())
+        db_api = DbInterface()
+
+        ## test that every zone behaves exactly like a room of its own
+        zone_parameters = {
+            1: (15.0, 0.02, 0.03, 17.0),
+            2: (20.0, 0.04, 0.01, 18.5),
+            3: (10.0, 0.01, 0.05, 12.0),
+        }
+        for zone_id, (start_temp, drop_rate, rise_rate, _) in zone_parameters.items():
+            register_sim_zone(db_api, zone_id, start_temp, drop_rate, rise_rate)
+        zone_scheduler = ZoneSchedulerThread(
+            {zone_id: parameters[3] for zone_id, parameters in zone_parameters.items()},
+            db_interface=db_api,
+        )
+        duration = 2 * 60 * 60
+        zone_scheduler.run_until(start_time + duration)
+
+        reference = BatchSimulator(*zip(*zone_parameters.values())).run(
+            duration, start_time=start_time, record_history=True
+        )
+        for index, zone_id in enumerate(zone_parameters):
+            history = list(db_api.for_zone(zone_id).get_history())
+            assert [sample[1] for sample in history] == list(
+                reference["temperatures"][:, index]
+            ), f"ZoneSchedulerThread zone {zone_id} read different temperatures"
+            assert [sample[2] == DeviceStatus.ON.value for sample in history] == list(
+                reference["statuses"][:, index]
+            ), f"ZoneSchedulerThread zone {zone_id} switched its relay differently"
+        assert (
+            min(reference["cycles"]) > 1
+        ), "ZoneSchedulerThread test scenario didn't cycle every zone"
+
+        ## test that hundreds of zones run much faster than real time on one core
+        zone_count = 200
+        for zone_id in range(10, 10 + zone_count):
+            register_sim_zone(db_api, zone_id, 15.0 + zone_id % 7, 0.02, 0.03)
+            zone_scheduler.add_zone(zone_id, 17.0)
+        simulated_seconds = 5 * 60
+        started = time.perf_counter()
+        zone_scheduler.run_until(Registrar.get_clock().time() + simulated_seconds)
+        elapsed = time.perf_counter() - started
+        assert (
+            elapsed < simulated_seconds / 10
+        ), f"ZoneSchedulerThread is too slow for {zone_count} zones: {elapsed}s"
+
+        ## test that a scheduler without zones sleeps between ticks
+        idle_scheduler = ZoneSchedulerThread(dict(), db_interface=db_api)
+        idle_scheduler.clock = SimulatedClock(start_time=0)
+        tick_times: list = []
+        run_next_tick = idle_scheduler.run_next_tick
+
+        def run_counted_tick():
+            tick_times.append(idle_scheduler.clock.time())
+            idle_scheduler.keep_me_alive = len(tick_times) < 3
+            return run_next_tick()
+
+        idle_scheduler.run_next_tick = run_counted_tick
+        idle_scheduler.run()
+        assert tick_times == [
+            0,
+            DELAY_BETWEEN_READS,
+            2 * DELAY_BETWEEN_READS,
+        ], "ZoneSchedulerThread spun without any zone"
+
+        os.chdir(original_dir)
+
+    print("ZoneSchedulerThread class: all unit tests passed")
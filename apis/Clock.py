@@ -0,0 +1,70 @@
+import datetime
+import time
+
+
+class Clock:
+    """
+    Source of the current time for the whole application.
+    Reads the system clock, see SimulatedClock for the virtual one.
+    """
+
+    def __init__(self):
+        pass
+
+    def now(self):
+        """
+        returns the current local time as a datetime
+        """
+        return datetime.datetime.now()
+
+    def time(self):
+        """
+        returns the current time in seconds since epoch
+        """
+        return time.time()
+
+    def sleep(self, seconds: float):
+        """
+        blocks the calling thread for the given number of seconds
+        """
+        time.sleep(seconds)
+
+
+class SimulatedClock(Clock):
+    """
+    Virtual clock that only moves when it is told to, used to run
+    the simulation faster than real time
+    """
+
+    def __init__(self, start_time: float = None):
+        if start_time is None:
+            start_time = time.time()
+        self.__current_time: float = start_time
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.__current_time)
+
+    def time(self):
+        return self.__current_time
+
+    def sleep(self, seconds: float):
+        """
+        sleeping on a virtual clock just moves it forward
+        """
+        self.advance(seconds)
+
+    def advance(self, seconds: float):
+        """
+        moves the clock forward by the given number of seconds
+        """
+        if seconds < 0:
+            raise ValueError("SimulatedClock::advance can't move back in time")
+        self.__current_time += seconds
+
+    def advance_to(self, new_time: float):
+        """
+        moves the clock forward to the given time in seconds since epoch
+        """
+        if new_time < self.__current_time:
+            raise ValueError("SimulatedClock::advance_to can't move back in time")
+        self.__current_time = new_time
@@ -5,8 +5,10 @@ from enum import Enum
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 grand_parent_dir = os.path.dirname(parent_dir)
-sys.path.append(parent_dir)
-sys.path.append(grand_parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
 
 from apis.Registrar import RunningModes
 
@@ -15,6 +17,92 @@ RUNNING_MODE = RunningModes.SIM  ## the mode we are running the application in
 MINIMUM_ON_TIME = 3  # minutes
 COOL_DOWN_PERIOD = 3  # minutes
 MAXIMUM_ON_TIME = 15  # minutes
+## thermostats queue relay commands to one worker that merges them
+RELAY_COMMAND_QUEUE = False
+## seconds a queued relay command waits to be replaced by a newer one
+RELAY_COMMAND_DELAY = 0.5
+
+
+class ControlModes(Enum):
+    THRESHOLD = "threshold"  # switch once the measured temperature crosses the target
+    ## switch ahead of the crossing a learned thermal model predicts
+    PREDICTIVE = "predictive"
+
+
+## how the thermostat decides to switch the device
+CONTROL_MODE = ControlModes.THRESHOLD
+## seconds ahead the predicted temperature is compared with the target
+PREDICTION_HORIZON = 5
+## weight older rate observations keep at every model update
+MODEL_FORGETTING_FACTOR = 0.99
+MODEL_WARMUP = 3  # rate observations with the heater off and on before predicting
+
+
+class StorageBackends(Enum):
+    MEMORY = "memory"
+    SQLITE = "sqlite"
+
+
+SHARED_DATA_BACKEND = StorageBackends.MEMORY  ## where threads exchange shared data
+MIRROR_SHARED_DATA = True  ## persist in-memory shared data to the database
+## threads the asyncio runtime offloads blocking storage and hardware calls to
+ASYNC_IO_WORKERS = 4
+## raw samples older than this are pruned, aggregates are kept
+RAW_HISTORY_RETENTION_DAYS = 30
+STATE_TRANSITION_RETENTION_DAYS = 30  # state transitions older than this are pruned
+## state transitions waiting to be stored before new ones are dropped
+TRANSITION_QUEUE_SIZE = 1000
+## seconds a relay waits for room in a full transition queue before dropping
+TRANSITION_QUEUE_TIMEOUT = 0.5
+TRANSITION_BATCH_SIZE = 50  # state transitions stored per transaction at most
+## seconds a state transition waits for a batch to fill up
+TRANSITION_FLUSH_INTERVAL = 1.0
+METRICS_ENABLED = True  ## serve the loop, database and gatekeeper metrics over HTTP
+METRICS_HOST = "127.0.0.1"  # interface the Prometheus metrics endpoint listens on
+METRICS_PORT = 9108  # port of the Prometheus metrics endpoint, GET /metrics
+## serve the shared data, transitions and history as JSON over HTTP
+STATUS_API_ENABLED = True
+STATUS_API_HOST = "127.0.0.1"  # interface the status API listens on
+STATUS_API_PORT = 9109  # port of the status API, GET /status, /transitions and /history
+STATUS_TRANSITIONS = 20  # latest state transitions served by the status API
+## minutes of raw temperature history served by the status API
+STATUS_HISTORY_MINUTES = 60
+## seconds from launch until every thread is wired up, python3 app.py --startup-time
+STARTUP_TIME_BUDGET = 2.0
+
+
+class HistoryStorages(Enum):
+    SQLITE = "sqlite"  # a TemperatureHistory row per raw sample
+    CAPTURE = "capture"  # fixed size records appended to a capture file per zone
+
+
+## where raw samples are kept, aggregates always go to the database
+RAW_HISTORY_STORAGE = HistoryStorages.SQLITE
+CAPTURE_DIRECTORY = "captures"  # capture files of the raw samples, one per zone
+
+
+class TemperatureFilters(Enum):
+    BATCH_MEAN = "batch_mean"  # mean of every FILTER_WINDOW reads
+    MOVING_AVERAGE = "moving_average"  # mean of the last FILTER_WINDOW reads
+    EWMA = "ewma"  # exponentially weighted mean spanning FILTER_WINDOW reads
+    RUNNING_MEDIAN = "running_median"  # median of the last FILTER_WINDOW reads
+
+
+TEMPERATURE_FILTER = TemperatureFilters.BATCH_MEAN  ## how sensor reads are smoothed
+FILTER_WINDOW = 5  # reads
+## celsius, a filtered temperature is published early once it moved this much
+FILTER_PUBLISH_DELTA = 0.1
+
+
+class SensorFusions(Enum):
+    MEAN = "mean"  # mean of the fresh reads
+    MEDIAN = "median"  # median of the fresh reads, outvotes a single faulty sensor
+    PRIMARY = "primary"  # the first sensor's read, the next fresh one while it is stale
+
+
+SENSOR_FUSION = SensorFusions.MEDIAN  ## how the reads of a sensor group are combined
+## seconds a sensor group waits for its reads, under the delay between reads
+SENSOR_READ_DEADLINE = 0.9
 
 
 class DeviceStatus(Enum):
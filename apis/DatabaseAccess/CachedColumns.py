@@ -0,0 +1,103 @@
+import logging
+import os
+import sys
+import threading
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.DatabaseAccess.DbInterface import DbInterface
+
+logger = logging.getLogger(__name__)
+
+
+class CachedColumns:
+    """
+    Local copy of some of a zone's SharedData columns, read from the
+    database once and then kept current by DbInterface's change events, so
+    reading them queries nothing. Has the read methods of DbInterface, a
+    consumer can be handed either.
+    """
+
+    def __init__(self, db_interface: DbInterface, column_names: tuple):
+        self.db_interface = db_interface
+        self.column_names: tuple = tuple(column_names)
+        self.__values: dict = dict()  # column name -> value
+        self.__lock = threading.Lock()
+
+        for column_name in self.column_names:
+            value = db_interface.subscribe(column_name, self.__on_change)
+            with self.__lock:
+                ## a change may already have been dispatched
+                self.__values.setdefault(column_name, value)
+
+    def read_column(self, column_name):
+        """
+        returns the cached value of a column
+        """
+        with self.__lock:
+            return self.__values[column_name]
+
+    def read_multiple_columns(self, column_names: tuple):
+        """
+        returns the cached values of the columns as a tuple
+        """
+        with self.__lock:
+            return tuple([self.__values[column_name] for column_name in column_names])
+
+    def close(self):
+        """
+        stops following the changes
+        """
+        for column_name in self.column_names:
+            self.db_interface.unsubscribe(column_name, self.__on_change)
+
+    def __on_change(self, column_name, value):
+        with self.__lock:
+            self.__values[column_name] = value
+
+
+if __name__ == "__main__":
+    from apis.DatabaseAccess.DbTables import SharedDataColumns
+    from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+
+    db_api = DbInterface(backend=InMemoryBackend())
+    db_api.update_multiple_columns(
+        (
+            SharedDataColumns.DEVICE_STATUS.value,
+            SharedDataColumns.LAST_TURNED_ON.value,
+        ),
+        ("OFF", None),
+    )
+    columns = (
+        SharedDataColumns.DEVICE_STATUS.value,
+        SharedDataColumns.LAST_TURNED_ON.value,
+    )
+    cached_columns = CachedColumns(db_api, columns)
+
+    ## test that the values are read once and then follow the writes
+    assert cached_columns.read_column(SharedDataColumns.DEVICE_STATUS.value) == "OFF"
+    db_api.for_zone(db_api.zone_id).compare_and_swap(
+        SharedDataColumns.DEVICE_STATUS.value, "OFF", columns, ("ON", 1000.0)
+    )
+    assert cached_columns.read_multiple_columns(columns) == (
+        "ON",
+        1000.0,
+    ), "CachedColumns missed a write of another interface to the zone"
+
+    ## test that another zone's writes aren't followed
+    db_api.add_zones((2,))
+    db_api.for_zone(2).update_column(SharedDataColumns.DEVICE_STATUS.value, "OFF")
+    assert cached_columns.read_column(SharedDataColumns.DEVICE_STATUS.value) == "ON"
+
+    ## test that it stops following once closed
+    cached_columns.close()
+    db_api.update_column(SharedDataColumns.DEVICE_STATUS.value, "OFF")
+    assert cached_columns.read_column(SharedDataColumns.DEVICE_STATUS.value) == "ON"
+
+    print("CachedColumns class: all unit tests passed")
@@ -0,0 +1,164 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeNotifier:
+    """
+    Lets threads block until one of the shared data columns is written.
+    Every write bumps a global sequence number and stamps the written
+    columns with it, so a waiter only needs to remember the last
+    sequence number it has seen. Subscribers of a column are called with
+    its new value only when a write actually changes it. Writers hold
+    write_lock from their database write until it is published, so the
+    changes are queued and dispatched in the order the writes were applied.
+    """
+
+    __notifiers: dict = dict()  # one notifier per storage backend
+    __notifiers_lock = threading.Lock()
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__sequence: int = 0
+        self.__column_versions: dict = dict()  # column name -> sequence number
+        self.__publish_times: dict = dict()  # column name -> time.monotonic()
+        self.__wake_generation: int = 0  # bumped by wake_all
+        self.__values: dict = dict()  # column name -> last value written
+        self.__subscribers: dict = dict()  # column name -> [callback]
+        ## (callback, column name, new value) in the order published
+        self.__pending: collections.deque = collections.deque()
+        ## a callback may write again from the same thread
+        self.__dispatch_lock = threading.RLock()
+        self.write_lock = threading.Lock()
+
+    @staticmethod
+    def get_notifier(key):
+        """
+        returns the notifier shared by everyone writing through the given key
+        """
+        with ChangeNotifier.__notifiers_lock:
+            if key not in ChangeNotifier.__notifiers:
+                ChangeNotifier.__notifiers[key] = ChangeNotifier()
+            return ChangeNotifier.__notifiers[key]
+
+    def publish(self, column_names: tuple, values: tuple = None):
+        """
+        marks the given columns as written and wakes up every waiter. Given
+        the values written, queues a change for the subscribers of every
+        column they changed, dispatch calls them. Called holding write_lock.
+        """
+        published_at = time.monotonic()
+        with self.__condition:
+            self.__sequence += 1
+            for column_name in column_names:
+                self.__column_versions[column_name] = self.__sequence
+                self.__publish_times[column_name] = published_at
+            self.__condition.notify_all()
+            if values is None:
+                return
+            for column_name, value in zip(column_names, values):
+                if column_name in self.__values and self.__values[column_name] == value:
+                    continue
+                self.__values[column_name] = value
+                for callback in self.__subscribers.get(column_name, []):
+                    self.__pending.append((callback, column_name, value))
+
+    def dispatch(self):
+        """
+        calls the subscribers of every queued change, oldest first. Called
+        after releasing write_lock, a callback may read or write the shared data
+        """
+        with self.__dispatch_lock:
+            while True:
+                with self.__condition:
+                    if not self.__pending:
+                        return
+                    callback, column_name, value = self.__pending.popleft()
+                try:
+                    callback(column_name, value)
+                except Exception as e:
+                    logger.error(
+                        f"ChangeNotifier::dispatch {column_name} subscriber failed, exception: {str(e)}"
+                    )
+
+    def seed(self, column_name, value):
+        """
+        sets the last written value of a column from a read of the
+        database, so writing it again isn't a change. Called holding write_lock.
+        """
+        with self.__condition:
+            self.__values[column_name] = value
+
+    def subscribe(self, column_name, callback):
+        """
+        calls callback(column_name, new_value) after every write
+        that changes the column
+        """
+        with self.__condition:
+            self.__subscribers.setdefault(column_name, []).append(callback)
+
+    def unsubscribe(self, column_name, callback):
+        """
+        stops calling a subscribed callback
+        """
+        with self.__condition:
+            callbacks: list = self.__subscribers.get(column_name, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def get_version(self, column_names: tuple):
+        """
+        returns the sequence number of the latest write to any of the columns
+        """
+        with self.__condition:
+            return self.__get_version(column_names)
+
+    def get_sequence(self):
+        """
+        returns the sequence number of the latest write to any column. Read
+        without the lock, it only tells a poller whether anything was
+        written since it last looked
+        """
+        return self.__sequence
+
+    def get_publish_time(self, column_name):
+        """
+        returns the time.monotonic() of the latest write to the column
+        """
+        with self.__condition:
+            return self.__publish_times.get(column_name)
+
+    def wait_for_change(self, column_names: tuple, last_version: int, timeout=None):
+        """
+        blocks until one of the columns is written after last_version,
+        the timeout (in seconds) expires or wake_all is called.
+        Returns the latest version of the columns.
+        """
+        with self.__condition:
+            wake_generation = self.__wake_generation
+            self.__condition.wait_for(
+                lambda: self.__get_version(column_names) > last_version
+                or self.__wake_generation != wake_generation,
+                timeout,
+            )
+            return self.__get_version(column_names)
+
+    def wake_all(self):
+        """
+        wakes up every waiter without publishing anything
+        """
+        with self.__condition:
+            self.__wake_generation += 1
+            self.__condition.notify_all()
+
+    def __get_version(self, column_names: tuple):
+        ## called on every sensor read, a plain loop is twice as fast as max()
+        version = 0
+        for column_name in column_names:
+            column_version = self.__column_versions.get(column_name, 0)
+            if column_version > version:
+                version = column_version
+        return version
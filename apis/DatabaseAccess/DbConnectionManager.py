@@ -0,0 +1,102 @@
+import sqlite3
+import logging
+import threading
+
+DB_NAME = "DeviceHistory.db"
+
+JOURNAL_MODE = "WAL"  # readers no longer block the writer and vice versa
+SYNCHRONOUS_LEVEL = "NORMAL"  # in WAL mode, fsync only at checkpoints
+BUSY_TIMEOUT = 5000  # milliseconds to wait on a locked database
+CACHED_STATEMENTS = 128  # prepared statements kept per connection
+
+logger = logging.getLogger(__name__)
+
+
+class DbConnectionManager:
+    """
+    Keeps one open sqlite connection per thread for a given database file,
+    instead of opening and closing a connection on every query.
+    """
+
+    __managers: dict = dict()  # one manager per database file
+    __managers_lock = threading.Lock()
+
+    def __init__(self, db_name=None):
+        if not db_name:
+            self.db_name = DB_NAME
+        else:
+            self.db_name = db_name
+
+        self.__local = threading.local()
+        self.__connections: list = []  # every connection opened, across threads
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def get_manager(db_name=None):
+        """
+        returns the shared connection manager for the given database file
+        """
+        if not db_name:
+            db_name = DB_NAME
+        with DbConnectionManager.__managers_lock:
+            if db_name not in DbConnectionManager.__managers:
+                DbConnectionManager.__managers[db_name] = DbConnectionManager(db_name)
+            return DbConnectionManager.__managers[db_name]
+
+    def get_connection(self):
+        """
+        returns the calling thread's connection, opening it on first use
+        """
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            conn = self.__open_connection()
+            self.__local.conn = conn
+        return conn
+
+    def close(self):
+        """
+        closes the calling thread's connection
+        """
+        conn = getattr(self.__local, "conn", None)
+        if conn is not None:
+            with self.__lock:
+                if conn in self.__connections:
+                    self.__connections.remove(conn)
+            conn.close()
+            self.__local.conn = None
+
+    def close_all(self):
+        """
+        closes every connection opened by this manager. Only safe once
+        the threads that own those connections have stopped using them.
+        """
+        with self.__lock:
+            connections = self.__connections
+            self.__connections = []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"DbConnectionManager::close_all failed to close: {e}")
+        self.__local = threading.local()
+
+    def __open_connection(self):
+        """
+        opens and tunes a new connection for the calling thread
+        """
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=BUSY_TIMEOUT / 1000,
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False,  # close_all may run on another thread
+        )
+        conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS_LEVEL}")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+        with self.__lock:
+            self.__connections.append(conn)
+        logger.debug(
+            f"DbConnectionManager opened a connection to {self.db_name} "
+            f"for {threading.current_thread().name}"
+        )
+        return conn
@@ -1,154 +1,454 @@
+import contextlib
 import sqlite3
 import logging
+import threading
+import time
 from enum import Enum
 import os, sys
+import tempfile
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 grand_parent_dir = os.path.dirname(parent_dir)
-sys.path.append(parent_dir)
-sys.path.append(grand_parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
 
-from apis.DatabaseAccess.DbTables import SharedDataColumns
+from apis.DatabaseAccess.DbTables import (
+    DbTables,
+    SharedDataColumns,
+    TemperatureHistoryColumns,
+    TEMPERATURE_HISTORY_TABLE,
+    DEFAULT_ZONE,
+)
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.StorageBackend import StorageBackend
+from apis.DatabaseAccess.SqliteBackend import SqliteBackend
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+from apis.DatabaseAccess.ChangeNotifier import ChangeNotifier
+from apis.Metrics import Metrics, DB_CALL_SECONDS
+from apis.Config import (
+    SHARED_DATA_BACKEND,
+    MIRROR_SHARED_DATA,
+    StorageBackends,
+    DeviceStatus,
+)
 
 DB_NAME = "DeviceHistory.db"
 SHARED_DATA_TABLE = "SharedData"
+HISTORY_FETCH_SIZE = 500  # rows pulled from sqlite at a time by get_history
+
+## every column a relay decision depends on, read as one snapshot
+DEVICE_STATE_COLUMNS: tuple = (
+    SharedDataColumns.LAST_TEMPERATURE.value,
+    SharedDataColumns.TARGET_TEMPERATURE.value,
+    SharedDataColumns.DEVICE_STATUS.value,
+    SharedDataColumns.LAST_TURNED_ON.value,
+    SharedDataColumns.LAST_TURNED_OFF.value,
+)
+
+SHARED_DATA_COLUMNS: tuple = tuple([column.value for column in SharedDataColumns])
 
 logger = logging.getLogger(__name__)
 
 
 class DbInterface:
     """
-    An API to interact with the database
+    An API to interact with the database. Every interface is bound to one
+    zone, its row of shared data and its temperature history.
     """
 
-    def __init__(self):
-        self.db_name = DB_NAME
+    __shared_backends: dict = dict()  # default backend per database file
+    __shared_backends_lock = threading.Lock()
 
-    def update_column(self, column_name, new_value):
+    def __init__(self, db_name=None, backend: StorageBackend = None, zone_id=None):
+        if not db_name:
+            self.db_name = DB_NAME
+        else:
+            self.db_name = db_name
+
+        if not backend:
+            self.backend = DbInterface.get_shared_backend(self.db_name)
+        else:
+            self.backend = backend
+
+        if zone_id is None:
+            self.zone_id = DEFAULT_ZONE
+        else:
+            self.zone_id = zone_id
+
+        self.notifier: ChangeNotifier = self.__get_notifier(self.zone_id)
+
+    @staticmethod
+    def get_shared_backend(db_name=None):
         """
-        Updates a column in the database table with the provided value
+        returns the backend configured in Config for the given database file.
+        Every DbInterface created without an explicit backend shares it.
         """
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
-            # Check if the table is empty
-            cursor.execute(f"SELECT COUNT(*) FROM {SHARED_DATA_TABLE}")
-            count = cursor.fetchone()[0]
-            if count == 0:
-                cursor.execute(
-                    f"""
-                    INSERT INTO {SHARED_DATA_TABLE} (id, {column_name})
-                    VALUES (1, ?)
-                """,
-                    (new_value,),
-                )
-            else:
-                cursor.execute(
-                    f"""
-                    UPDATE {SHARED_DATA_TABLE}
-                    SET {column_name} = ?
-                    WHERE id = 1
-                """,
-                    (new_value,),
+        if not db_name:
+            db_name = DB_NAME
+        with DbInterface.__shared_backends_lock:
+            if db_name not in DbInterface.__shared_backends:
+                DbInterface.__shared_backends[db_name] = DbInterface.create_backend(
+                    SHARED_DATA_BACKEND, db_name, MIRROR_SHARED_DATA
                 )
+            return DbInterface.__shared_backends[db_name]
 
-            conn.commit()
-            logger.info(f"{column_name} value updated successfully: {new_value}.")
+    @staticmethod
+    def register_shared_backend(backend: StorageBackend, db_name=None):
+        """
+        makes every DbInterface created from now on without an explicit
+        backend use the given one for the given database file
+        """
+        if not db_name:
+            db_name = DB_NAME
+        with DbInterface.__shared_backends_lock:
+            DbInterface.__shared_backends[db_name] = backend
 
-        except sqlite3.Error as e:
-            logger.error(f"Error updating {column_name} value:", e)
+    @staticmethod
+    def create_backend(backend_type: StorageBackends, db_name=None, mirror=True):
+        """
+        builds a new backend of the given type
+        """
+        if backend_type == StorageBackends.SQLITE:
+            return SqliteBackend(db_name=db_name)
+        elif backend_type == StorageBackends.MEMORY:
+            if mirror:
+                return InMemoryBackend(mirror=SqliteBackend(db_name=db_name))
+            return InMemoryBackend()
+        else:
+            raise ValueError(
+                f"DbInterface::create_backend {backend_type} is not a supported backend"
+            )
 
-        finally:
-            if conn:
-                conn.close()
+    def for_zone(self, zone_id):
+        """
+        returns an interface to the same database and backend bound to
+        another zone
+        """
+        return DbInterface(db_name=self.db_name, backend=self.backend, zone_id=zone_id)
+
+    def add_zones(self, zone_ids):
+        """
+        creates the shared data row of every zone that doesn't have one yet
+        """
+        return self.backend.add_zones(tuple(zone_ids))
+
+    def update_column(self, column_name, new_value):
+        """
+        Updates a column in the database table with the provided value
+        """
+        started = time.perf_counter()
+        with self.notifier.write_lock:
+            written = self.backend.write((column_name,), (new_value,), self.zone_id)
+            if written:
+                self.notifier.publish((column_name,), (new_value,))
+        self.__record_call("update_column", (column_name,), started)
+        if written:
+            self.notifier.dispatch()
+            logger.info("%s value updated successfully: %s.", column_name, new_value)
 
     def update_multiple_columns(self, column_names, new_values):
         """
         Updates multiple columns in the database table with the provided values
         """
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-
-            # Update existing row
-            set_clause = ", ".join(
-                [f"{column_name} = ?" for column_name in column_names]
+        started = time.perf_counter()
+        with self.notifier.write_lock:
+            written = self.backend.write(
+                tuple(column_names), tuple(new_values), self.zone_id
             )
-            query = f"""
-                UPDATE {SHARED_DATA_TABLE}
-                SET {set_clause}
-                WHERE id = 1
-            """
-            cursor.execute(query, new_values)
-
-            conn.commit()
+            if written:
+                self.notifier.publish(tuple(column_names), tuple(new_values))
+        self.__record_call("update_multiple_columns", tuple(column_names), started)
+        if written:
+            self.notifier.dispatch()
             logger.info(f"Columns updated successfully: {column_names}")
 
-        except sqlite3.Error as e:
-            logger.error(f"Error updating columns: {e}")
+    def update_zones(self, column_names: tuple, values_by_zone: dict):
+        """
+        Updates the same columns of many zones at once, values_by_zone maps
+        each zone id to its tuple of new values
+        """
+        column_names = tuple(column_names)
+        ## locked in zone order, so concurrent batches can't deadlock
+        notifiers: dict = {
+            zone_id: self.__get_notifier(zone_id) for zone_id in sorted(values_by_zone)
+        }
+        started = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for notifier in notifiers.values():
+                stack.enter_context(notifier.write_lock)
+            written = self.backend.write_zones(column_names, values_by_zone)
+            if written:
+                for zone_id, values in values_by_zone.items():
+                    notifiers[zone_id].publish(column_names, tuple(values))
+        self.__record_call("update_zones", column_names, started)
+        if written:
+            for notifier in notifiers.values():
+                notifier.dispatch()
+            logger.info(
+                "Columns %s updated successfully in %s zones",
+                column_names,
+                len(values_by_zone),
+            )
 
-        finally:
-            if conn:
-                conn.close()
+    def compare_and_swap(
+        self, expected_column, expected_value, column_names, new_values
+    ):
+        """
+        Updates multiple columns only if expected_column still holds
+        expected_value, checked and written in a single transaction.
+        Returns True if the columns were updated
+        """
+        started = time.perf_counter()
+        with self.notifier.write_lock:
+            written = self.backend.compare_and_write(
+                expected_column,
+                expected_value,
+                tuple(column_names),
+                tuple(new_values),
+                self.zone_id,
+            )
+            if written:
+                self.notifier.publish(tuple(column_names), tuple(new_values))
+        self.__record_call("compare_and_swap", tuple(column_names), started)
+        if written:
+            self.notifier.dispatch()
+            logger.info(f"Columns updated successfully: {column_names}")
+            return True
+        logger.info(
+            f"{expected_column} is no longer {expected_value}, {column_names} not updated"
+        )
+        return False
 
     def read_column(self, column_name):
         """
         reads the specified column from the table and returns the value
         """
-        try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+        started = time.perf_counter()
+        value = self.backend.read((column_name,), self.zone_id)
+        self.__record_call("read_column", (column_name,), started)
 
-            cursor.execute(
-                f"""
-                SELECT {column_name}
-                FROM {SHARED_DATA_TABLE}
-                WHERE id = 1
-            """
+        if value:
+            logger.debug("%s read from db: %s", column_name, value[0])
+            return value[0]
+        else:
+            logger.warn(f"No {column_name} data found.")
+            return None
+
+    def read_multiple_columns(self, column_names: tuple):
+        started = time.perf_counter()
+        values = self.backend.read(tuple(column_names), self.zone_id)
+        self.__record_call("read_multiple_columns", tuple(column_names), started)
+        return values
+
+    def read_zones(self, column_names: tuple, zone_ids):
+        """
+        reads the same columns of many zones at once, returns a dictionary
+        of zone id -> tuple of values
+        """
+        started = time.perf_counter()
+        values_by_zone = self.backend.read_zones(tuple(column_names), tuple(zone_ids))
+        self.__record_call("read_zones", tuple(column_names), started)
+        return values_by_zone
+
+    def read_device_state(self):
+        """
+        reads every column a relay decision depends on in one snapshot,
+        returns a dictionary of column name -> value, all None if the
+        zone has no row
+        """
+        state = self.read_device_states((self.zone_id,)).get(self.zone_id)
+        if state is None:
+            return dict.fromkeys(DEVICE_STATE_COLUMNS)
+        return state
+
+    def read_device_states(self, zone_ids):
+        """
+        reads the device state snapshot of many zones at once, returns a
+        dictionary of zone id -> dictionary of column name -> value
+        """
+        started = time.perf_counter()
+        values_by_zone: dict = self.backend.read_zones(
+            DEVICE_STATE_COLUMNS, tuple(zone_ids)
+        )
+        self.__record_call("read_device_states", DEVICE_STATE_COLUMNS, started)
+        return {
+            zone_id: dict(zip(DEVICE_STATE_COLUMNS, values))
+            for zone_id, values in values_by_zone.items()
+        }
+
+    def subscribe(self, column_name, callback):
+        """
+        calls callback(column_name, new_value) whenever a write changes
+        the zone's value of a SharedData column, writes of the same value
+        aren't dispatched. The callback runs in the writing thread.
+        Returns the column's value at the time of subscribing, any
+        later change is dispatched.
+        """
+        if column_name not in SHARED_DATA_COLUMNS:
+            raise ValueError(
+                f"DbInterface::subscribe {column_name} is not a SharedData column"
             )
-            value = cursor.fetchone()
+        ## no write can be applied between the read and subscribing
+        with self.notifier.write_lock:
+            self.notifier.subscribe(column_name, callback)
+            value = self.read_column(column_name)
+            self.notifier.seed(column_name, value)
+        return value
 
-            if value:
-                logger.debug(f"{column_name} read from db: {value[0]}")
-                return value[0]
-            else:
-                logger.warn(f"No {column_name} data found.")
-                return None
+    def unsubscribe(self, column_name, callback):
+        """
+        stops calling a callback given to subscribe
+        """
+        self.notifier.unsubscribe(column_name, callback)
 
-        except sqlite3.Error as e:
-            logger.error(f"Error reading {column_name} value:", e)
-            return None
+    def get_update_version(self, column_names: tuple):
+        """
+        returns the version of the latest update to any of the given columns
+        """
+        return self.notifier.get_version(tuple(column_names))
 
-        finally:
-            if conn:
-                conn.close()
+    def wait_for_update(self, column_names: tuple, last_version: int, timeout=None):
+        """
+        blocks until one of the given columns is updated after last_version,
+        or until the timeout (in seconds) expires. Returns the latest version.
+        """
+        return self.notifier.wait_for_change(tuple(column_names), last_version, timeout)
 
-    def read_multiple_columns(self, column_names: tuple):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def get_last_update_time(self, column_name):
+        """
+        returns the time.monotonic() of the latest update to the given column
+        """
+        return self.notifier.get_publish_time(column_name)
 
+    def wake_waiters(self):
+        """
+        wakes up every thread blocked in wait_for_update
+        """
+        self.notifier.wake_all()
+
+    def insert_temperature_samples(self, samples: list):
+        """
+        inserts a batch of (timestamp, temperature, device_status) samples
+        into the zone's temperature history in a single transaction
+        """
+        return self.insert_zone_temperature_samples({self.zone_id: samples})
+
+    def insert_zone_temperature_samples(self, samples_by_zone: dict):
+        """
+        inserts the (timestamp, temperature, device_status) samples of
+        many zones into the temperature history in a single transaction
+        """
+        rows = [
+            (zone_id, *sample)
+            for zone_id, samples in samples_by_zone.items()
+            for sample in samples
+        ]
+        if not rows:
+            return True
+        started = time.perf_counter()
+        conn = DbConnectionManager.get_manager(self.db_name).get_connection()
         try:
-            select_query = "SELECT {} FROM {}".format(
-                ", ".join(column_names), SHARED_DATA_TABLE
+            conn.executemany(
+                f"""
+                INSERT INTO {TEMPERATURE_HISTORY_TABLE} (
+                    {TemperatureHistoryColumns.ZONE_ID.value},
+                    {TemperatureHistoryColumns.TIMESTAMP.value},
+                    {TemperatureHistoryColumns.TEMPERATURE.value},
+                    {TemperatureHistoryColumns.DEVICE_STATUS.value}
+                )
+                VALUES (?, ?, ?, ?)
+            """,
+                rows,
             )
-            cursor.execute(select_query)
-            result: tuple = cursor.fetchone()
+            conn.commit()
+            logger.debug(f"{len(rows)} temperature samples stored.")
+            return True
+
         except sqlite3.Error as e:
-            logger.error(f"Error reading {column_names}:", e)
-            return None
+            conn.rollback()
+            logger.error(f"Error storing {len(rows)} temperature samples: {e}")
+            return False
 
         finally:
-            if conn:
-                conn.close()
+            self.__record_call("insert_temperature_samples", (), started)
 
-        return result
+    def get_history(self, start=None, end=None, limit=None):
+        """
+        yields the zone's (timestamp, temperature, device_status) samples
+        with start <= timestamp < end in chronological order, a few hundred
+        rows at a time so that long ranges are never held in memory at once
+        """
+        conditions = [f"{TemperatureHistoryColumns.ZONE_ID.value} = ?"]
+        parameters = [self.zone_id]
+        if start is not None:
+            conditions.append(f"{TemperatureHistoryColumns.TIMESTAMP.value} >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append(f"{TemperatureHistoryColumns.TIMESTAMP.value} < ?")
+            parameters.append(end)
+        where_clause = f"WHERE {' AND '.join(conditions)}"
+        limit_clause = "LIMIT ?" if limit is not None else ""
+        if limit is not None:
+            parameters.append(limit)
 
+        query = f"""
+            SELECT {TemperatureHistoryColumns.TIMESTAMP.value},
+                {TemperatureHistoryColumns.TEMPERATURE.value},
+                {TemperatureHistoryColumns.DEVICE_STATUS.value}
+            FROM {TEMPERATURE_HISTORY_TABLE}
+            {where_clause}
+            ORDER BY {TemperatureHistoryColumns.TIMESTAMP.value}
+            {limit_clause}
+        """
+        conn = DbConnectionManager.get_manager(self.db_name).get_connection()
+        try:
+            cursor = conn.execute(query, parameters)
+            rows = cursor.fetchmany(HISTORY_FETCH_SIZE)
+            while rows:
+                yield from rows
+                rows = cursor.fetchmany(HISTORY_FETCH_SIZE)
 
-if __name__ == "__main__":
+        except sqlite3.Error as e:
+            logger.error(f"Error reading temperature history: {e}")
+
+    def flush(self):
+        """
+        blocks until pending writes have reached durable storage
+        """
+        self.backend.flush()
+
+    def close(self):
+        """
+        releases the calling thread's resources held by the backend
+        """
+        self.backend.close()
+
+    @staticmethod
+    def __record_call(operation: str, column_names: tuple, started: float):
+        """
+        counts and times a storage call by operation and columns
+        """
+        Metrics.observe(
+            DB_CALL_SECONDS,
+            time.perf_counter() - started,
+            (("operation", operation), ("columns", column_names)),
+        )
+
+    def __get_notifier(self, zone_id):
+        """
+        returns the notifier shared by every interface to the zone
+        """
+        return ChangeNotifier.get_notifier((self.backend, zone_id))
+
+
+def run_unit_tests(db_interface: DbInterface):
+    """
+    runs the DbInterface unit tests against the backend of the given interface
+    """
     # test write_column and read_column
-    db_interface = DbInterface()
     written_temeprature = 0.9
     db_interface.update_column(
         SharedDataColumns.LAST_TEMPERATURE.value, written_temeprature
@@ -165,7 +465,7 @@ if __name__ == "__main__":
         SharedDataColumns.LAST_TEMPERATURE.value,
         SharedDataColumns.LAST_TURNED_ON.value,
     )
-    values: tuple = (21.4, "test_val")
+    values: tuple = (21.4, 1704110400.5)
     db_interface.update_multiple_columns(column_names, values)
 
     ## test read_multiple_columns
@@ -176,4 +476,204 @@ if __name__ == "__main__":
         )
     )
     assert result == values, "read_multiple_columns failed to read the right values"
+
+    ## test read_device_state
+    state = db_interface.read_device_state()
+    assert (
+        state[SharedDataColumns.LAST_TEMPERATURE.value] == 21.4
+        and state[SharedDataColumns.LAST_TURNED_ON.value] == 1704110400.5
+    ), "read_device_state failed to read the right values"
+
+    ## test that compare_and_swap only writes if the status is unchanged
+    status = state[SharedDataColumns.DEVICE_STATUS.value]
+    other_status = (
+        DeviceStatus.ON.value
+        if status == DeviceStatus.OFF.value
+        else DeviceStatus.OFF.value
+    )
+    switch_columns = (
+        SharedDataColumns.DEVICE_STATUS.value,
+        SharedDataColumns.LAST_TURNED_OFF.value,
+    )
+    assert db_interface.compare_and_swap(
+        SharedDataColumns.DEVICE_STATUS.value,
+        status,
+        switch_columns,
+        (other_status, 1704110460.0),
+    ), "compare_and_swap didn't write an unchanged row"
+    assert not db_interface.compare_and_swap(
+        SharedDataColumns.DEVICE_STATUS.value,
+        status,
+        switch_columns,
+        (other_status, 1704110520.0),
+    ), "compare_and_swap overwrote a changed status"
+    assert db_interface.read_multiple_columns(switch_columns) == (
+        other_status,
+        1704110460.0,
+    ), "compare_and_swap wrote the wrong values"
+    db_interface.update_column(SharedDataColumns.DEVICE_STATUS.value, status)
+
+    ## test that every zone has a row of its own
+    db_interface.add_zones((2,))
+    zone_interface = db_interface.for_zone(2)
+    assert (
+        zone_interface.read_column(SharedDataColumns.DEVICE_STATUS.value)
+        == DeviceStatus.OFF.value
+    ), "add_zones didn't create the default row"
+    db_interface.update_zones(
+        (SharedDataColumns.LAST_TEMPERATURE.value,), {1: (1.5,), 2: (2.5,)}
+    )
+    assert db_interface.read_zones(
+        (SharedDataColumns.LAST_TEMPERATURE.value,), (1, 2, 99)
+    ) == {1: (1.5,), 2: (2.5,)}, "read_zones failed to read every zone's row"
+    zone_interface.update_column(SharedDataColumns.LAST_TEMPERATURE.value, 5.5)
+    assert (
+        db_interface.read_column(SharedDataColumns.LAST_TEMPERATURE.value) == 1.5
+    ), "update_column wrote to another zone's row"
+
+
+if __name__ == "__main__":
+    DbTables().create_shared_data_table()  # migrates an older database
+    sqlite_interface = DbInterface(backend=SqliteBackend())
+    run_unit_tests(sqlite_interface)
+
+    memory_interface = DbInterface(backend=InMemoryBackend())
+    run_unit_tests(memory_interface)
+
+    ## test that the in-memory backend mirrors its writes to the database
+    mirrored_interface = DbInterface(backend=InMemoryBackend(mirror=SqliteBackend()))
+    run_unit_tests(mirrored_interface)
+    mirrored_interface.update_column(SharedDataColumns.LAST_TEMPERATURE.value, 19.5)
+    mirrored_interface.flush()
+    assert (
+        sqlite_interface.read_column(SharedDataColumns.LAST_TEMPERATURE.value) == 19.5
+    ), "InMemoryBackend failed to mirror its writes to the database"
+
+    ## test that concurrent writes reach the database in the order applied
+    def write_temperatures(offset: float):
+        for i in range(200):
+            mirrored_interface.update_column(
+                SharedDataColumns.LAST_TEMPERATURE.value, offset + i / 1000
+            )
+
+    writers = [
+        threading.Thread(target=write_temperatures, args=(offset,))
+        for offset in (10.0, 20.0)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    mirrored_interface.flush()
+    assert sqlite_interface.read_column(
+        SharedDataColumns.LAST_TEMPERATURE.value
+    ) == mirrored_interface.read_column(
+        SharedDataColumns.LAST_TEMPERATURE.value
+    ), "InMemoryBackend mirrored a stale value to the database"
+    mirrored_interface.close()
+
+    ## test that updates wake up threads waiting for them
+    watched_columns = (SharedDataColumns.LAST_TEMPERATURE.value,)
+    version = memory_interface.get_update_version(watched_columns)
+    assert (
+        memory_interface.wait_for_update(watched_columns, version, timeout=0.01)
+        == version
+    ), "wait_for_update returned a new version without any update"
+    memory_interface.update_column(SharedDataColumns.LAST_TEMPERATURE.value, 18.0)
+    assert (
+        memory_interface.wait_for_update(watched_columns, version, timeout=1) > version
+    ), "wait_for_update missed an update"
+
+    ## test that subscribers only hear about writes that change a value
+    changes: list = []
+    status_column = SharedDataColumns.DEVICE_STATUS.value
+    memory_interface.update_column(status_column, DeviceStatus.OFF.value)
+    memory_interface.subscribe(status_column, lambda *change: changes.append(change))
+    memory_interface.update_column(status_column, DeviceStatus.OFF.value)
+    memory_interface.update_multiple_columns(
+        (status_column, SharedDataColumns.LAST_TURNED_ON.value),
+        (DeviceStatus.ON.value, 1704110400.0),
+    )
+    memory_interface.compare_and_swap(
+        status_column, DeviceStatus.ON.value, (status_column,), (DeviceStatus.ON.value,)
+    )
+    memory_interface.update_zones((status_column,), {2: (DeviceStatus.ON.value,)})
+    assert changes == [
+        (status_column, DeviceStatus.ON.value)
+    ], f"DbInterface::subscribe dispatched {changes}"
+    try:
+        memory_interface.subscribe("not_a_column", print)
+        assert False, "DbInterface::subscribe accepted an unknown column"
+    except ValueError:
+        pass
+
+    ## test that subscribing seeds the value, writing it again isn't a change
+    seeded_interface = memory_interface.for_zone(3)
+    seeded_interface.add_zones((3,))
+    seeded_interface.backend.write((status_column,), (DeviceStatus.ON.value,), 3)
+    seeded_changes: list = []
+    assert (
+        seeded_interface.subscribe(
+            status_column, lambda *change: seeded_changes.append(change)
+        )
+        == DeviceStatus.ON.value
+    ), "DbInterface::subscribe didn't return the current value"
+    seeded_interface.update_column(status_column, DeviceStatus.ON.value)
+    assert not seeded_changes, "DbInterface::subscribe dispatched an unchanged value"
+
+    ## test that concurrent writers dispatch in the order they wrote
+    def flip_status(values: tuple):
+        for i in range(300):
+            seeded_interface.update_column(status_column, values[i % 2])
+
+    writers = [
+        threading.Thread(target=flip_status, args=(values,))
+        for values in (("ON", "OFF"), ("OFF", "ON"), ("ON", "AUTO"))
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert seeded_changes[-1][1] == seeded_interface.read_column(
+        status_column
+    ), "DbInterface dispatched a stale value last"
+    assert all(
+        [
+            previous[1] != change[1]
+            for previous, change in zip(seeded_changes, seeded_changes[1:])
+        ]
+    ), "DbInterface dispatched the same value twice in a row"
+
+    ## test temperature history batching and range queries on a scratch database
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_db = os.path.join(temp_dir, "history.db")
+        table_creator = DbTables()
+        table_creator.db_name = history_db
+        table_creator.create_temperature_history_table()
+        history_interface = DbInterface(db_name=history_db, backend=SqliteBackend())
+
+        samples = [(1000.0 + i, 20.0 + i / 10, "OFF") for i in range(10)]
+        assert history_interface.insert_temperature_samples(
+            samples
+        ), "insert_temperature_samples failed to store the batch"
+        assert (
+            list(history_interface.get_history()) == samples
+        ), "get_history failed to return every sample"
+        assert (
+            list(history_interface.get_history(start=1002.0, end=1005.0))
+            == samples[2:5]
+        ), "get_history returned the wrong range"
+        assert (
+            list(history_interface.get_history(start=1002.0, limit=2)) == samples[2:4]
+        ), "get_history ignored the limit"
+        history_interface.for_zone(2).insert_temperature_samples([(1003.5, 5.0, "ON")])
+        assert (
+            list(history_interface.get_history()) == samples
+        ), "get_history returned another zone's samples"
+        DbConnectionManager.get_manager(history_db).close_all()
+
+    ## test that unknown columns are rejected
+    assert (
+        memory_interface.read_multiple_columns(("not_a_column",)) == None
+    ), "InMemoryBackend read an unknown column"
     print("DbInterface class: all unit tests passed")
@@ -1,9 +1,15 @@
+import datetime
 import sqlite3
 import logging
 from enum import Enum
 
 DB_NAME = "DeviceHistory.db"
 SHARED_DATA_TABLE = "SharedData"
+TEMPERATURE_HISTORY_TABLE = "TemperatureHistory"
+TEMPERATURE_ROLLUP_TABLE = "TemperatureRollups"
+DUTY_CYCLE_ROLLUP_TABLE = "DutyCycleRollups"
+STATE_TRANSITION_TABLE = "StateTransitions"
+DEFAULT_ZONE = 1  # SharedData row id of the zone used when there is only one
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +18,46 @@ class SharedDataColumns(Enum):
     ID = "id"
     DEVICE_STATUS = "device_status"
     LAST_TEMPERATURE = "last_temperature"
-    LAST_TURNED_ON = "last_turned_on"
-    LAST_TURNED_OFF = "last_turned_off"
+    LAST_TURNED_ON = "last_turned_on"  # seconds since epoch
+    LAST_TURNED_OFF = "last_turned_off"  # seconds since epoch
     TARGET_TEMPERATURE = "target_temperature"
 
 
+class TemperatureHistoryColumns(Enum):
+    ID = "id"
+    ZONE_ID = "zone_id"  # SharedData row id of the zone
+    TIMESTAMP = "timestamp"  # seconds since epoch
+    TEMPERATURE = "temperature"
+    DEVICE_STATUS = "device_status"
+
+
+class RollupColumns(Enum):
+    ZONE_ID = "zone_id"  # SharedData row id of the zone
+    RESOLUTION = "resolution"  # bucket length in seconds
+    BUCKET_START = "bucket_start"  # seconds since epoch
+    MIN_TEMPERATURE = "min_temperature"
+    MAX_TEMPERATURE = "max_temperature"
+    SUM_TEMPERATURE = "sum_temperature"
+    SAMPLE_COUNT = "sample_count"
+    ON_SECONDS = "on_seconds"
+    TURN_ON_COUNT = "turn_on_count"
+    TURN_OFF_COUNT = "turn_off_count"
+
+
+class StateTransitionColumns(Enum):
+    ID = "id"
+    ZONE_ID = "zone_id"  # SharedData row id of the zone
+    TIMESTAMP = "timestamp"  # seconds since epoch
+    STATE_CHANGE = "state_change"
+    STATE_CHANGE_CAUSE = "state_change_cause"
+    EFFECTIVE_TEMPERATURE = "effective_temperature"
+    TARGET_TEMPERATURE = "target_temperature"
+    LAST_TURNED_ON = "last_turned_on"  # seconds since epoch
+    LAST_TURNED_OFF = "last_turned_off"  # seconds since epoch
+    ON_FOR_MINUTES = "on_for_minutes"
+    OFF_FOR_MINUTES = "off_for_minutes"
+
+
 class DbTables:
     """
     Represents the tables in the Databse. Responsible for creating tables.
@@ -33,17 +74,25 @@ class DbTables:
             conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
 
-            cursor.execute(
-                f"""
+            create_query = f"""
                 CREATE TABLE IF NOT EXISTS {SHARED_DATA_TABLE} (
                     {SharedDataColumns.ID.value} INTEGER PRIMARY KEY, 
                     {SharedDataColumns.DEVICE_STATUS.value} TEXT,
                     {SharedDataColumns.LAST_TEMPERATURE.value} REAL,
-                    {SharedDataColumns.LAST_TURNED_ON.value} TEXT,
-                    {SharedDataColumns.LAST_TURNED_OFF.value} TEXT,
+                    {SharedDataColumns.LAST_TURNED_ON.value} REAL,
+                    {SharedDataColumns.LAST_TURNED_OFF.value} REAL,
                     {SharedDataColumns.TARGET_TEMPERATURE.value} REAL
                 )
             """
+            cursor.execute(create_query)
+            self.__migrate_timestamp_columns(
+                conn,
+                SHARED_DATA_TABLE,
+                (
+                    SharedDataColumns.LAST_TURNED_ON.value,
+                    SharedDataColumns.LAST_TURNED_OFF.value,
+                ),
+                create_query,
             )
 
             insert_query = f"""
@@ -60,3 +109,200 @@ class DbTables:
         finally:
             if conn:
                 conn.close()
+
+    def create_temperature_history_table(self):
+        """
+        Creates a table with every temperature sample read by the sensors,
+        indexed by zone and timestamp for range queries
+        """
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {TEMPERATURE_HISTORY_TABLE} (
+                    {TemperatureHistoryColumns.ID.value} INTEGER PRIMARY KEY,
+                    {TemperatureHistoryColumns.ZONE_ID.value} INTEGER NOT NULL DEFAULT {DEFAULT_ZONE},
+                    {TemperatureHistoryColumns.TIMESTAMP.value} REAL NOT NULL,
+                    {TemperatureHistoryColumns.TEMPERATURE.value} REAL,
+                    {TemperatureHistoryColumns.DEVICE_STATUS.value} TEXT
+                )
+            """
+            )
+            cursor.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS idx_{TEMPERATURE_HISTORY_TABLE}_{TemperatureHistoryColumns.ZONE_ID.value}_{TemperatureHistoryColumns.TIMESTAMP.value}
+                ON {TEMPERATURE_HISTORY_TABLE} ({TemperatureHistoryColumns.ZONE_ID.value}, {TemperatureHistoryColumns.TIMESTAMP.value})
+            """
+            )
+            conn.commit()
+            logger.info(f"Table {TEMPERATURE_HISTORY_TABLE} created successfully.")
+
+        except sqlite3.Error as e:
+            logger.error(f"Error creating table {TEMPERATURE_HISTORY_TABLE}: {e}")
+
+        finally:
+            if conn:
+                conn.close()
+
+    def create_rollup_tables(self):
+        """
+        Creates the tables with per minute, hour and day aggregates
+        of the temperature and of the device's duty cycle
+        """
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {TEMPERATURE_ROLLUP_TABLE} (
+                    {RollupColumns.ZONE_ID.value} INTEGER NOT NULL,
+                    {RollupColumns.RESOLUTION.value} INTEGER NOT NULL,
+                    {RollupColumns.BUCKET_START.value} REAL NOT NULL,
+                    {RollupColumns.MIN_TEMPERATURE.value} REAL,
+                    {RollupColumns.MAX_TEMPERATURE.value} REAL,
+                    {RollupColumns.SUM_TEMPERATURE.value} REAL,
+                    {RollupColumns.SAMPLE_COUNT.value} INTEGER,
+                    PRIMARY KEY ({RollupColumns.ZONE_ID.value}, {RollupColumns.RESOLUTION.value}, {RollupColumns.BUCKET_START.value})
+                ) WITHOUT ROWID
+            """
+            )
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {DUTY_CYCLE_ROLLUP_TABLE} (
+                    {RollupColumns.ZONE_ID.value} INTEGER NOT NULL,
+                    {RollupColumns.RESOLUTION.value} INTEGER NOT NULL,
+                    {RollupColumns.BUCKET_START.value} REAL NOT NULL,
+                    {RollupColumns.ON_SECONDS.value} REAL,
+                    {RollupColumns.TURN_ON_COUNT.value} INTEGER,
+                    {RollupColumns.TURN_OFF_COUNT.value} INTEGER,
+                    PRIMARY KEY ({RollupColumns.ZONE_ID.value}, {RollupColumns.RESOLUTION.value}, {RollupColumns.BUCKET_START.value})
+                ) WITHOUT ROWID
+            """
+            )
+            conn.commit()
+            logger.info(
+                f"Tables {TEMPERATURE_ROLLUP_TABLE} and {DUTY_CYCLE_ROLLUP_TABLE} created successfully."
+            )
+
+        except sqlite3.Error as e:
+            logger.error(f"Error creating rollup tables: {e}")
+
+        finally:
+            if conn:
+                conn.close()
+
+    def create_state_transition_table(self):
+        """
+        Creates a table with every time a device was turned on or off,
+        indexed by timestamp for range queries and retention
+        """
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+
+            create_query = f"""
+                CREATE TABLE IF NOT EXISTS {STATE_TRANSITION_TABLE} (
+                    {StateTransitionColumns.ID.value} INTEGER PRIMARY KEY,
+                    {StateTransitionColumns.ZONE_ID.value} INTEGER NOT NULL DEFAULT {DEFAULT_ZONE},
+                    {StateTransitionColumns.TIMESTAMP.value} REAL NOT NULL,
+                    {StateTransitionColumns.STATE_CHANGE.value} TEXT,
+                    {StateTransitionColumns.STATE_CHANGE_CAUSE.value} TEXT,
+                    {StateTransitionColumns.EFFECTIVE_TEMPERATURE.value} REAL,
+                    {StateTransitionColumns.TARGET_TEMPERATURE.value} REAL,
+                    {StateTransitionColumns.LAST_TURNED_ON.value} REAL,
+                    {StateTransitionColumns.LAST_TURNED_OFF.value} REAL,
+                    {StateTransitionColumns.ON_FOR_MINUTES.value} REAL,
+                    {StateTransitionColumns.OFF_FOR_MINUTES.value} REAL
+                )
+            """
+            cursor.execute(create_query)
+            self.__migrate_timestamp_columns(
+                conn,
+                STATE_TRANSITION_TABLE,
+                (
+                    StateTransitionColumns.LAST_TURNED_ON.value,
+                    StateTransitionColumns.LAST_TURNED_OFF.value,
+                ),
+                create_query,
+            )
+            cursor.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS idx_{STATE_TRANSITION_TABLE}_{StateTransitionColumns.TIMESTAMP.value}
+                ON {STATE_TRANSITION_TABLE} ({StateTransitionColumns.TIMESTAMP.value})
+            """
+            )
+            conn.commit()
+            logger.info(f"Table {STATE_TRANSITION_TABLE} created successfully.")
+
+        except sqlite3.Error as e:
+            logger.error(f"Error creating table {STATE_TRANSITION_TABLE}: {e}")
+
+        finally:
+            if conn:
+                conn.close()
+
+    def __migrate_timestamp_columns(
+        self, conn, table_name: str, column_names: tuple, create_query: str
+    ):
+        """
+        converts the device on and off times older versions stored as text
+        into seconds since epoch. Sqlite can't change the type of a column,
+        so the table is rebuilt with the same rows in one transaction.
+        """
+        column_types: dict = {
+            column[1]: column[2]
+            for column in conn.execute(f"PRAGMA table_info({table_name})")
+        }
+        if all([column_types.get(name) == "REAL" for name in column_names]):
+            return False
+
+        cursor = conn.execute(f"SELECT * FROM {table_name}")
+        names: list = [description[0] for description in cursor.description]
+        rows: list = [
+            [
+                get_epoch_timestamp(value) if name in column_names else value
+                for name, value in zip(names, row)
+            ]
+            for row in cursor.fetchall()
+        ]
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE {table_name}")
+        conn.execute(create_query)
+        conn.executemany(
+            f"""
+            INSERT INTO {table_name} ({", ".join(names)})
+            VALUES ({", ".join(["?"] * len(names))})
+        """,
+            rows,
+        )
+        conn.commit()
+        logger.info(f"Table {table_name} migrated to timestamps in seconds since epoch")
+        return True
+
+
+def get_epoch_timestamp(value):
+    """
+    returns the seconds since epoch of a local time given as a datetime
+    or as text, numbers are returned as they are and anything else as None
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def get_local_time(timestamp):
+    """
+    returns the local time of a number of seconds since epoch as a
+    datetime, for display only
+    """
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp)
@@ -0,0 +1,270 @@
+import atexit
+import logging
+import queue
+import threading
+import os, sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.DatabaseAccess.StorageBackend import StorageBackend
+from apis.DatabaseAccess.DbTables import SharedDataColumns, DEFAULT_ZONE
+
+logger = logging.getLogger(__name__)
+
+## same initial row as DbTables::create_shared_data_table
+DEFAULT_ROW: dict = {
+    SharedDataColumns.ID.value: 1,
+    SharedDataColumns.DEVICE_STATUS.value: "OFF",
+    SharedDataColumns.LAST_TEMPERATURE.value: None,
+    SharedDataColumns.LAST_TURNED_ON.value: None,
+    SharedDataColumns.LAST_TURNED_OFF.value: None,
+    SharedDataColumns.TARGET_TEMPERATURE.value: None,
+}
+
+## rows are keyed by column name, hashing an enum member runs python code
+## and the simulation reads and writes a row on every sensor read
+COLUMN_NAMES: frozenset = frozenset(column.value for column in SharedDataColumns)
+
+
+class InMemoryBackend(StorageBackend):
+    """
+    Keeps one shared data row per zone in a lock-protected dictionary,
+    each row keyed by column name. Another backend can be given as
+    a durable mirror, it is then written asynchronously by a background thread.
+    """
+
+    def __init__(self, mirror: StorageBackend = None):
+        self.__lock = threading.Lock()
+        self.__rows: dict = {DEFAULT_ZONE: dict(DEFAULT_ROW)}  # zone id -> row
+        self.mirror: StorageBackend = mirror
+        self.__mirror_writer: MirrorWriter = None
+
+        if self.mirror:
+            self.__load_from_mirror([DEFAULT_ZONE])
+            self.__mirror_writer = MirrorWriter(self.mirror)
+            self.__mirror_writer.start()
+            atexit.register(self.close)
+
+    def write(self, column_names: tuple, new_values: tuple, zone_id=DEFAULT_ZONE):
+        """
+        writes the given values to the given columns, returns True on success
+        """
+        return self.write_zones(column_names, {zone_id: new_values})
+
+    def read(self, column_names: tuple, zone_id=DEFAULT_ZONE):
+        """
+        returns a tuple with the values of the given columns, or None
+        if one of the columns doesn't exist or the zone has no row
+        """
+        return self.read_zones(column_names, (zone_id,)).get(zone_id)
+
+    def add_zones(self, zone_ids):
+        """
+        creates the default row of every zone that doesn't have one yet,
+        starting from the mirror's row if it has one
+        """
+        with self.__lock:
+            new_zones = [zone_id for zone_id in zone_ids if zone_id not in self.__rows]
+            for zone_id in new_zones:
+                self.__rows[zone_id] = self.__get_default_row(zone_id)
+        if self.mirror and new_zones:
+            self.__load_from_mirror(new_zones)
+            self.mirror.add_zones(new_zones)
+        return True
+
+    def write_zones(self, column_names: tuple, values_by_zone: dict):
+        """
+        writes the same columns of many zones under a single lock,
+        a zone without a row gets the default one first
+        """
+        column_names = tuple(column_names)
+        unknown_column = self.__get_unknown_column(column_names)
+        if unknown_column is not None:
+            logger.error(f"InMemoryBackend::write unknown column '{unknown_column}'")
+            return False
+
+        with self.__lock:
+            for zone_id, new_values in values_by_zone.items():
+                row = self.__rows.get(zone_id)
+                if row is None:
+                    row = self.__rows[zone_id] = self.__get_default_row(zone_id)
+                row.update(zip(column_names, new_values))
+                ## queued in the order applied, the mirror keeps the latest
+                if self.__mirror_writer:
+                    self.__mirror_writer.submit(
+                        zone_id, column_names, tuple(new_values)
+                    )
+        return True
+
+    def compare_and_write(
+        self,
+        expected_column,
+        expected_value,
+        column_names: tuple,
+        new_values: tuple,
+        zone_id=DEFAULT_ZONE,
+    ):
+        """
+        checks expected_column and writes the given values under the same
+        lock, only if it still holds expected_value. Returns True if written
+        """
+        unknown_column = self.__get_unknown_column((expected_column, *column_names))
+        if unknown_column is not None:
+            logger.error(
+                f"InMemoryBackend::compare_and_write unknown column '{unknown_column}'"
+            )
+            return False
+
+        with self.__lock:
+            row = self.__rows.get(zone_id)
+            if row is None or row[expected_column] != expected_value:
+                return False
+            row.update(zip(column_names, new_values))
+            if self.__mirror_writer:
+                self.__mirror_writer.submit(
+                    zone_id, tuple(column_names), tuple(new_values)
+                )
+        return True
+
+    def read_zones(self, column_names: tuple, zone_ids):
+        """
+        reads the same columns of many zones under a single lock, returns
+        a dictionary of zone id -> tuple, zones without a row are left out
+        """
+        unknown_column = self.__get_unknown_column(column_names)
+        if unknown_column is not None:
+            logger.error(f"InMemoryBackend::read unknown column '{unknown_column}'")
+            return dict()
+
+        values_by_zone: dict = dict()
+        with self.__lock:
+            for zone_id in zone_ids:
+                row = self.__rows.get(zone_id)
+                if row is not None:
+                    values_by_zone[zone_id] = tuple(
+                        [row[column_name] for column_name in column_names]
+                    )
+        return values_by_zone
+
+    def flush(self):
+        """
+        blocks until every pending write has reached the mirror
+        """
+        if self.__mirror_writer:
+            self.__mirror_writer.flush()
+
+    def close(self):
+        """
+        flushes and stops the mirror writer
+        """
+        if self.__mirror_writer:
+            self.__mirror_writer.terminate()
+            self.__mirror_writer = None
+
+    def __load_from_mirror(self, zone_ids: list):
+        """
+        starts from the rows already persisted in the mirror, if there are any
+        """
+        columns = tuple(column.value for column in SharedDataColumns)
+        persisted_rows = self.mirror.read_zones(columns, zone_ids)
+        with self.__lock:
+            for zone_id, persisted_row in persisted_rows.items():
+                self.__rows[zone_id].update(zip(columns, persisted_row))
+
+    @staticmethod
+    def __get_default_row(zone_id):
+        row = dict(DEFAULT_ROW)
+        row[SharedDataColumns.ID.value] = zone_id
+        return row
+
+    @staticmethod
+    def __get_unknown_column(column_names: tuple):
+        """
+        returns the first name that isn't a SharedData column, or None
+        """
+        if COLUMN_NAMES.issuperset(column_names):
+            return None
+        for column_name in column_names:
+            if column_name not in COLUMN_NAMES:
+                return column_name
+        return None
+
+
+class MirrorWriter(threading.Thread):
+    """
+    Background thread that copies writes to the mirror backend.
+    Writes that pile up while the mirror is busy are merged,
+    so only the latest value of each column of each zone is persisted.
+    """
+
+    def __init__(self, mirror: StorageBackend, thread_name="MirrorWriter"):
+        threading.Thread.__init__(self, name=thread_name, daemon=True)
+        self.mirror = mirror
+        self.keep_me_alive = True
+        self.__pending: queue.Queue = queue.Queue()
+
+    def submit(self, zone_id, column_names: tuple, new_values: tuple):
+        """
+        queues a write for the mirror
+        """
+        self.__pending.put((zone_id, column_names, new_values))
+
+    def flush(self):
+        """
+        blocks until the queue is drained
+        """
+        self.__pending.join()
+
+    def run(self):
+        while self.keep_me_alive:
+            first_write = self.__pending.get()
+            if first_write is None:
+                self.__pending.task_done()
+                break
+
+            batch = [first_write]
+            try:
+                while True:
+                    batch.append(self.__pending.get_nowait())
+            except queue.Empty:
+                pass
+
+            self.__write_batch(batch)
+            for _ in batch:
+                self.__pending.task_done()
+
+        self.mirror.close()
+
+    def terminate(self):
+        """
+        writes whatever is still pending, then stops the thread
+        """
+        self.keep_me_alive = False
+        self.__pending.put(None)
+        if self.is_alive():
+            self.join()
+
+    def __write_batch(self, batch: list):
+        """
+        merges a batch of writes into one mirror write per set of columns
+        """
+        merged: dict = dict()  # zone id -> column name -> latest value
+        for write in batch:
+            if write is None:
+                continue
+            zone_id, column_names, new_values = write
+            merged.setdefault(zone_id, dict()).update(zip(column_names, new_values))
+
+        values_by_columns: dict = dict()  # column names -> zone id -> values
+        for zone_id, zone_values in merged.items():
+            values_by_columns.setdefault(tuple(zone_values.keys()), dict())[zone_id] = (
+                tuple(zone_values.values())
+            )
+        for column_names, values_by_zone in values_by_columns.items():
+            self.mirror.write_zones(column_names, values_by_zone)
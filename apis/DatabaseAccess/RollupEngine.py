@@ -0,0 +1,394 @@
+import sqlite3
+import logging
+import tempfile
+from enum import Enum
+import os, sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.DatabaseAccess.DbTables import (
+    DbTables,
+    RollupColumns,
+    TemperatureHistoryColumns,
+    TEMPERATURE_HISTORY_TABLE,
+    TEMPERATURE_ROLLUP_TABLE,
+    DUTY_CYCLE_ROLLUP_TABLE,
+    DEFAULT_ZONE,
+)
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.Config import DeviceStatus, RAW_HISTORY_RETENTION_DAYS
+from apis.Registrar import Registrar
+
+DB_NAME = "DeviceHistory.db"
+SECONDS_PER_DAY = 86400
+
+logger = logging.getLogger(__name__)
+
+
+class RollupResolutions(Enum):
+    MINUTE = 60  # bucket length in seconds
+    HOUR = 3600
+    DAY = 86400
+
+
+## bucket lengths in seconds, resolved once instead of on every sample
+BUCKET_LENGTHS: tuple = tuple(resolution.value for resolution in RollupResolutions)
+
+
+class RollupEngine:
+    """
+    Maintains per minute, hour and day aggregates of the temperature and of
+    the device's duty cycle. Aggregates are merged into the existing buckets
+    as new data arrives, they are never recomputed from the raw history.
+    Buckets are aligned to UTC. Every engine is bound to one zone.
+    """
+
+    def __init__(self, db_name=None, zone_id=None):
+        if not db_name:
+            self.db_name = DB_NAME
+        else:
+            self.db_name = db_name
+
+        if zone_id is None:
+            self.zone_id = DEFAULT_ZONE
+        else:
+            self.zone_id = zone_id
+
+        self.__connection_manager = DbConnectionManager.get_manager(self.db_name)
+        self.__on_since: float = None  # timestamp of the last turn on, if still on
+
+    def add_temperature_samples(self, samples: list):
+        """
+        merges a batch of (timestamp, temperature, device_status) samples
+        into the zone's temperature aggregates
+        """
+        return self.add_zone_temperature_samples({self.zone_id: samples})
+
+    def add_zone_temperature_samples(self, samples_by_zone: dict):
+        """
+        merges the (timestamp, temperature, device_status) samples of many
+        zones into their temperature aggregates in a single transaction
+        """
+        ## every sample goes into its minute bucket, the coarser buckets
+        ## are merged from the minutes, so a sample is only looked at once
+        minute_length = BUCKET_LENGTHS[0]
+        # (zone_id, minute_start) -> [min, max, sum, count]
+        minutes: dict = dict()
+        for zone_id, samples in samples_by_zone.items():
+            for timestamp, temperature, _ in samples:
+                if temperature is None:
+                    continue
+                key = (zone_id, timestamp - timestamp % minute_length)
+                aggregate = minutes.get(key)
+                if aggregate is None:
+                    minutes[key] = [temperature, temperature, temperature, 1]
+                else:
+                    if temperature < aggregate[0]:
+                        aggregate[0] = temperature
+                    elif temperature > aggregate[1]:
+                        aggregate[1] = temperature
+                    aggregate[2] += temperature
+                    aggregate[3] += 1
+
+        # (zone_id, resolution, bucket_start) -> [min, max, sum, count]
+        buckets: dict = dict()
+        for (zone_id, minute_start), minute in minutes.items():
+            for bucket_length in BUCKET_LENGTHS:
+                key = (
+                    zone_id,
+                    bucket_length,
+                    minute_start - minute_start % bucket_length,
+                )
+                aggregate = buckets.get(key)
+                if aggregate is None:
+                    buckets[key] = list(minute)
+                else:
+                    aggregate[0] = min(aggregate[0], minute[0])
+                    aggregate[1] = max(aggregate[1], minute[1])
+                    aggregate[2] += minute[2]
+                    aggregate[3] += minute[3]
+
+        rows = [(*key, *aggregate) for key, aggregate in buckets.items()]
+        return self.__upsert(
+            f"""
+            INSERT INTO {TEMPERATURE_ROLLUP_TABLE} (
+                {RollupColumns.ZONE_ID.value},
+                {RollupColumns.RESOLUTION.value}, {RollupColumns.BUCKET_START.value},
+                {RollupColumns.MIN_TEMPERATURE.value}, {RollupColumns.MAX_TEMPERATURE.value},
+                {RollupColumns.SUM_TEMPERATURE.value}, {RollupColumns.SAMPLE_COUNT.value}
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT ({RollupColumns.ZONE_ID.value}, {RollupColumns.RESOLUTION.value}, {RollupColumns.BUCKET_START.value})
+            DO UPDATE SET
+                {RollupColumns.MIN_TEMPERATURE.value} = MIN({RollupColumns.MIN_TEMPERATURE.value}, excluded.{RollupColumns.MIN_TEMPERATURE.value}),
+                {RollupColumns.MAX_TEMPERATURE.value} = MAX({RollupColumns.MAX_TEMPERATURE.value}, excluded.{RollupColumns.MAX_TEMPERATURE.value}),
+                {RollupColumns.SUM_TEMPERATURE.value} = {RollupColumns.SUM_TEMPERATURE.value} + excluded.{RollupColumns.SUM_TEMPERATURE.value},
+                {RollupColumns.SAMPLE_COUNT.value} = {RollupColumns.SAMPLE_COUNT.value} + excluded.{RollupColumns.SAMPLE_COUNT.value}
+        """,
+            rows,
+        )
+
+    def record_device_state(self, device_status, timestamp=None):
+        """
+        records a device state change. Turning on counts a cycle, turning
+        off also adds the time spent on to every bucket the on period spans.
+        """
+        if timestamp is None:
+            timestamp = Registrar.get_clock().time()
+
+        buckets: dict = dict()  # (resolution, bucket_start) -> [on_seconds, ons, offs]
+        if device_status == DeviceStatus.ON.value:
+            if self.__on_since is not None:
+                return True  # already on, nothing changed
+            self.__on_since = timestamp
+            for resolution in RollupResolutions:
+                key = (resolution.value, get_bucket_start(timestamp, resolution))
+                buckets[key] = [0.0, 1, 0]
+
+        else:
+            for resolution in RollupResolutions:
+                key = (resolution.value, get_bucket_start(timestamp, resolution))
+                buckets[key] = [0.0, 0, 1]
+            if self.__on_since is not None:
+                self.__add_on_period(buckets, self.__on_since, timestamp)
+                self.__on_since = None
+
+        rows = [(self.zone_id, *key, *aggregate) for key, aggregate in buckets.items()]
+        return self.__upsert(
+            f"""
+            INSERT INTO {DUTY_CYCLE_ROLLUP_TABLE} (
+                {RollupColumns.ZONE_ID.value},
+                {RollupColumns.RESOLUTION.value}, {RollupColumns.BUCKET_START.value},
+                {RollupColumns.ON_SECONDS.value}, {RollupColumns.TURN_ON_COUNT.value},
+                {RollupColumns.TURN_OFF_COUNT.value}
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT ({RollupColumns.ZONE_ID.value}, {RollupColumns.RESOLUTION.value}, {RollupColumns.BUCKET_START.value})
+            DO UPDATE SET
+                {RollupColumns.ON_SECONDS.value} = {RollupColumns.ON_SECONDS.value} + excluded.{RollupColumns.ON_SECONDS.value},
+                {RollupColumns.TURN_ON_COUNT.value} = {RollupColumns.TURN_ON_COUNT.value} + excluded.{RollupColumns.TURN_ON_COUNT.value},
+                {RollupColumns.TURN_OFF_COUNT.value} = {RollupColumns.TURN_OFF_COUNT.value} + excluded.{RollupColumns.TURN_OFF_COUNT.value}
+        """,
+            rows,
+        )
+
+    def get_temperature_rollups(
+        self, resolution: RollupResolutions, start=None, end=None
+    ):
+        """
+        yields (bucket_start, min, max, average, sample_count) for every
+        bucket of the given resolution with start <= bucket_start < end
+        """
+        query = f"""
+            SELECT {RollupColumns.BUCKET_START.value},
+                {RollupColumns.MIN_TEMPERATURE.value},
+                {RollupColumns.MAX_TEMPERATURE.value},
+                {RollupColumns.SUM_TEMPERATURE.value} / {RollupColumns.SAMPLE_COUNT.value},
+                {RollupColumns.SAMPLE_COUNT.value}
+            FROM {TEMPERATURE_ROLLUP_TABLE}
+        """
+        yield from self.__query_range(query, resolution, start, end)
+
+    def get_duty_cycle_rollups(
+        self, resolution: RollupResolutions, start=None, end=None
+    ):
+        """
+        yields (bucket_start, on_seconds, duty_cycle, turn_on_count,
+        turn_off_count) for every bucket of the given resolution with
+        start <= bucket_start < end. duty_cycle is the fraction of the
+        bucket the device spent on.
+        """
+        query = f"""
+            SELECT {RollupColumns.BUCKET_START.value},
+                {RollupColumns.ON_SECONDS.value},
+                {RollupColumns.ON_SECONDS.value} / {RollupColumns.RESOLUTION.value},
+                {RollupColumns.TURN_ON_COUNT.value},
+                {RollupColumns.TURN_OFF_COUNT.value}
+            FROM {DUTY_CYCLE_ROLLUP_TABLE}
+        """
+        yield from self.__query_range(query, resolution, start, end)
+
+    def prune_raw_history(self, retention_days=None, now=None):
+        """
+        deletes the zone's raw temperature samples older than the retention
+        period, the aggregates are kept. Returns the number of samples deleted.
+        """
+        return self.prune_zone_raw_history((self.zone_id,), retention_days, now)
+
+    def prune_zone_raw_history(self, zone_ids, retention_days=None, now=None):
+        """
+        deletes the raw temperature samples of many zones older than the
+        retention period in a single transaction
+        """
+        if retention_days is None:
+            retention_days = RAW_HISTORY_RETENTION_DAYS
+        if now is None:
+            now = Registrar.get_clock().time()
+        cutoff = now - retention_days * SECONDS_PER_DAY
+
+        conn = self.__connection_manager.get_connection()
+        try:
+            cursor = conn.executemany(
+                f"""
+                DELETE FROM {TEMPERATURE_HISTORY_TABLE}
+                WHERE {TemperatureHistoryColumns.ZONE_ID.value} = ?
+                AND {TemperatureHistoryColumns.TIMESTAMP.value} < ?
+            """,
+                [(zone_id, cutoff) for zone_id in zone_ids],
+            )
+            conn.commit()
+            if cursor.rowcount > 0:
+                logger.info(
+                    f"RollupEngine::prune_raw_history deleted {cursor.rowcount} samples"
+                )
+            return max(cursor.rowcount, 0)
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"RollupEngine::prune_raw_history failed: {e}")
+            return 0
+
+    def __add_on_period(self, buckets: dict, on_since: float, off_at: float):
+        """
+        spreads the seconds between on_since and off_at over the buckets
+        of every resolution
+        """
+        for resolution in RollupResolutions:
+            bucket_start = get_bucket_start(on_since, resolution)
+            while bucket_start < off_at:
+                bucket_end = bucket_start + resolution.value
+                on_seconds = min(off_at, bucket_end) - max(on_since, bucket_start)
+                key = (resolution.value, bucket_start)
+                if key not in buckets:
+                    buckets[key] = [0.0, 0, 0]
+                buckets[key][0] += on_seconds
+                bucket_start = bucket_end
+
+    def __upsert(self, statement: str, rows: list):
+        """
+        merges the given rows into an aggregate table in one transaction
+        """
+        if not rows:
+            return True
+        conn = self.__connection_manager.get_connection()
+        try:
+            conn.executemany(statement, rows)
+            conn.commit()
+            return True
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"RollupEngine failed to update aggregates: {e}")
+            return False
+
+    def __query_range(self, query: str, resolution: RollupResolutions, start, end):
+        """
+        runs a select on an aggregate table restricted to the zone, one
+        resolution and a range of bucket starts, and yields the rows
+        """
+        conditions = [
+            f"{RollupColumns.ZONE_ID.value} = ?",
+            f"{RollupColumns.RESOLUTION.value} = ?",
+        ]
+        parameters = [self.zone_id, resolution.value]
+        if start is not None:
+            conditions.append(f"{RollupColumns.BUCKET_START.value} >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append(f"{RollupColumns.BUCKET_START.value} < ?")
+            parameters.append(end)
+        query += f"""
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {RollupColumns.BUCKET_START.value}
+        """
+
+        conn = self.__connection_manager.get_connection()
+        try:
+            yield from conn.execute(query, parameters)
+        except sqlite3.Error as e:
+            logger.error(f"RollupEngine failed to read aggregates: {e}")
+
+
+def get_bucket_start(timestamp: float, resolution: RollupResolutions):
+    """
+    returns the start of the bucket of the given resolution
+    that contains the timestamp
+    """
+    return timestamp - timestamp % resolution.value
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_name = os.path.join(temp_dir, "rollups.db")
+        table_creator = DbTables()
+        table_creator.db_name = db_name
+        table_creator.create_temperature_history_table()
+        table_creator.create_rollup_tables()
+        engine = RollupEngine(db_name=db_name)
+        day_start = 20 * SECONDS_PER_DAY
+
+        ## test that temperature aggregates merge incrementally
+        engine.add_temperature_samples(
+            [(day_start + 10, 20.0, "OFF"), (day_start + 20, 22.0, "OFF")]
+        )
+        engine.add_temperature_samples(
+            [(day_start + 30, 18.0, "OFF"), (day_start + 70, 25.0, "OFF")]
+        )
+        minutes = list(
+            engine.get_temperature_rollups(RollupResolutions.MINUTE, day_start)
+        )
+        assert minutes == [
+            (day_start, 18.0, 22.0, 20.0, 3),
+            (day_start + 60, 25.0, 25.0, 25.0, 1),
+        ], "RollupEngine::add_temperature_samples merged minute buckets incorrectly"
+        days = list(engine.get_temperature_rollups(RollupResolutions.DAY))
+        assert days == [
+            (day_start, 18.0, 25.0, 21.25, 4)
+        ], "RollupEngine::add_temperature_samples merged day buckets incorrectly"
+        assert (
+            list(
+                RollupEngine(db_name=db_name, zone_id=2).get_temperature_rollups(
+                    RollupResolutions.DAY
+                )
+            )
+            == []
+        ), "RollupEngine mixed up the aggregates of two zones"
+
+        ## test that an on period is split across the buckets it spans
+        engine.record_device_state(DeviceStatus.ON.value, day_start + 30)
+        engine.record_device_state(DeviceStatus.OFF.value, day_start + 150)
+        minutes = list(engine.get_duty_cycle_rollups(RollupResolutions.MINUTE))
+        assert minutes == [
+            (day_start, 30.0, 0.5, 1, 0),
+            (day_start + 60, 60.0, 1.0, 0, 0),
+            (day_start + 120, 30.0, 0.5, 0, 1),
+        ], "RollupEngine::record_device_state split the on period incorrectly"
+        hours = list(engine.get_duty_cycle_rollups(RollupResolutions.HOUR))
+        assert hours == [
+            (day_start, 120.0, 120.0 / 3600, 1, 1)
+        ], "RollupEngine::record_device_state aggregated hours incorrectly"
+
+        ## test that pruning removes raw samples but keeps the aggregates
+        history_rows = [(day_start + i, 20.0, "OFF") for i in range(5)]
+        conn = DbConnectionManager.get_manager(db_name).get_connection()
+        conn.executemany(
+            f"INSERT INTO {TEMPERATURE_HISTORY_TABLE} (timestamp, temperature, device_status) VALUES (?, ?, ?)",
+            history_rows,
+        )
+        conn.commit()
+        deleted = engine.prune_raw_history(
+            retention_days=1, now=day_start + 2 * SECONDS_PER_DAY
+        )
+        assert deleted == 5, "RollupEngine::prune_raw_history didn't prune old samples"
+        assert (
+            len(list(engine.get_temperature_rollups(RollupResolutions.DAY))) == 1
+        ), "RollupEngine::prune_raw_history deleted the aggregates"
+        DbConnectionManager.get_manager(db_name).close_all()
+
+    print("RollupEngine class: all unit tests passed")
@@ -0,0 +1,326 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Config import DeviceStatus, CAPTURE_DIRECTORY
+
+## file header: magic, format version, record size
+HEADER = struct.Struct("<6sHH")
+MAGIC = b"STCAP\x00"
+VERSION = 1
+
+## one sample: seconds since epoch, centi-degrees celsius, device status
+RECORD = struct.Struct("<dhB")
+STATUS_CODES: dict = {DeviceStatus.OFF.value: 0, DeviceStatus.ON.value: 1}
+UNKNOWN_STATUS = 255
+STATUSES: dict = {code: status for status, code in STATUS_CODES.items()}
+
+logger = logging.getLogger(__name__)
+
+
+def get_capture_file(zone_id, directory=None):
+    """
+    returns the capture file of a zone's raw samples
+    """
+    if not directory:
+        directory = CAPTURE_DIRECTORY
+    return os.path.join(directory, f"zone_{zone_id}.capture")
+
+
+class CaptureWriter:
+    """
+    Appends (timestamp, temperature, device_status) samples to a capture
+    file as fixed size records, 11 bytes each. Samples must come in time
+    order, so the file stays sorted and can be searched without an index.
+    A record torn by a crash is cut off when the file is opened again.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.last_timestamp: float = None
+        self.skipped_samples: int = 0  # out of order or out of range samples
+
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(file_name) or os.path.getsize(file_name) == 0
+        if not is_new:
+            self.__check_existing_file()
+        self.__file = open(file_name, "ab")
+        if is_new:
+            self.__file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            self.__file.flush()
+
+    def append(self, samples: list):
+        """
+        appends a batch of (timestamp, temperature, device_status) samples
+        with one write. Returns the number of samples written.
+        """
+        records = bytearray()
+        for timestamp, temperature, device_status in samples:
+            if (
+                temperature is None
+                or self.last_timestamp is not None
+                and timestamp < self.last_timestamp
+            ):
+                self.skipped_samples += 1
+                continue
+            try:
+                records += RECORD.pack(
+                    timestamp,
+                    round(temperature * 100),
+                    STATUS_CODES.get(device_status, UNKNOWN_STATUS),
+                )
+            except struct.error:
+                self.skipped_samples += 1
+                continue
+            self.last_timestamp = timestamp
+
+        try:
+            self.__file.write(records)
+            self.__file.flush()
+            return len(records) // RECORD.size
+        except OSError as e:
+            logger.error(
+                f"CaptureWriter::append failed to write {self.file_name}, exception: {str(e)}"
+            )
+            return 0
+
+    def close(self):
+        self.__file.close()
+
+    def __check_existing_file(self):
+        """
+        checks the header of a file to append to, cuts off a torn
+        last record and picks up the last timestamp
+        """
+        with open(self.file_name, "r+b") as file:
+            magic, _, record_size = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC or record_size != RECORD.size:
+                raise ValueError(
+                    f"CaptureWriter::__init__ {self.file_name} is not a capture file"
+                )
+            size = os.fstat(file.fileno()).st_size
+            torn = (size - HEADER.size) % RECORD.size
+            if torn:
+                logger.warn(
+                    f"CaptureWriter::__init__ cutting off a torn record of {torn} bytes"
+                )
+                size -= torn
+                file.truncate(size)
+            if size > HEADER.size:
+                file.seek(size - RECORD.size)
+                self.last_timestamp = RECORD.unpack(file.read(RECORD.size))[0]
+
+
+class CaptureReader:
+    """
+    Maps a capture file into memory read only. Time ranges are found with a
+    binary search on the sorted timestamps, and handed out as memoryview
+    or numpy views of the mapped records, so nothing is copied and only
+    the pages touched are read from disk, whatever the size of the file.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.__file = open(file_name, "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        if size < HEADER.size:
+            self.__file.close()
+            raise ValueError(
+                f"CaptureReader::__init__ {file_name} is not a capture file"
+            )
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, record_size = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.close()
+            raise ValueError(
+                f"CaptureReader::__init__ {file_name} is not a capture file"
+            )
+
+        # a torn last record is left out
+        self.count: int = (size - HEADER.size) // RECORD.size
+        self.__records = memoryview(self.__map)[
+            HEADER.size : HEADER.size + self.count * RECORD.size
+        ]
+
+    def __len__(self):
+        """
+        returns the number of records in the file
+        """
+        return self.count
+
+    def get_timestamp(self, index: int):
+        """
+        returns the timestamp of the record at the given index
+        """
+        return RECORD.unpack_from(self.__records, index * RECORD.size)[0]
+
+    def find_index(self, timestamp: float):
+        """
+        returns the index of the first record at or after the timestamp
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_timestamp(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find_range(self, start_time: float = None, end_time: float = None):
+        """
+        returns the (first, end) indexes of the records from start_time
+        up to but excluding end_time, either can be left open
+        """
+        first = 0 if start_time is None else self.find_index(start_time)
+        end = self.count if end_time is None else self.find_index(end_time)
+        return first, max(first, end)
+
+    def get_view(self, start_time: float = None, end_time: float = None):
+        """
+        returns a memoryview of the raw records in the time range,
+        without copying them
+        """
+        first, end = self.find_range(start_time, end_time)
+        return self.__records[first * RECORD.size : end * RECORD.size]
+
+    def get_array(self, start_time: float = None, end_time: float = None):
+        """
+        returns a read only numpy array of the records in the time range
+        with timestamp, centidegrees and status fields, without copying them.
+        Needs numpy, which is only imported here as it is slow to import.
+        """
+        import numpy as np
+
+        first, end = self.find_range(start_time, end_time)
+        return np.frombuffer(
+            self.__map,
+            dtype=np.dtype(
+                {
+                    "names": ["timestamp", "centidegrees", "status"],
+                    "formats": ["<f8", "<i2", "u1"],
+                    "offsets": [0, 8, 10],
+                    "itemsize": RECORD.size,
+                }
+            ),
+            count=end - first,
+            offset=HEADER.size + first * RECORD.size,
+        )
+
+    def read_samples(self, start_time: float = None, end_time: float = None):
+        """
+        yields the (timestamp, temperature, device_status) samples
+        in the time range one at a time
+        """
+        for timestamp, centidegrees, status in RECORD.iter_unpack(
+            self.get_view(start_time, end_time)
+        ):
+            yield timestamp, centidegrees / 100, STATUSES.get(status)
+
+    def close(self):
+        """
+        unmaps the file, views handed out must be dropped first
+        """
+        self.__records = None
+        try:
+            self.__map.close()
+        except BufferError:
+            logger.warn(
+                "CaptureReader::close views are still in use, the file is unmapped once they are gone"
+            )
+        self.__file.close()
+
+
+if __name__ == "__main__":
+    import importlib.util
+    import tracemalloc
+
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        capture_file = get_capture_file(1, os.path.join(temp_dir, "captures"))
+        start_time = 1_700_000_000.0
+        samples = [
+            (
+                start_time + i,
+                17.0 + (i % 100) / 100,
+                DeviceStatus.ON.value if i % 2 else DeviceStatus.OFF.value,
+            )
+            for i in range(86400)
+        ]
+
+        ## test that batches are appended and reopening carries on
+        writer = CaptureWriter(capture_file)
+        for i in range(0, 43200, 60):
+            writer.append(samples[i : i + 60])
+        writer.close()
+        writer = CaptureWriter(capture_file)
+        assert (
+            writer.last_timestamp == start_time + 43199
+        ), "CaptureWriter didn't pick up the last timestamp"
+        assert writer.append(samples[43200:]) == 43200, "CaptureWriter dropped samples"
+        assert writer.append([samples[0], (start_time + 90000, None, None)]) == 0
+        assert (
+            writer.skipped_samples == 2
+        ), "CaptureWriter wrote a sample out of order or without a temperature"
+        writer.close()
+        assert (
+            os.path.getsize(capture_file) == HEADER.size + 86400 * RECORD.size
+        ), "CaptureWriter records aren't fixed size"
+
+        ## test that a torn record is left out and cut off
+        with open(capture_file, "ab") as file:
+            file.write(b"\x01\x02\x03")
+        reader = CaptureReader(capture_file)
+        assert len(reader) == 86400, "CaptureReader read a torn record"
+        reader.close()
+        CaptureWriter(capture_file).close()
+        assert os.path.getsize(capture_file) == HEADER.size + 86400 * RECORD.size
+
+        ## test the binary search on the timestamps
+        reader = CaptureReader(capture_file)
+        assert reader.find_range(start_time + 100, start_time + 160) == (100, 160)
+        assert reader.find_range(start_time + 99.5, None) == (100, 86400)
+        assert reader.find_range(None, start_time - 1) == (0, 0)
+        assert reader.find_range(start_time + 10, start_time + 5) == (10, 10)
+
+        ## test that the samples are decoded
+        view = reader.get_view(start_time + 3600, start_time + 3610)
+        assert len(view) == 10 * RECORD.size, "CaptureReader::get_view wrong range"
+        assert list(reader.read_samples(start_time + 101, start_time + 103)) == [
+            (start_time + 101, 17.01, DeviceStatus.ON.value),
+            (start_time + 102, 17.02, DeviceStatus.OFF.value),
+        ], "CaptureReader::read_samples decoded the wrong samples"
+        view.release()
+
+        ## test that a numpy array is a view of the mapped file
+        if importlib.util.find_spec("numpy"):
+            array = reader.get_array(start_time + 7200, start_time + 10800)
+            assert len(array) == 3600 and not array.flags.owndata
+            assert array["timestamp"][0] == start_time + 7200
+            assert array["centidegrees"][:3].tolist() == [1700, 1701, 1702]
+            assert array["status"][:2].tolist() == [0, 1]
+            del array
+
+        ## test that looking up a range doesn't load the file
+        tracemalloc.start()
+        for hour in range(24):
+            reader.find_range(start_time + hour * 3600, start_time + hour * 3600 + 60)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert peak < 10_000, f"CaptureReader used {peak} bytes to find 24 ranges"
+        reader.close()
+
+    print("SampleCapture class: all unit tests passed")
@@ -0,0 +1,220 @@
+import sqlite3
+import logging
+import os, sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.DatabaseAccess.StorageBackend import StorageBackend
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.DbTables import SharedDataColumns, DEFAULT_ZONE
+from apis.Config import DeviceStatus
+
+DB_NAME = "DeviceHistory.db"
+SHARED_DATA_TABLE = "SharedData"
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteBackend(StorageBackend):
+    """
+    Stores the shared data in the SharedData table of the sqlite database,
+    the row id is the zone id
+    """
+
+    def __init__(self, db_name=None):
+        if not db_name:
+            self.db_name = DB_NAME
+        else:
+            self.db_name = db_name
+
+        self.__connection_manager = DbConnectionManager.get_manager(self.db_name)
+        self.__statements: dict = dict()  # sql text per column(s), reused by sqlite
+
+    def write(self, column_names: tuple, new_values: tuple, zone_id=DEFAULT_ZONE):
+        """
+        writes the given values to the given columns, returns True on success
+        """
+        return self.write_zones(column_names, {zone_id: new_values})
+
+    def read(self, column_names: tuple, zone_id=DEFAULT_ZONE):
+        """
+        returns a tuple with the values of the given columns,
+        or None if the row doesn't exist or can't be read
+        """
+        conn = self.__connection_manager.get_connection()
+        try:
+            return conn.execute(
+                self.__get_read_statement(column_names), (zone_id,)
+            ).fetchone()
+
+        except sqlite3.Error as e:
+            logger.error(f"SqliteBackend::read error reading {column_names}: {e}")
+            return None
+
+    def compare_and_write(
+        self,
+        expected_column,
+        expected_value,
+        column_names: tuple,
+        new_values: tuple,
+        zone_id=DEFAULT_ZONE,
+    ):
+        """
+        writes the given values with a single conditional update, only if
+        expected_column still holds expected_value. Returns True if written
+        """
+        conn = self.__connection_manager.get_connection()
+        try:
+            cursor = conn.execute(
+                self.__get_compare_and_write_statement(expected_column, column_names),
+                (*new_values, zone_id, expected_value),
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(
+                f"SqliteBackend::compare_and_write error updating {column_names}: {e}"
+            )
+            return False
+
+    def add_zones(self, zone_ids):
+        """
+        creates the default row of every zone that doesn't have one yet
+        """
+        conn = self.__connection_manager.get_connection()
+        try:
+            conn.executemany(
+                f"""
+                INSERT OR IGNORE INTO {SHARED_DATA_TABLE} (
+                    {SharedDataColumns.ID.value}, {SharedDataColumns.DEVICE_STATUS.value}
+                )
+                VALUES (?, ?)
+            """,
+                [(zone_id, DeviceStatus.OFF.value) for zone_id in zone_ids],
+            )
+            conn.commit()
+            return True
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"SqliteBackend::add_zones error adding {zone_ids}: {e}")
+            return False
+
+    def write_zones(self, column_names: tuple, values_by_zone: dict):
+        """
+        writes the same columns of many zones in a single transaction
+        """
+        conn = self.__connection_manager.get_connection()
+        try:
+            # a single upsert creates the row if the zone doesn't have one yet
+            conn.executemany(
+                self.__get_write_statement(column_names),
+                [
+                    (zone_id, *new_values)
+                    for zone_id, new_values in values_by_zone.items()
+                ],
+            )
+            conn.commit()
+            return True
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"SqliteBackend::write error updating {column_names}: {e}")
+            return False
+
+    def read_zones(self, column_names: tuple, zone_ids):
+        """
+        reads the same columns of many zones with a single select, returns
+        a dictionary of zone id -> tuple, zones without a row are left out
+        """
+        zone_ids = tuple(zone_ids)
+        if not zone_ids:
+            return dict()
+        conn = self.__connection_manager.get_connection()
+        try:
+            rows = conn.execute(
+                self.__get_read_zones_statement(column_names, len(zone_ids)), zone_ids
+            )
+            return {row[0]: row[1:] for row in rows}
+
+        except sqlite3.Error as e:
+            logger.error(f"SqliteBackend::read_zones error reading {column_names}: {e}")
+            return dict()
+
+    def close(self):
+        """
+        closes the calling thread's database connection
+        """
+        self.__connection_manager.close()
+
+    def __get_write_statement(self, column_names: tuple):
+        """
+        returns the upsert statement for a set of columns
+        """
+        key = ("write", column_names)
+        if key not in self.__statements:
+            placeholders = ", ".join(["?" for _ in column_names])
+            set_clause = ", ".join(
+                [
+                    f"{column_name} = excluded.{column_name}"
+                    for column_name in column_names
+                ]
+            )
+            self.__statements[key] = f"""
+                INSERT INTO {SHARED_DATA_TABLE} (id, {", ".join(column_names)})
+                VALUES (?, {placeholders})
+                ON CONFLICT(id) DO UPDATE SET {set_clause}
+            """
+        return self.__statements[key]
+
+    def __get_compare_and_write_statement(self, expected_column, column_names: tuple):
+        """
+        returns the conditional update statement for a set of columns,
+        IS also matches an expected NULL
+        """
+        key = ("compare_and_write", expected_column, column_names)
+        if key not in self.__statements:
+            set_clause = ", ".join(
+                [f"{column_name} = ?" for column_name in column_names]
+            )
+            self.__statements[key] = f"""
+                UPDATE {SHARED_DATA_TABLE}
+                SET {set_clause}
+                WHERE id = ? AND {expected_column} IS ?
+            """
+        return self.__statements[key]
+
+    def __get_read_statement(self, column_names: tuple):
+        """
+        returns the select statement for a set of columns
+        """
+        key = ("read", column_names)
+        if key not in self.__statements:
+            self.__statements[key] = f"""
+                SELECT {", ".join(column_names)}
+                FROM {SHARED_DATA_TABLE}
+                WHERE id = ?
+            """
+        return self.__statements[key]
+
+    def __get_read_zones_statement(self, column_names: tuple, zone_count: int):
+        """
+        returns the select statement for a set of columns of zone_count zones
+        """
+        key = ("read_zones", column_names, zone_count)
+        if key not in self.__statements:
+            placeholders = ", ".join(["?" for _ in range(zone_count)])
+            self.__statements[key] = f"""
+                SELECT id, {", ".join(column_names)}
+                FROM {SHARED_DATA_TABLE}
+                WHERE id IN ({placeholders})
+            """
+        return self.__statements[key]
@@ -0,0 +1,358 @@
+import datetime
+import sqlite3
+import logging
+import tempfile
+import os, sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.DatabaseAccess.DbTables import (
+    DbTables,
+    StateTransitionColumns,
+    STATE_TRANSITION_TABLE,
+    DEFAULT_ZONE,
+    get_epoch_timestamp,
+    get_local_time,
+)
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.Config import STATE_TRANSITION_RETENTION_DAYS
+from apis.Registrar import Registrar
+
+DB_NAME = "DeviceHistory.db"
+SECONDS_PER_DAY = 86400
+TIMESTAMP_KEY = "current_timestamp"  # payload key of the time of a transition
+TRANSITION_FETCH_SIZE = 500  # rows pulled from sqlite at a time by get_transitions
+
+## payload key of every stored column other than the id and timestamp,
+## in the order they were always written to the state transition record
+PAYLOAD_COLUMNS: tuple = (
+    StateTransitionColumns.STATE_CHANGE.value,
+    StateTransitionColumns.ZONE_ID.value,
+    StateTransitionColumns.STATE_CHANGE_CAUSE.value,
+    StateTransitionColumns.EFFECTIVE_TEMPERATURE.value,
+    StateTransitionColumns.TARGET_TEMPERATURE.value,
+    StateTransitionColumns.LAST_TURNED_ON.value,
+    StateTransitionColumns.LAST_TURNED_OFF.value,
+)
+TIME_COLUMNS: tuple = (
+    StateTransitionColumns.LAST_TURNED_ON.value,
+    StateTransitionColumns.LAST_TURNED_OFF.value,
+)
+DELTA_COLUMNS: tuple = (
+    StateTransitionColumns.ON_FOR_MINUTES.value,
+    StateTransitionColumns.OFF_FOR_MINUTES.value,
+)
+SELECTED_COLUMNS: tuple = (
+    (StateTransitionColumns.TIMESTAMP.value,) + PAYLOAD_COLUMNS + DELTA_COLUMNS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class StateTransitionStore:
+    """
+    Stores every time a device was turned on or off as a row of the
+    StateTransitions table. Transitions older than the retention period
+    are pruned as new ones arrive. Queries cover every zone unless a
+    zone id is given.
+    """
+
+    def __init__(self, db_name=None, retention_days=None):
+        if not db_name:
+            self.db_name = DB_NAME
+        else:
+            self.db_name = db_name
+
+        if retention_days is None:
+            self.retention_days = STATE_TRANSITION_RETENTION_DAYS
+        else:
+            self.retention_days = retention_days
+
+        self.__connection_manager = DbConnectionManager.get_manager(self.db_name)
+
+    def add_transition(self, payload: dict):
+        """
+        stores a state transition payload and prunes the expired
+        transitions in the same transaction, returns True on success
+        """
+        return self.add_transitions([payload])
+
+    def add_transitions(self, payloads: list):
+        """
+        stores a batch of state transition payloads and prunes the expired
+        transitions in a single transaction, returns True on success
+        """
+        if not payloads:
+            return True
+        rows = [get_row(payload) for payload in payloads]
+        newest = max([row[0] for row in rows])
+
+        conn = self.__connection_manager.get_connection()
+        try:
+            conn.executemany(
+                f"""
+                INSERT INTO {STATE_TRANSITION_TABLE} ({", ".join(SELECTED_COLUMNS)})
+                VALUES ({", ".join(["?"] * len(SELECTED_COLUMNS))})
+            """,
+                rows,
+            )
+            self.__delete_before(conn, newest - self.retention_days * SECONDS_PER_DAY)
+            conn.commit()
+            return True
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"StateTransitionStore::add_transitions failed: {e}")
+            return False
+
+    def prune(self, now=None):
+        """
+        deletes the transitions older than the retention period,
+        returns the number of transitions deleted
+        """
+        if now is None:
+            now = Registrar.get_clock().time()
+
+        conn = self.__connection_manager.get_connection()
+        try:
+            deleted = self.__delete_before(
+                conn, now - self.retention_days * SECONDS_PER_DAY
+            )
+            conn.commit()
+            return deleted
+
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"StateTransitionStore::prune failed: {e}")
+            return 0
+
+    def get_transitions(self, start=None, end=None, zone_id=None):
+        """
+        yields the transitions with start <= timestamp < end in
+        chronological order, as payload dictionaries
+        """
+        where_clause, parameters = self.__get_conditions(start, end, zone_id)
+        query = f"""
+            SELECT {", ".join(SELECTED_COLUMNS)}
+            FROM {STATE_TRANSITION_TABLE}
+            {where_clause}
+            ORDER BY {StateTransitionColumns.TIMESTAMP.value}, {StateTransitionColumns.ID.value}
+        """
+        conn = self.__connection_manager.get_connection()
+        try:
+            cursor = conn.execute(query, parameters)
+            rows = cursor.fetchmany(TRANSITION_FETCH_SIZE)
+            while rows:
+                for row in rows:
+                    yield get_payload(row)
+                rows = cursor.fetchmany(TRANSITION_FETCH_SIZE)
+
+        except sqlite3.Error as e:
+            logger.error(f"StateTransitionStore failed to read transitions: {e}")
+
+    def get_last_transitions(self, count: int, zone_id=None):
+        """
+        returns the last count transitions in chronological order,
+        as payload dictionaries
+        """
+        where_clause, parameters = self.__get_conditions(None, None, zone_id)
+        query = f"""
+            SELECT {", ".join(SELECTED_COLUMNS)}
+            FROM {STATE_TRANSITION_TABLE}
+            {where_clause}
+            ORDER BY {StateTransitionColumns.TIMESTAMP.value} DESC, {StateTransitionColumns.ID.value} DESC
+            LIMIT ?
+        """
+        rows = list(self.__query(query, parameters + [count]))
+        return [get_payload(row) for row in reversed(rows)]
+
+    def count_by_cause(self, start=None, end=None, zone_id=None):
+        """
+        returns a dictionary of state change cause -> number of transitions
+        with start <= timestamp < end
+        """
+        where_clause, parameters = self.__get_conditions(start, end, zone_id)
+        cause = StateTransitionColumns.STATE_CHANGE_CAUSE.value
+        query = f"""
+            SELECT {cause}, COUNT(*)
+            FROM {STATE_TRANSITION_TABLE}
+            {where_clause}
+            GROUP BY {cause}
+        """
+        return dict(self.__query(query, parameters))
+
+    def __delete_before(self, conn, cutoff: float):
+        """
+        deletes the transitions older than the cutoff without committing,
+        returns the number of transitions deleted
+        """
+        cursor = conn.execute(
+            f"""
+            DELETE FROM {STATE_TRANSITION_TABLE}
+            WHERE {StateTransitionColumns.TIMESTAMP.value} < ?
+        """,
+            (cutoff,),
+        )
+        if cursor.rowcount > 0:
+            logger.info(
+                f"StateTransitionStore::prune deleted {cursor.rowcount} transitions"
+            )
+        return max(cursor.rowcount, 0)
+
+    def __query(self, query: str, parameters: list):
+        """
+        runs a select on the transitions and returns its rows
+        """
+        conn = self.__connection_manager.get_connection()
+        try:
+            return conn.execute(query, parameters).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"StateTransitionStore failed to read transitions: {e}")
+            return []
+
+    @staticmethod
+    def __get_conditions(start, end, zone_id):
+        """
+        returns the where clause and its parameters restricting
+        the transitions to a time range and a zone
+        """
+        conditions: list = []
+        parameters: list = []
+        if zone_id is not None:
+            conditions.append(f"{StateTransitionColumns.ZONE_ID.value} = ?")
+            parameters.append(zone_id)
+        if start is not None:
+            conditions.append(f"{StateTransitionColumns.TIMESTAMP.value} >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append(f"{StateTransitionColumns.TIMESTAMP.value} < ?")
+            parameters.append(end)
+        if not conditions:
+            return "", parameters
+        return f"WHERE {' AND '.join(conditions)}", parameters
+
+
+def get_row(payload: dict):
+    """
+    turns a payload into the values of the selected columns,
+    times are stored in seconds since epoch
+    """
+    timestamp = get_epoch_timestamp(payload.get(TIMESTAMP_KEY))
+    if timestamp is None:
+        timestamp = Registrar.get_clock().time()
+
+    row = [timestamp]
+    row += [
+        (
+            get_epoch_timestamp(payload.get(column))
+            if column in TIME_COLUMNS
+            else payload.get(column)
+        )
+        for column in PAYLOAD_COLUMNS
+    ]
+    row += [
+        None if payload.get(column) == "" else payload.get(column)
+        for column in DELTA_COLUMNS
+    ]
+    if row[2] is None:
+        row[2] = DEFAULT_ZONE
+    return row
+
+
+def get_payload(row: tuple):
+    """
+    turns a selected row back into the payload it was stored from
+    """
+    payload = dict(zip(PAYLOAD_COLUMNS, row[1 : 1 + len(PAYLOAD_COLUMNS)]))
+    for column in TIME_COLUMNS:
+        payload[column] = get_local_time(payload[column])
+    payload[TIMESTAMP_KEY] = get_local_time(row[0])
+    for column, delta in zip(DELTA_COLUMNS, row[1 + len(PAYLOAD_COLUMNS) :]):
+        payload[column] = "" if delta is None else delta
+    return payload
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_name = os.path.join(temp_dir, "transitions.db")
+        table_creator = DbTables()
+        table_creator.db_name = db_name
+        table_creator.create_state_transition_table()
+        store = StateTransitionStore(db_name=db_name, retention_days=1)
+        day_start = 20 * SECONDS_PER_DAY
+
+        def make_payload(timestamp, turned_on, cause, zone_id=DEFAULT_ZONE):
+            return {
+                "state_change": (
+                    "Device Turned On" if turned_on else "Device Turned Off"
+                ),
+                "zone_id": zone_id,
+                "state_change_cause": cause,
+                "effective_temperature": 16.5,
+                "target_temperature": 17.0,
+                "last_turned_on": datetime.datetime.fromtimestamp(timestamp - 60),
+                "last_turned_off": None,
+                TIMESTAMP_KEY: datetime.datetime.fromtimestamp(timestamp),
+                "on_for_minutes": "",
+                "off_for_minutes": 3.5,
+            }
+
+        ## test that a stored transition reads back as the same payload
+        payload = make_payload(day_start, True, "too cold")
+        assert store.add_transition(payload), "StateTransitionStore didn't store"
+        assert list(store.get_transitions()) == [
+            payload
+        ], "StateTransitionStore::get_transitions changed the payload"
+
+        for minute in range(1, 10):
+            store.add_transition(
+                make_payload(
+                    day_start + minute * 60,
+                    minute % 2 == 0,
+                    "too cold" if minute % 2 == 0 else "too hot",
+                    zone_id=1 + minute % 3 // 2,
+                )
+            )
+
+        ## test the range, last n and count by cause queries
+        in_range = list(store.get_transitions(day_start + 120, day_start + 300))
+        assert [transition[TIMESTAMP_KEY].timestamp() for transition in in_range] == [
+            day_start + 120,
+            day_start + 180,
+            day_start + 240,
+        ], "StateTransitionStore::get_transitions returned the wrong range"
+        last = store.get_last_transitions(3)
+        assert [transition[TIMESTAMP_KEY].timestamp() for transition in last] == [
+            day_start + 420,
+            day_start + 480,
+            day_start + 540,
+        ], "StateTransitionStore::get_last_transitions returned the wrong ones"
+        assert store.count_by_cause() == {
+            "too cold": 5,
+            "too hot": 5,
+        }, "StateTransitionStore::count_by_cause miscounted"
+        assert store.count_by_cause(zone_id=2) == {
+            "too cold": 2,
+            "too hot": 1,
+        }, "StateTransitionStore::count_by_cause mixed up the zones"
+
+        ## test that old transitions roll off instead of being wiped at once
+        store.add_transition(
+            make_payload(day_start + SECONDS_PER_DAY + 300, True, "too cold")
+        )
+        remaining = list(store.get_transitions())
+        assert (
+            len(remaining) == 6
+        ), "StateTransitionStore::add_transition didn't apply the retention"
+        assert (
+            store.prune(now=day_start + SECONDS_PER_DAY + 600) == 5
+        ), "StateTransitionStore::prune didn't delete the expired transitions"
+        DbConnectionManager.get_manager(db_name).close_all()
+
+    print("StateTransitionStore class: all unit tests passed")
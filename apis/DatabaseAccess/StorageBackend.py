@@ -0,0 +1,76 @@
+import os, sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.DatabaseAccess.DbTables import DEFAULT_ZONE
+
+
+class StorageBackend:
+    """
+    Abstract base class. Used as a blueprint only.
+    A storage backend holds the rows of shared data exchanged between
+    the threads, one row per zone.
+    """
+
+    def __init__(self):
+        pass
+
+    def write(self, column_names: tuple, new_values: tuple, zone_id=DEFAULT_ZONE):
+        raise NotImplementedError
+
+    def read(self, column_names: tuple, zone_id=DEFAULT_ZONE):
+        raise NotImplementedError
+
+    def compare_and_write(
+        self,
+        expected_column,
+        expected_value,
+        column_names: tuple,
+        new_values: tuple,
+        zone_id=DEFAULT_ZONE,
+    ):
+        """
+        writes the given values only if expected_column still holds
+        expected_value, as one atomic operation. Returns True if written
+        """
+        raise NotImplementedError
+
+    def add_zones(self, zone_ids):
+        """
+        creates the default row of every zone that doesn't have one yet
+        """
+        raise NotImplementedError
+
+    def write_zones(self, column_names: tuple, values_by_zone: dict):
+        """
+        writes the same columns of many zones, returns True on success
+        """
+        results = [
+            self.write(column_names, new_values, zone_id)
+            for zone_id, new_values in values_by_zone.items()
+        ]
+        return all(results)
+
+    def read_zones(self, column_names: tuple, zone_ids):
+        """
+        returns a dictionary of zone id -> tuple with the values of the
+        given columns, zones without a row are left out
+        """
+        values_by_zone: dict = dict()
+        for zone_id in zone_ids:
+            values = self.read(column_names, zone_id)
+            if values is not None:
+                values_by_zone[zone_id] = values
+        return values_by_zone
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,48 @@
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Filters.TemperatureFilter import TemperatureFilter
+
+
+class BatchMeanFilter(TemperatureFilter):
+    """
+    Collects window reads, returns their mean and starts over.
+    Only produces a value every window reads.
+    """
+
+    def __init__(self, window: int):
+        super().__init__(window)
+        self.__samples: list = []
+
+    def add_sample(self, temperature: float):
+        self.__samples.append(temperature)
+        if len(self.__samples) < self.window:
+            return None
+        mean = round(sum(self.__samples) / self.window, 2)
+        self.__samples = []  # reset batch
+        return mean
+
+
+if __name__ == "__main__":
+    batch_filter = BatchMeanFilter(window=3)
+
+    ## test that a mean is only returned once per batch
+    assert [batch_filter.add_sample(value) for value in (1.0, 2.0, 6.0)] == [
+        None,
+        None,
+        3.0,
+    ], "BatchMeanFilter returned the wrong batch mean"
+    assert [batch_filter.add_sample(value) for value in (4.0, 4.0, 4.0)] == [
+        None,
+        None,
+        4.0,
+    ], "BatchMeanFilter didn't start a new batch"
+    print("BatchMeanFilter class: all unit tests passed")
@@ -0,0 +1,46 @@
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Filters.TemperatureFilter import TemperatureFilter
+
+
+class EwmaFilter(TemperatureFilter):
+    """
+    Exponentially weighted mean of the reads. The weight of a new read is
+    2 / (window + 1), so the filter follows the temperature about as fast as
+    a moving average of window reads. Returns a value on every read.
+    """
+
+    def __init__(self, window: int):
+        super().__init__(window)
+        self.alpha: float = 2 / (window + 1)
+        self.__mean: float = None
+
+    def add_sample(self, temperature: float):
+        if self.__mean is None:
+            self.__mean = temperature
+        else:
+            self.__mean += self.alpha * (temperature - self.__mean)
+        return round(self.__mean, 2)
+
+
+if __name__ == "__main__":
+    ewma_filter = EwmaFilter(window=3)
+
+    ## test that the first read is returned as is and later reads are weighted
+    assert ewma_filter.add_sample(10.0) == 10.0, "EwmaFilter changed the first read"
+    assert ewma_filter.add_sample(20.0) == 15.0, "EwmaFilter weighted the read wrong"
+
+    ## test that the mean converges to a steady temperature
+    for _ in range(50):
+        result = ewma_filter.add_sample(18.0)
+    assert result == 18.0, "EwmaFilter didn't converge"
+    print("EwmaFilter class: all unit tests passed")
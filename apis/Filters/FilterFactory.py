@@ -0,0 +1,42 @@
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Config import TEMPERATURE_FILTER, FILTER_WINDOW, TemperatureFilters
+from apis.Filters.TemperatureFilter import TemperatureFilter
+from apis.Filters.BatchMeanFilter import BatchMeanFilter
+from apis.Filters.MovingAverageFilter import MovingAverageFilter
+from apis.Filters.EwmaFilter import EwmaFilter
+from apis.Filters.RunningMedianFilter import RunningMedianFilter
+
+## filter class of every filter type
+FILTER_CLASSES: dict = {
+    TemperatureFilters.BATCH_MEAN: BatchMeanFilter,
+    TemperatureFilters.MOVING_AVERAGE: MovingAverageFilter,
+    TemperatureFilters.EWMA: EwmaFilter,
+    TemperatureFilters.RUNNING_MEDIAN: RunningMedianFilter,
+}
+
+
+def create_filter(filter_type: TemperatureFilters = None, window: int = None):
+    """
+    builds a new filter of the given type and window,
+    the ones in Config by default
+    """
+    if not filter_type:
+        filter_type = TEMPERATURE_FILTER
+    if not window:
+        window = FILTER_WINDOW
+
+    if filter_type not in FILTER_CLASSES:
+        raise ValueError(
+            f"FilterFactory::create_filter {filter_type} is not a supported filter"
+        )
+    return FILTER_CLASSES[filter_type](window)
@@ -0,0 +1,67 @@
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Filters.TemperatureFilter import TemperatureFilter
+
+
+class MovingAverageFilter(TemperatureFilter):
+    """
+    Mean of the last window reads, kept in a ring buffer with a running
+    sum so that every read costs O(1). Returns a value on every read once
+    the first window is full.
+    """
+
+    def __init__(self, window: int):
+        super().__init__(window)
+        self.__ring: list = [0.0] * window
+        self.__next_index: int = 0  # slot the next read overwrites
+        self.__count: int = 0
+        self.__sum: float = 0.0
+
+    def add_sample(self, temperature: float):
+        self.__sum += temperature - self.__ring[self.__next_index]
+        self.__ring[self.__next_index] = temperature
+        self.__next_index += 1
+        if self.__next_index == self.window:
+            self.__next_index = 0
+            # drop the rounding error the running sum picked up over a lap
+            self.__sum = sum(self.__ring)
+
+        if self.__count < self.window:
+            self.__count += 1
+            if self.__count < self.window:
+                return None
+        return round(self.__sum / self.window, 2)
+
+
+if __name__ == "__main__":
+    average_filter = MovingAverageFilter(window=3)
+
+    ## test that the average slides by one read at a time
+    results = [
+        average_filter.add_sample(value) for value in (1.0, 2.0, 3.0, 4.0, 5.0, 30.0)
+    ]
+    assert results == [
+        None,
+        None,
+        2.0,
+        3.0,
+        4.0,
+        13.0,
+    ], "MovingAverageFilter returned the wrong averages"
+
+    ## test that the running sum doesn't drift over many laps
+    for _ in range(100000):
+        average_filter.add_sample(0.1)
+    assert (
+        average_filter.add_sample(0.1) == 0.1
+    ), "MovingAverageFilter's running sum drifted"
+    print("MovingAverageFilter class: all unit tests passed")
@@ -0,0 +1,70 @@
+import bisect
+import os
+import sys
+from collections import deque
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Filters.TemperatureFilter import TemperatureFilter
+
+
+class RunningMedianFilter(TemperatureFilter):
+    """
+    Median of the last window reads, so a single spike never reaches the
+    thermostat. The reads are kept in arrival order and in sorted order,
+    every read replaces the oldest one with a binary search.
+    Returns a value on every read once the first window is full.
+    """
+
+    def __init__(self, window: int):
+        super().__init__(window)
+        self.__arrivals: deque = deque()
+        self.__sorted: list = []
+
+    def add_sample(self, temperature: float):
+        if len(self.__arrivals) == self.window:
+            oldest = self.__arrivals.popleft()
+            del self.__sorted[bisect.bisect_left(self.__sorted, oldest)]
+        self.__arrivals.append(temperature)
+        bisect.insort(self.__sorted, temperature)
+
+        if len(self.__sorted) < self.window:
+            return None
+        middle = self.window // 2
+        if self.window % 2:
+            return round(self.__sorted[middle], 2)
+        return round((self.__sorted[middle - 1] + self.__sorted[middle]) / 2, 2)
+
+
+if __name__ == "__main__":
+    median_filter = RunningMedianFilter(window=3)
+
+    ## test that a single spike is rejected
+    results = [
+        median_filter.add_sample(value) for value in (18.0, 18.2, 60.0, 18.4, 18.6)
+    ]
+    assert results == [
+        None,
+        None,
+        18.2,
+        18.4,
+        18.6,
+    ], "RunningMedianFilter let a spike through"
+
+    ## test an even window
+    even_filter = RunningMedianFilter(window=4)
+    results = [even_filter.add_sample(value) for value in (4.0, 1.0, 3.0, 2.0, 10.0)]
+    assert results == [
+        None,
+        None,
+        None,
+        2.5,
+        2.5,
+    ], "RunningMedianFilter returned the wrong median for an even window"
+    print("RunningMedianFilter class: all unit tests passed")
@@ -0,0 +1,16 @@
+class TemperatureFilter:
+    """
+    Abstract base class. Used as a blueprint only.
+    A temperature filter smooths the raw sensor reads one at a time,
+    in constant memory.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+
+    def add_sample(self, temperature: float):
+        """
+        adds a read, returns the filtered temperature or None
+        if the filter doesn't have enough reads yet
+        """
+        raise NotImplementedError
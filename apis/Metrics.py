@@ -0,0 +1,398 @@
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.Config import METRICS_HOST, METRICS_PORT
+
+## upper bounds in seconds of the histogram buckets, +Inf is implied
+LATENCY_BUCKETS: tuple = (
+    0.00001,
+    0.00005,
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+## names of the metrics recorded by the application
+LOOP_ITERATION_SECONDS = "thermostat_loop_iteration_seconds"
+DB_CALL_SECONDS = "thermostat_db_call_seconds"
+GATEKEEPER_DECISIONS = "thermostat_gatekeeper_decisions_total"
+SENSOR_READS = "thermostat_sensor_reads_total"
+RELAY_COMMANDS = "thermostat_relay_commands_total"
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    Process wide counters and latency histograms, rendered in the
+    Prometheus text format. Every thread records into a shard of its own,
+    so counting never takes a lock or contends with other threads, a scrape
+    sums the shards. The shard of a thread that ended is folded into the
+    retired totals, so short lived request threads don't pile up. Labels are a tuple of (name, value) pairs, a value
+    that is a tuple is rendered comma separated.
+    """
+
+    __shards: list = []  # (weakref to the thread, its dictionary) per live thread
+    __retired: dict = dict()  # totals of the threads that ended
+    __shards_lock = threading.Lock()
+    __local = threading.local()
+    __descriptions: dict = dict()  # metric name -> (type, help text)
+
+    @staticmethod
+    def describe(name: str, metric_type: str, help_text: str):
+        """
+        sets the type (counter or histogram) and help text of a metric
+        """
+        Metrics.__descriptions[name] = (metric_type, help_text)
+
+    @staticmethod
+    def increment(name: str, labels: tuple = (), amount=1):
+        """
+        adds the amount to a counter
+        """
+        shard = Metrics.__get_shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def observe(name: str, seconds: float, labels: tuple = ()):
+        """
+        records a duration in a histogram
+        """
+        shard = Metrics.__get_shard()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            # count per bucket, then the sum and the count of observations
+            histogram = shard[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0]
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    @staticmethod
+    def get_value(name: str, labels: tuple = ()):
+        """
+        returns the total of a counter, or the number of observations
+        of a histogram, over every thread
+        """
+        value = Metrics.__collect().get((name, labels), 0)
+        if isinstance(value, list):
+            return value[-1]
+        return value
+
+    @staticmethod
+    def render():
+        """
+        returns every metric in the Prometheus text exposition format
+        """
+        by_name: dict = dict()  # metric name -> [(labels, value)]
+        for (name, labels), value in sorted(
+            Metrics.__collect().items(), key=lambda item: str(item[0])
+        ):
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines: list = []
+        for name, samples in by_name.items():
+            metric_type, help_text = Metrics.__descriptions.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                if isinstance(value, list):
+                    lines += get_histogram_lines(name, labels, value)
+                else:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def reset():
+        """
+        clears every recorded value, the shards stay registered
+        """
+        with Metrics.__shards_lock:
+            for _, shard in Metrics.__shards:
+                shard.clear()
+            Metrics.__retired.clear()
+
+    @staticmethod
+    def __get_shard():
+        """
+        returns the calling thread's shard, registering it on first use
+        """
+        try:
+            return Metrics.__local.shard  # every call after the thread's first
+        except AttributeError:
+            shard = Metrics.__local.shard = dict()
+            thread_ref = weakref.ref(threading.current_thread())
+            with Metrics.__shards_lock:
+                Metrics.__retire_shards()
+                Metrics.__shards.append((thread_ref, shard))
+        return shard
+
+    @staticmethod
+    def __retire_shards():
+        """
+        folds the shards of the threads that ended into the retired
+        totals, called with the shards lock held
+        """
+        live_shards: list = []
+        for thread_ref, shard in Metrics.__shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live_shards.append((thread_ref, shard))
+            else:
+                add_values(Metrics.__retired, shard)
+        Metrics.__shards[:] = live_shards
+
+    @staticmethod
+    def __collect():
+        """
+        sums the values of every shard
+        """
+        totals: dict = dict()
+        with Metrics.__shards_lock:
+            Metrics.__retire_shards()
+            add_values(totals, Metrics.__retired)
+            shards = [shard for _, shard in Metrics.__shards]
+        for shard in shards:
+            add_values(totals, shard)
+        return totals
+
+
+def add_values(totals: dict, shard: dict):
+    """
+    adds the counters and histograms of a shard to the totals
+    """
+    for key, value in list(shard.items()):
+        if isinstance(value, list):
+            total = totals.setdefault(key, [0] * len(value))
+            for i, bucket in enumerate(list(value)):
+                total[i] += bucket
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def format_labels(labels: tuple, extra: tuple = ()):
+    """
+    renders (name, value) label pairs as {name="value",...}
+    """
+    pairs = []
+    for label, value in labels + extra:
+        if isinstance(value, tuple):
+            value = ",".join([str(item) for item in value])
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{label}="{value}"')
+    if not pairs:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+def get_histogram_lines(name: str, labels: tuple, histogram: list):
+    """
+    renders a histogram's cumulative buckets, sum and count
+    """
+    lines: list = []
+    cumulative = 0
+    for upper_bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram[:-2]):
+        cumulative += count
+        lines.append(
+            f"{name}_bucket{format_labels(labels, (('le', upper_bound),))} {cumulative}"
+        )
+    lines.append(f"{name}_sum{format_labels(labels)} {histogram[-2]}")
+    lines.append(f"{name}_count{format_labels(labels)} {histogram[-1]}")
+    return lines
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics on GET /metrics
+    """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = Metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"MetricsServer::{format % args}")
+
+
+class MetricsServer(threading.Thread):
+    """
+    Background thread serving the metrics over HTTP for Prometheus to scrape,
+    on the local interface by default. If the port can't be bound the
+    application runs on without the endpoint.
+    """
+
+    def __init__(self, host=None, port=None, thread_name="MetricsServer"):
+        threading.Thread.__init__(self, name=thread_name, daemon=True)
+        if not host:
+            self.host = METRICS_HOST
+        else:
+            self.host = host
+        if port is None:
+            self.port = METRICS_PORT
+        else:
+            self.port = port
+        self.server = None
+
+    def start(self):
+        """
+        binds the port and starts serving, logs and returns
+        without serving if the port can't be bound
+        """
+        try:
+            self.server = ThreadingHTTPServer(
+                (self.host, self.port), MetricsRequestHandler
+            )
+        except OSError as e:
+            logger.error(
+                f"MetricsServer::start can't listen on {self.host}:{self.port}, serving no metrics: {str(e)}"
+            )
+            return
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]  # the one picked for port 0
+        threading.Thread.start(self)
+
+    def run(self):
+        logger.info(f"MetricsServer::run serving metrics on port {self.port}")
+        self.server.serve_forever()
+
+    def terminate(self):
+        """
+        stops serving and releases the port
+        """
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+
+
+Metrics.describe(
+    LOOP_ITERATION_SECONDS,
+    "histogram",
+    "Duration of one sensor read or one thermostat decision",
+)
+Metrics.describe(
+    DB_CALL_SECONDS,
+    "histogram",
+    "Duration of DbInterface calls by operation and column",
+)
+Metrics.describe(
+    GATEKEEPER_DECISIONS, "counter", "PowerControlGateKeeper outcomes by request"
+)
+Metrics.describe(
+    SENSOR_READS, "counter", "TemperatureSensorGroup reads by sensor and result"
+)
+Metrics.describe(
+    RELAY_COMMANDS, "counter", "RelayCommandQueue commands by what became of them"
+)
+
+
+if __name__ == "__main__":
+    import urllib.error
+    import urllib.request
+
+    ## test that counters are summed over every thread
+    def count():
+        for _ in range(1000):
+            Metrics.increment("test_total", (("kind", "thread"),))
+
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    Metrics.increment("test_total", (("kind", "thread"),))
+    assert (
+        Metrics.get_value("test_total", (("kind", "thread"),)) == 4001
+    ), "Metrics::increment lost counts"
+
+    ## test that the shards of ended threads are folded, not kept
+    for _ in range(50):
+        thread = threading.Thread(target=count)
+        thread.start()
+        thread.join()
+    assert (
+        Metrics.get_value("test_total", (("kind", "thread"),)) == 54001
+    ), "Metrics lost the counts of ended threads"
+    assert (
+        len(Metrics._Metrics__shards) <= 2
+    ), "Metrics kept the shards of ended threads"
+
+    ## test the histogram buckets
+    labels = (("operation", "read"), ("columns", ("a", "b")))
+    for seconds in (0.00002, 0.0003, 0.0003, 2.0):
+        Metrics.observe("test_seconds", seconds, labels)
+    Metrics.describe("test_seconds", "histogram", "test durations")
+    text = Metrics.render()
+    assert "# TYPE test_seconds histogram" in text, "Metrics::render missed the type"
+    assert (
+        'test_seconds_bucket{operation="read",columns="a,b",le="0.0001"} 1' in text
+    ), "Metrics::render put the observations in the wrong bucket"
+    assert (
+        'test_seconds_bucket{operation="read",columns="a,b",le="0.0005"} 3' in text
+    ), "Metrics::render didn't make the buckets cumulative"
+    assert (
+        'test_seconds_bucket{operation="read",columns="a,b",le="+Inf"} 4' in text
+    ), "Metrics::render missed the +Inf bucket"
+    assert (
+        'test_seconds_count{operation="read",columns="a,b"} 4' in text
+    ), "Metrics::render miscounted the observations"
+    assert 'test_total{kind="thread"} 54001' in text, "Metrics::render missed a counter"
+
+    ## test that counting stays cheap enough to leave on
+    started = time.perf_counter()
+    for _ in range(100000):
+        Metrics.increment("test_total", (("kind", "timing"),))
+    per_call = (time.perf_counter() - started) / 100000
+    assert per_call < 0.00002, f"Metrics::increment takes {per_call * 1e6} us"
+
+    ## test that the server serves the metrics
+    server = MetricsServer(host="127.0.0.1", port=0)
+    server.start()
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as reply:
+        assert reply.status == 200, "MetricsServer didn't serve the metrics"
+        assert reply.headers["Content-Type"] == CONTENT_TYPE
+        assert 'test_total{kind="thread"} 54001' in reply.read().decode("utf-8")
+    try:
+        urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other")
+        assert False, "MetricsServer served an unknown path"
+    except urllib.error.HTTPError as e:
+        assert e.code == 404, "MetricsServer didn't reject an unknown path"
+
+    ## test that a busy port is logged instead of raised
+    logging.disable(logging.ERROR)
+    busy_server = MetricsServer(host="127.0.0.1", port=server.port)
+    busy_server.start()
+    assert not busy_server.is_alive(), "MetricsServer served on a busy port"
+    busy_server.terminate()
+    logging.disable(logging.NOTSET)
+    server.terminate()
+
+    Metrics.reset()
+    assert Metrics.get_value("test_total", (("kind", "thread"),)) == 0
+    print("Metrics class: all unit tests passed")
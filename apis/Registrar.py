@@ -1,17 +1,22 @@
 import os
 import sys
 import logging
+import threading
 from threading import Thread
 from enum import Enum
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 grand_parent_dir = os.path.dirname(parent_dir)
-sys.path.append(parent_dir)
-sys.path.append(grand_parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
 
 from apis.Relays.RelayController import RelayController
 from apis.Sensors.TemperatureSensor import TemperatureSensor
+from apis.Clock import Clock
+from apis.DatabaseAccess.DbTables import DEFAULT_ZONE
 
 logger = logging.getLogger(__name__)
 
@@ -29,8 +34,13 @@ class Registrar:
     __registered_threads: set = (
         set()
     )  # set guarantees that each thread can only be registered once
-    __registered_sensors: dict = dict()
-    __registered_relays: dict = dict()
+    __registered_sensors: dict = dict()  # running mode -> zone id -> sensor
+    __registered_relays: dict = dict()  # running mode -> zone id -> relay
+    __sensor_factories: dict = dict()  # running mode -> zone id -> builds the sensor
+    __relay_factories: dict = dict()  # running mode -> zone id -> builds the relay
+    __factories_lock = threading.Lock()
+    __clock: Clock = Clock()  # system clock unless a simulated one is registered
+    __utility = None  # shared by every component, built on first use
 
     @staticmethod
     def register_thread(new_thread: Thread):
@@ -48,42 +58,151 @@ class Registrar:
 
     @staticmethod
     def register_temperature_sensor(
-        temperature_sensor: TemperatureSensor, running_mode: RunningModes
+        temperature_sensor: TemperatureSensor,
+        running_mode: RunningModes,
+        zone_id=DEFAULT_ZONE,
     ):
         """
-        register a new temeprature sensor instance
+        register a new temeprature sensor instance for a zone
         """
-        Registrar.__registered_sensors[running_mode] = temperature_sensor
+        Registrar.__sensor_factories.get(running_mode, dict()).pop(zone_id, None)
+        Registrar.__registered_sensors.setdefault(running_mode, dict())[
+            zone_id
+        ] = temperature_sensor
 
     @staticmethod
-    def get_temperature_sensor(running_mode: RunningModes):
+    def register_temperature_sensor_factory(
+        factory, running_mode: RunningModes, zone_id=DEFAULT_ZONE
+    ):
+        """
+        register a callable that builds a zone's temperature sensor the first
+        time it is asked for, so drivers of other modes are never built
+        """
+        Registrar.__registered_sensors.get(running_mode, dict()).pop(zone_id, None)
+        Registrar.__sensor_factories.setdefault(running_mode, dict())[zone_id] = factory
+
+    @staticmethod
+    def get_temperature_sensor(running_mode: RunningModes, zone_id=DEFAULT_ZONE):
         """
-        get a registered temperature sensor
+        get the temperature sensor registered for a zone
         """
-        if running_mode in Registrar.__registered_sensors:
-            return Registrar.__registered_sensors[running_mode]
+        zone_sensors: dict = Registrar.__registered_sensors.get(running_mode, dict())
+        if zone_id in zone_sensors:
+            return zone_sensors[zone_id]
+        elif zone_id in Registrar.__sensor_factories.get(running_mode, dict()):
+            return Registrar.__build(
+                Registrar.__sensor_factories,
+                Registrar.__registered_sensors,
+                running_mode,
+                zone_id,
+            )
         else:
             raise KeyError(
-                f"Registrar::get_temperature_sensor {running_mode} is not registered"
+                f"Registrar::get_temperature_sensor {running_mode} zone {zone_id} is not registered"
             )
 
     @staticmethod
     def register_relay_controllers(
-        relay_controller: RelayController, running_mode: RunningModes
+        relay_controller: RelayController,
+        running_mode: RunningModes,
+        zone_id=DEFAULT_ZONE,
     ):
         """
-        register a new relay controller instance
+        register a new relay controller instance for a zone
         """
-        Registrar.__registered_relays[running_mode] = relay_controller
+        Registrar.__relay_factories.get(running_mode, dict()).pop(zone_id, None)
+        Registrar.__registered_relays.setdefault(running_mode, dict())[
+            zone_id
+        ] = relay_controller
 
     @staticmethod
-    def get_relay_controllers(running_mode: RunningModes):
+    def register_relay_controller_factory(
+        factory, running_mode: RunningModes, zone_id=DEFAULT_ZONE
+    ):
+        """
+        register a callable that builds a zone's relay controller the first
+        time it is asked for, so drivers of other modes are never built
         """
-        get a registered relay controller
+        Registrar.__registered_relays.get(running_mode, dict()).pop(zone_id, None)
+        Registrar.__relay_factories.setdefault(running_mode, dict())[zone_id] = factory
+
+    @staticmethod
+    def get_relay_controllers(running_mode: RunningModes, zone_id=DEFAULT_ZONE):
         """
-        if running_mode in Registrar.__registered_relays:
-            return Registrar.__registered_relays[running_mode]
+        get the relay controller registered for a zone
+        """
+        zone_relays: dict = Registrar.__registered_relays.get(running_mode, dict())
+        if zone_id in zone_relays:
+            return zone_relays[zone_id]
+        elif zone_id in Registrar.__relay_factories.get(running_mode, dict()):
+            return Registrar.__build(
+                Registrar.__relay_factories,
+                Registrar.__registered_relays,
+                running_mode,
+                zone_id,
+            )
         else:
             raise KeyError(
-                f"Registrar::get_relay_controllers {running_mode} is not registered"
+                f"Registrar::get_relay_controllers {running_mode} zone {zone_id} is not registered"
             )
+
+    @staticmethod
+    def get_registered_zones(running_mode: RunningModes):
+        """
+        get the sorted ids of the zones with both a sensor and a relay
+        controller, built or not
+        """
+        zone_sensors: set = set(
+            Registrar.__registered_sensors.get(running_mode, dict())
+        ) | set(Registrar.__sensor_factories.get(running_mode, dict()))
+        zone_relays: set = set(
+            Registrar.__registered_relays.get(running_mode, dict())
+        ) | set(Registrar.__relay_factories.get(running_mode, dict()))
+        return sorted(zone_sensors & zone_relays)
+
+    @staticmethod
+    def register_clock(clock: Clock):
+        """
+        register the clock every component reads the time from
+        """
+        Registrar.__clock = clock
+
+    @staticmethod
+    def get_clock():
+        """
+        get the registered clock
+        """
+        return Registrar.__clock
+
+    @staticmethod
+    def register_utility(utility):
+        """
+        register the Utility every component shares
+        """
+        Registrar.__utility = utility
+
+    @staticmethod
+    def get_utility():
+        """
+        get the shared Utility, built on first use
+        """
+        if Registrar.__utility is None:
+            from apis.Utility import Utility  # it imports the Registrar
+
+            Registrar.__utility = Utility()
+        return Registrar.__utility
+
+    @staticmethod
+    def __build(factories: dict, instances: dict, running_mode, zone_id):
+        """
+        builds a zone's driver with its factory once and keeps the instance
+        """
+        with Registrar.__factories_lock:
+            zone_instances: dict = instances.setdefault(running_mode, dict())
+            if zone_id not in zone_instances:
+                factory = factories[running_mode].pop(zone_id)
+                logger.info(
+                    f"Registrar::__build building the {running_mode.value} driver of zone {zone_id}"
+                )
+                zone_instances[zone_id] = factory()
+            return zone_instances[zone_id]
@@ -7,17 +7,26 @@ from enum import Enum
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 grand_parent_dir = os.path.dirname(parent_dir)
-sys.path.append(parent_dir)
-sys.path.append(grand_parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
 
-from apis.Utility import Utility
 from apis.DatabaseAccess.DbTables import SharedDataColumns
 from apis.DatabaseAccess.DbInterface import DbInterface
 from apis.Relays.RelayController import RelayController
 from apis.Config import DeviceStatus
 from apis.Registrar import Registrar
+from apis.Metrics import Metrics, GATEKEEPER_DECISIONS
 from apis.Config import RUNNING_MODE, MINIMUM_ON_TIME, COOL_DOWN_PERIOD
 
+## looked up once, the thermostat asks for a decision on every published temperature
+DEVICE_STATUS_COLUMN = SharedDataColumns.DEVICE_STATUS.value
+LAST_TURNED_ON_COLUMN = SharedDataColumns.LAST_TURNED_ON.value
+LAST_TURNED_OFF_COLUMN = SharedDataColumns.LAST_TURNED_OFF.value
+DEVICE_ON = DeviceStatus.ON.value
+DEVICE_OFF = DeviceStatus.OFF.value
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,6 +37,8 @@ class States(Enum):
     TURNED_OFF = "TURNED_OFF"
     REQUEST_DENIED = "REQUEST_DENIED"
     NO_ACTION = "NO_ACTION"
+    STATE_CHANGED = "STATE_CHANGED"
+    QUEUED = "QUEUED"  # handed to the RelayCommandQueue, decided later
 
 
 class PowerControlGateKeeper:
@@ -37,38 +48,83 @@ class PowerControlGateKeeper:
     outlined in the configs.
     """
 
-    def __init__(self, db_interface: DbInterface):
+    def __init__(
+        self, db_interface: DbInterface, minimum_on_time=None, cool_down_period=None
+    ):
         self.relay_controller: RelayController = Registrar.get_relay_controllers(
-            RUNNING_MODE
+            RUNNING_MODE, db_interface.zone_id
         )
         self.db_interface: DbInterface = db_interface
-        self.utility = Utility()
+        self.utility = Registrar.get_utility()
+
+        if minimum_on_time is None:
+            self.minimum_on_time = MINIMUM_ON_TIME
+        else:
+            self.minimum_on_time = minimum_on_time
+
+        if cool_down_period is None:
+            self.cool_down_period = COOL_DOWN_PERIOD
+        else:
+            self.cool_down_period = cool_down_period
+
+    def turn_on(self, effective_temperature=0.0, reason="", state: dict = None):
+        """
+        Goes through a decision making process to determine
+        whether it's safe to trigger the relay controller.
+        The decision is made on one snapshot of the device state, read
+        here unless given, and only committed if the status is unchanged
+        """
+        result = self.__turn_on(effective_temperature, reason, state)
+        Metrics.increment(
+            GATEKEEPER_DECISIONS, (("request", "turn_on"), ("result", result.value))
+        )
+        return result
 
-    def turn_on(self, effective_temperature=0.0, reason=""):
+    def turn_off(self, effective_temperature=0.0, reason="", state: dict = None):
         """
         Goes through a decision making process to determine
-        whether it's safe to trigger the relay controller
+        whether it's safe to trigger the relay controller.
+        The decision is made on one snapshot of the device state, read
+        here unless given, and only committed if the status is unchanged
+        """
+        result = self.__turn_off(effective_temperature, reason, state)
+        Metrics.increment(
+            GATEKEEPER_DECISIONS, (("request", "turn_off"), ("result", result.value))
+        )
+        return result
+
+    def __turn_on(self, effective_temperature, reason, state: dict):
+        """
+        decides whether the device can be turned on, see turn_on
         """
-        if (
-            self.db_interface.read_column(SharedDataColumns.DEVICE_STATUS.value)
-            == DeviceStatus.ON.value
-        ):
+        if state is None:
+            state = self.db_interface.read_device_state()
+        device_status = state[DEVICE_STATUS_COLUMN]
+        if device_status == DEVICE_ON:
             message = "PowerControlGateKeeper::turn_on, device is already on, nothing to do here"
             logger.info(message)
             return States.ALREADY_ON
 
-        last_turned_off: str = self.db_interface.read_column(
-            SharedDataColumns.LAST_TURNED_OFF.value
-        )
-        if not last_turned_off:
-            self.relay_controller.turn_on(effective_temperature, reason=reason)
-            return States.TURNED_ON
+        last_turned_off: float = state[LAST_TURNED_OFF_COLUMN]
+        if last_turned_off is None:
+            return self.__commit(
+                self.relay_controller.turn_on,
+                device_status,
+                effective_temperature,
+                reason,
+                States.TURNED_ON,
+            )
 
         time_difference = self.utility.get_time_delta(last_turned_off)
-        if time_difference >= COOL_DOWN_PERIOD:
-            self.relay_controller.turn_on(effective_temperature, reason=reason)
+        if time_difference >= self.cool_down_period:
             logger.warn("PowerControlGateKeeper::turn_on turning device on")
-            return States.TURNED_ON
+            return self.__commit(
+                self.relay_controller.turn_on,
+                device_status,
+                effective_temperature,
+                reason,
+                States.TURNED_ON,
+            )
 
         else:
             logger.warn(
@@ -76,39 +132,123 @@ class PowerControlGateKeeper:
             )
             return States.REQUEST_DENIED
 
-    def turn_off(self, effective_temperature=0.0, reason=""):
+    def __turn_off(self, effective_temperature, reason, state: dict):
         """
-        Goes through a decision making process to determine
-        whether it's safe to trigger the relay controller
+        decides whether the device can be turned off, see turn_off
         """
         successful_log_msg = "PowerControlGateKeeper::turn_off turning device off"
 
-        if (
-            self.db_interface.read_column(SharedDataColumns.DEVICE_STATUS.value)
-            == DeviceStatus.OFF.value
-        ):
+        if state is None:
+            state = self.db_interface.read_device_state()
+        device_status = state[DEVICE_STATUS_COLUMN]
+        if device_status == DEVICE_OFF:
             logger.info(
                 "PowerControlGateKeeper::turn_off, device is already off, nothing to do here"
             )
             return States.ALREADY_OFF
 
-        last_turned_on: str = self.db_interface.read_column(
-            SharedDataColumns.LAST_TURNED_ON.value
-        )
-        if not last_turned_on:
-            self.relay_controller.turn_off(effective_temperature, reason=reason)
+        last_turned_on: float = state[LAST_TURNED_ON_COLUMN]
+        if last_turned_on is None:
             logger.warn(successful_log_msg)
-            return States.TURNED_OFF
+            return self.__commit(
+                self.relay_controller.turn_off,
+                device_status,
+                effective_temperature,
+                reason,
+                States.TURNED_OFF,
+            )
 
         time_difference = self.utility.get_time_delta(last_turned_on)
 
-        if time_difference >= MINIMUM_ON_TIME:
-            self.relay_controller.turn_off(effective_temperature, reason=reason)
+        if time_difference >= self.minimum_on_time:
             logger.warn(successful_log_msg)
-            return States.TURNED_OFF
+            return self.__commit(
+                self.relay_controller.turn_off,
+                device_status,
+                effective_temperature,
+                reason,
+                States.TURNED_OFF,
+            )
 
         else:
             logger.warn(
                 "PowerControlGateKeeper::turn_off Unable to turn device off, device needs to be on for a minimum period of time"
             )
             return States.REQUEST_DENIED
+
+    def __commit(self, switch, device_status, effective_temperature, reason, result):
+        """
+        triggers the relay, which commits the new status only if the device
+        status is still the snapshot's. Returns the given result, or
+        STATE_CHANGED if another thread switched the device in between
+        """
+        if switch(effective_temperature, reason=reason, expected_status=device_status):
+            return result
+        logger.warn(
+            "PowerControlGateKeeper::__commit device status changed since it was read, nothing done"
+        )
+        return States.STATE_CHANGED
+
+
+if __name__ == "__main__":
+    import tempfile
+    from apis.DatabaseAccess.DbTables import DbTables, DB_NAME
+    from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+    from apis.Relays.RelayControllerSim import RelayControllerSim
+    from apis.StateTransitionRecorder import StateTransitionRecorder
+
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the database and records out of the way
+        table_creator = DbTables()
+        table_creator.create_shared_data_table()
+        table_creator.create_rollup_tables()
+        table_creator.create_state_transition_table()
+        db_api = DbInterface()
+        Registrar.register_relay_controllers(
+            RelayControllerSim(db_interface=db_api), RUNNING_MODE
+        )
+        gate_keeper = PowerControlGateKeeper(
+            db_interface=db_api, minimum_on_time=0, cool_down_period=0
+        )
+
+        ## test that a decision on a snapshot is committed
+        snapshot = db_api.read_device_state()
+        assert (
+            gate_keeper.turn_on(17.0, reason="test", state=snapshot) == States.TURNED_ON
+        ), "PowerControlGateKeeper::turn_on didn't turn the device on"
+
+        ## test that a decision on a stale snapshot isn't committed
+        last_turned_on = db_api.read_column(SharedDataColumns.LAST_TURNED_ON.value)
+        assert (
+            gate_keeper.turn_on(17.0, reason="test", state=snapshot)
+            == States.STATE_CHANGED
+        ), "PowerControlGateKeeper::turn_on acted on a stale snapshot"
+        assert (
+            db_api.read_column(SharedDataColumns.LAST_TURNED_ON.value) == last_turned_on
+        ), "PowerControlGateKeeper::turn_on overwrote the last on time"
+
+        ## test that a snapshot is read when none is given
+        assert (
+            gate_keeper.turn_on(17.0, reason="test") == States.ALREADY_ON
+        ), "PowerControlGateKeeper::turn_on didn't read the current state"
+        assert (
+            gate_keeper.turn_off(17.0, reason="test") == States.TURNED_OFF
+        ), "PowerControlGateKeeper::turn_off didn't turn the device off"
+
+        ## test that every outcome is counted
+        assert (
+            Metrics.get_value(
+                GATEKEEPER_DECISIONS,
+                (("request", "turn_on"), ("result", States.STATE_CHANGED.value)),
+            )
+            == 1
+        ), "PowerControlGateKeeper didn't count the decision"
+
+        StateTransitionRecorder.terminate_all()
+        db_api.close()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print("PowerControlGateKeeper class: all unit tests passed")
@@ -0,0 +1,290 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Config import DeviceStatus, RELAY_COMMAND_DELAY
+from apis.Metrics import Metrics, RELAY_COMMANDS
+from apis.Relays.PowerControlGateKeeper import PowerControlGateKeeper, States
+
+logger = logging.getLogger(__name__)
+
+
+class RelayCommandQueue(threading.Thread):
+    """
+    Background thread that switches the relays of every zone, so the
+    thermostats only queue the status they want. A zone has at most one
+    pending command: a newer one replaces it, and a command for the status
+    the device already has is dropped, so a temperature flapping around
+    the target within the delay switches nothing. The device status is
+    cached from the thermostats' snapshots and the gatekeeper's results,
+    only commands that would change it reach the gatekeeper.
+    """
+
+    __shared_queue = None  # the queue every thermostat uses unless given one
+    __shared_queue_lock = threading.Lock()
+
+    def __init__(self, delay=None, thread_name="RelayCommandQueue"):
+        threading.Thread.__init__(self, name=thread_name, daemon=True)
+        if delay is None:
+            self.delay = RELAY_COMMAND_DELAY
+        else:
+            self.delay = delay
+
+        self.merged_commands: int = 0  # replaced by a newer command of the zone
+        self.dropped_commands: int = 0  # the device already had the status
+        self.executed_commands: int = 0  # handed to the gatekeeper
+        ## zone id -> (gate keeper, turn on, effective temperature, reason)
+        self.__pending: dict = dict()
+        self.__device_status: dict = dict()  # zone id -> last known device status
+        self.__busy = False  # pending commands were taken and are being executed
+        self.__stopping = False
+        self.__condition = threading.Condition()
+
+    @staticmethod
+    def get_queue():
+        """
+        returns the running queue shared by every thermostat,
+        starting it on first use
+        """
+        with RelayCommandQueue.__shared_queue_lock:
+            if RelayCommandQueue.__shared_queue is None:
+                RelayCommandQueue.__shared_queue = RelayCommandQueue()
+                RelayCommandQueue.__shared_queue.start()
+            return RelayCommandQueue.__shared_queue
+
+    @staticmethod
+    def terminate_all():
+        """
+        executes every pending command and stops the shared queue
+        """
+        with RelayCommandQueue.__shared_queue_lock:
+            shared_queue = RelayCommandQueue.__shared_queue
+            RelayCommandQueue.__shared_queue = None
+        if shared_queue:
+            shared_queue.terminate()
+
+    def submit(
+        self,
+        gate_keeper: PowerControlGateKeeper,
+        turn_on: bool,
+        effective_temperature=0.0,
+        reason="",
+        device_status=None,
+    ):
+        """
+        queues turning a zone's device on or off, given the device status
+        the decision was made on. Returns QUEUED, or ALREADY_ON/ALREADY_OFF
+        if the command was dropped as the device already has that status.
+        """
+        zone_id = gate_keeper.db_interface.zone_id
+        status = DeviceStatus.ON.value if turn_on else DeviceStatus.OFF.value
+        with self.__condition:
+            if device_status is not None:
+                self.__device_status[zone_id] = device_status
+            if zone_id in self.__pending:
+                del self.__pending[zone_id]
+                self.merged_commands += 1
+                self.__count("merged")
+            if self.__device_status.get(zone_id) == status:
+                self.dropped_commands += 1
+                self.__count("dropped")
+                return States.ALREADY_ON if turn_on else States.ALREADY_OFF
+            self.__pending[zone_id] = (
+                gate_keeper,
+                turn_on,
+                effective_temperature,
+                reason,
+            )
+            self.__count("queued")
+            self.__condition.notify_all()
+        return States.QUEUED
+
+    def cancel(self, zone_id):
+        """
+        drops a zone's pending command and forgets its device status,
+        called when the device is switched without the queue
+        """
+        with self.__condition:
+            if self.__pending.pop(zone_id, None):
+                self.merged_commands += 1
+                self.__count("merged")
+            self.__device_status.pop(zone_id, None)
+
+    def flush(self):
+        """
+        blocks until every queued command is executed
+        """
+        with self.__condition:
+            self.__condition.notify_all()
+            while (self.__pending or self.__busy) and self.is_alive():
+                self.__condition.wait(0.1)
+
+    def run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__stopping:
+                    self.__condition.wait()
+                if self.__stopping and not self.__pending:
+                    return
+                ## let the command settle, newer ones replace it meanwhile
+                deadline = time.monotonic() + self.delay
+                while not self.__stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+                commands = list(self.__pending.items())
+                self.__pending.clear()
+                self.__busy = True
+
+            for zone_id, command in commands:
+                self.__execute(zone_id, *command)
+            with self.__condition:
+                self.__busy = False
+                self.__condition.notify_all()
+
+    def terminate(self):
+        """
+        executes whatever is still pending, then stops the thread
+        """
+        with self.__condition:
+            self.__stopping = True
+            self.__condition.notify_all()
+        if self.is_alive():
+            self.join()
+
+    def __execute(
+        self,
+        zone_id,
+        gate_keeper: PowerControlGateKeeper,
+        turn_on: bool,
+        effective_temperature,
+        reason,
+    ):
+        """
+        hands a command to the gatekeeper, which reads the current state
+        and applies the safety rules, and caches the resulting status
+        """
+        try:
+            if turn_on:
+                result = gate_keeper.turn_on(effective_temperature, reason=reason)
+            else:
+                result = gate_keeper.turn_off(effective_temperature, reason=reason)
+        except Exception as e:
+            logger.error(
+                f"RelayCommandQueue::__execute zone {zone_id} command failed, exception: {str(e)}"
+            )
+            result = None
+        self.__count("executed")
+
+        with self.__condition:
+            self.executed_commands += 1
+            if result in (States.TURNED_ON, States.ALREADY_ON):
+                self.__device_status[zone_id] = DeviceStatus.ON.value
+            elif result in (States.TURNED_OFF, States.ALREADY_OFF):
+                self.__device_status[zone_id] = DeviceStatus.OFF.value
+            else:
+                ## denied or switched by another thread, the status is unknown
+                self.__device_status.pop(zone_id, None)
+
+    def __count(self, result: str):
+        Metrics.increment(RELAY_COMMANDS, (("result", result),))
+
+
+if __name__ == "__main__":
+    import tempfile
+    from apis.Config import RUNNING_MODE
+    from apis.DatabaseAccess.DbTables import DbTables, SharedDataColumns, DB_NAME
+    from apis.DatabaseAccess.DbInterface import DbInterface
+    from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+    from apis.Registrar import Registrar
+    from apis.Relays.RelayControllerSim import RelayControllerSim
+    from apis.StateTransitionRecorder import StateTransitionRecorder
+
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the database and records out of the way
+        table_creator = DbTables()
+        table_creator.create_shared_data_table()
+        table_creator.create_rollup_tables()
+        table_creator.create_state_transition_table()
+        db_api = DbInterface()
+        Registrar.register_relay_controllers(
+            RelayControllerSim(db_interface=db_api), RUNNING_MODE
+        )
+        gate_keeper = PowerControlGateKeeper(
+            db_interface=db_api, minimum_on_time=0, cool_down_period=0
+        )
+
+        def read_status():
+            return db_api.read_column(SharedDataColumns.DEVICE_STATUS.value)
+
+        relay_queue = RelayCommandQueue(delay=0.2)
+        relay_queue.start()
+
+        ## test that a command is executed after the delay
+        assert (
+            relay_queue.submit(gate_keeper, True, 17.0, "test", read_status())
+            == States.QUEUED
+        )
+        assert read_status() == DeviceStatus.OFF.value, "RelayCommandQueue didn't wait"
+        relay_queue.flush()
+        assert (
+            read_status() == DeviceStatus.ON.value
+        ), "RelayCommandQueue didn't turn the device on"
+
+        ## test that a no-op against the cached status is dropped
+        assert relay_queue.submit(gate_keeper, True, 17.0, "test") == States.ALREADY_ON
+        assert relay_queue.dropped_commands == 1
+
+        ## test that flapping commands are merged and switch nothing
+        executed = relay_queue.executed_commands
+        for i in range(10):
+            relay_queue.submit(gate_keeper, i % 2 == 1, 17.0, "test")
+        relay_queue.flush()
+        assert relay_queue.merged_commands == 5, "RelayCommandQueue didn't merge"
+        assert relay_queue.executed_commands == executed
+        assert read_status() == DeviceStatus.ON.value
+
+        ## test that only the latest command of a burst is executed
+        for i in range(5):
+            relay_queue.submit(gate_keeper, i % 2 == 1, 17.0, "test")
+        relay_queue.flush()
+        assert relay_queue.executed_commands == executed + 1
+        assert (
+            read_status() == DeviceStatus.OFF.value
+        ), "RelayCommandQueue didn't execute the latest command"
+
+        ## test that a cancelled command isn't executed
+        relay_queue.submit(gate_keeper, True, 17.0, "test")
+        relay_queue.cancel(db_api.zone_id)
+        relay_queue.flush()
+        assert read_status() == DeviceStatus.OFF.value
+        assert (
+            Metrics.get_value(RELAY_COMMANDS, (("result", "merged"),))
+            == relay_queue.merged_commands
+        ), "RelayCommandQueue didn't count the merged commands"
+
+        ## test that terminating executes the pending command
+        relay_queue.submit(gate_keeper, True, 17.0, "test")
+        relay_queue.terminate()
+        assert read_status() == DeviceStatus.ON.value
+        assert not relay_queue.is_alive()
+
+        StateTransitionRecorder.terminate_all()
+        db_api.close()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print("RelayCommandQueue class: all unit tests passed")
@@ -1,19 +1,21 @@
 import os
 import sys
 import logging
-import datetime
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 grand_parent_dir = os.path.dirname(parent_dir)
-sys.path.append(parent_dir)
-sys.path.append(grand_parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
 
 from apis.Relays.RelayController import RelayController
-from apis.Utility import Utility
-from apis.DatabaseAccess.DbTables import SharedDataColumns
+from apis.StateTransitionRecorder import StateTransitionRecorder
+from apis.DatabaseAccess.DbTables import DbTables, SharedDataColumns
 from apis.DatabaseAccess.DbInterface import DbInterface
 from apis.Config import DeviceStatus
+from apis.Registrar import Registrar
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +26,16 @@ class RelayControllerSim(RelayController):
     relay controller class.
     """
 
-    def __init__(self, db_interface: DbInterface):
+    def __init__(
+        self, db_interface: DbInterface, recorder: StateTransitionRecorder = None
+    ):
         self.current_state: bool = False
         self.db_interface: DbInterface = db_interface
-        self.utility = Utility()
+        if not recorder:
+            self.recorder = StateTransitionRecorder.get_recorder(db_interface.db_name)
+        else:
+            self.recorder = recorder
+        self.recorder.start_session(db_interface.zone_id)
 
     def setup(self):
         """
@@ -35,20 +43,33 @@ class RelayControllerSim(RelayController):
         """
         pass
 
-    def turn_on(self, effective_temperature: float = 0.0, reason=""):
+    def turn_on(
+        self, effective_temperature: float = 0.0, reason="", expected_status=None
+    ):
         """
         Simulates turning on the device connected to the power relay.
+        Given an expected status, the new status is only committed if the
+        device still has it, otherwise returns False without switching.
         """
-        self.current_state = True
         try:
             columns: tuple = (
                 SharedDataColumns.DEVICE_STATUS.value,
                 SharedDataColumns.LAST_TURNED_ON.value,
             )
-            new_values: tuple = (DeviceStatus.ON.value, datetime.datetime.now())
-            self.db_interface.update_multiple_columns(columns, new_values)
+            timestamp = Registrar.get_clock().time()
+            new_values: tuple = (DeviceStatus.ON.value, timestamp)
+            if expected_status is None:
+                self.db_interface.update_multiple_columns(columns, new_values)
+            elif not self.db_interface.compare_and_swap(
+                SharedDataColumns.DEVICE_STATUS.value,
+                expected_status,
+                columns,
+                new_values,
+            ):
+                return False
+            self.current_state = True
             state_info: tuple = (self.current_state, effective_temperature, reason)
-            self.utility.record_state_transition(state_info)
+            self.recorder.record(self.db_interface.zone_id, state_info, timestamp)
             return True
         except Exception as e:
             logger.error(
@@ -56,20 +77,33 @@ class RelayControllerSim(RelayController):
             )
             return False
 
-    def turn_off(self, effective_temperature: float = 0.0, reason=""):
+    def turn_off(
+        self, effective_temperature: float = 0.0, reason="", expected_status=None
+    ):
         """
         Simulates turning off the device connected to the power relay.
+        Given an expected status, the new status is only committed if the
+        device still has it, otherwise returns False without switching.
         """
-        self.current_state = False
         try:
             columns: tuple = (
                 SharedDataColumns.DEVICE_STATUS.value,
                 SharedDataColumns.LAST_TURNED_OFF.value,
             )
-            new_values: tuple = (DeviceStatus.OFF.value, datetime.datetime.now())
-            self.db_interface.update_multiple_columns(columns, new_values)
+            timestamp = Registrar.get_clock().time()
+            new_values: tuple = (DeviceStatus.OFF.value, timestamp)
+            if expected_status is None:
+                self.db_interface.update_multiple_columns(columns, new_values)
+            elif not self.db_interface.compare_and_swap(
+                SharedDataColumns.DEVICE_STATUS.value,
+                expected_status,
+                columns,
+                new_values,
+            ):
+                return False
+            self.current_state = False
             state_info: tuple = (self.current_state, effective_temperature, reason)
-            self.utility.record_state_transition(state_info)
+            self.recorder.record(self.db_interface.zone_id, state_info, timestamp)
             return True
         except Exception as e:
             logger.error(
@@ -79,6 +113,9 @@ class RelayControllerSim(RelayController):
 
 
 if __name__ == "__main__":
+    DbTables().create_shared_data_table()
+    DbTables().create_rollup_tables()
+    DbTables().create_state_transition_table()
     db_api = DbInterface()
     controller = RelayControllerSim(db_interface=db_api)
     assert (
@@ -105,4 +142,23 @@ if __name__ == "__main__":
         == DeviceStatus.OFF.value
     ), "RelayControllerSim failed to turn off device"
 
+    ## test that a stale expected status doesn't switch the device
+    assert not controller.turn_off(
+        expected_status=DeviceStatus.ON.value
+    ), "RelayControllerSim switched a device whose status changed"
+    assert (
+        controller.db_interface.read_column(SharedDataColumns.DEVICE_STATUS.value)
+        == DeviceStatus.OFF.value
+    ), "RelayControllerSim committed over a changed status"
+
+    ## test that both transitions are recorded in the background
+    controller.recorder.flush()
+    assert [
+        transition["state_change"]
+        for transition in controller.recorder.store.get_last_transitions(2)
+    ] == [
+        "Device Turned On",
+        "Device Turned Off",
+    ], "RelayControllerSim failed to record the state transitions"
+
     print("RelayControllerSim class: all unit tests passed")
@@ -0,0 +1,195 @@
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Config import SENSOR_FUSION, SENSOR_READ_DEADLINE, SensorFusions
+from apis.Metrics import Metrics, SENSOR_READS
+from apis.Sensors.TemperatureSensor import TemperatureSensor
+
+logger = logging.getLogger(__name__)
+
+
+class TemperatureSensorGroup(TemperatureSensor):
+    """
+    Reads several sensors of a zone in parallel, one pool thread per sensor,
+    and combines the reads that came back before the deadline. A sensor
+    that is late or fails is stale for that read; a late read keeps running
+    and the sensor isn't read again until it finished, so a hung sensor
+    holds up neither the loop nor the pool threads of the other sensors.
+    A read takes about as long as the slowest healthy sensor, not the sum.
+    """
+
+    def __init__(self, sensors: list, fusion: SensorFusions = None, deadline=None):
+        if not sensors:
+            raise ValueError(
+                "TemperatureSensorGroup::__init__ needs at least one sensor"
+            )
+        self.sensors: list = list(sensors)
+        if not fusion:
+            self.fusion = SENSOR_FUSION
+        else:
+            self.fusion = fusion
+        if not deadline:
+            self.deadline = SENSOR_READ_DEADLINE
+        else:
+            self.deadline = deadline
+
+        self.stale_sensors: set = set()  # sensors left out of the last read
+        self.__pending: dict = dict()  # sensor index -> read still running
+        self.__executor = ThreadPoolExecutor(
+            max_workers=len(self.sensors), thread_name_prefix="TemperatureSensorGroup"
+        )
+
+    def get_temperature(self, device_status: bool = False):
+        """
+        reads every sensor that isn't busy with a late read and returns the
+        fused temperature of the fresh reads, None if there isn't any
+        """
+        ## a late read that finished since is dropped, it is out of date
+        for index in [i for i, future in self.__pending.items() if future.done()]:
+            del self.__pending[index]
+        fresh: dict = dict()  # sensor index -> read started now
+        for index, sensor in enumerate(self.sensors):
+            if index not in self.__pending:
+                fresh[index] = self.__pending[index] = self.__executor.submit(
+                    sensor.get_temperature, device_status
+                )
+        wait(fresh.values(), timeout=self.deadline)
+
+        reads: dict = dict()  # sensor index -> temperature
+        self.stale_sensors = set()
+        for index in range(len(self.sensors)):
+            future = fresh.get(index)
+            if not future or not future.done():
+                self.__count(index, "late")
+                self.stale_sensors.add(index)
+                continue
+            del self.__pending[index]
+            try:
+                temperature = future.result()
+            except Exception as e:
+                logger.warn(
+                    f"TemperatureSensorGroup::get_temperature sensor {index} failed, exception: {str(e)}"
+                )
+                temperature = None
+            if temperature is None:
+                self.__count(index, "failed")
+                self.stale_sensors.add(index)
+                continue
+            self.__count(index, "ok")
+            reads[index] = temperature
+
+        if self.stale_sensors:
+            logger.warn(
+                f"TemperatureSensorGroup::get_temperature stale sensors: {sorted(self.stale_sensors)}"
+            )
+        return self.__fuse(reads)
+
+    def close(self):
+        """
+        stops the pool without waiting for late reads
+        """
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def __fuse(self, reads: dict):
+        """
+        combines the fresh reads, keyed by sensor index
+        """
+        if not reads:
+            return None
+        if self.fusion == SensorFusions.MEAN:
+            return sum(reads.values()) / len(reads)
+        elif self.fusion == SensorFusions.MEDIAN:
+            return statistics.median(reads.values())
+        elif self.fusion == SensorFusions.PRIMARY:
+            return reads[min(reads)]
+        raise ValueError(
+            f"TemperatureSensorGroup::__fuse {self.fusion} is not a supported fusion"
+        )
+
+    def __count(self, index: int, result: str):
+        Metrics.increment(SENSOR_READS, (("sensor", str(index)), ("result", result)))
+
+
+class SlowSensor(TemperatureSensor):
+    """
+    Fake sensor that takes the given number of seconds to return a fixed
+    temperature, like a 1-wire conversion, or raises if it is broken
+    """
+
+    def __init__(self, temperature: float, delay: float, broken=False):
+        self.temperature = temperature
+        self.delay = delay
+        self.broken = broken
+
+    def get_temperature(self, device_status: bool = False):
+        time.sleep(self.delay)
+        if self.broken:
+            raise OSError("SlowSensor is broken")
+        return self.temperature
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+
+    ## test that the sensors are read in parallel
+    sensors = [SlowSensor(17.0, 0.2), SlowSensor(17.4, 0.2), SlowSensor(19.0, 0.2)]
+    group = TemperatureSensorGroup(sensors, SensorFusions.MEDIAN, deadline=0.5)
+    started = time.perf_counter()
+    assert group.get_temperature() == 17.4, "TemperatureSensorGroup median is wrong"
+    elapsed = time.perf_counter() - started
+    assert (
+        elapsed < 0.35
+    ), f"TemperatureSensorGroup took {elapsed} seconds for 3 reads of 0.2 seconds"
+    assert not group.stale_sensors
+    group.close()
+
+    ## test the fusions
+    group = TemperatureSensorGroup(sensors, SensorFusions.MEAN, deadline=0.5)
+    assert abs(group.get_temperature() - 17.8) < 1e-9
+    group.close()
+    group = TemperatureSensorGroup(sensors, SensorFusions.PRIMARY, deadline=0.5)
+    assert group.get_temperature() == 17.0
+    group.close()
+
+    ## test that a slow sensor is stale and doesn't hold up the read
+    sensors = [SlowSensor(17.0, 1.0), SlowSensor(18.0, 0.1), SlowSensor(18.2, 0.1)]
+    group = TemperatureSensorGroup(sensors, SensorFusions.PRIMARY, deadline=0.3)
+    started = time.perf_counter()
+    assert group.get_temperature() == 18.0, "TemperatureSensorGroup didn't fall back"
+    assert group.stale_sensors == {0}
+    ## the late read keeps running, the sensor isn't read again meanwhile
+    assert group.get_temperature() == 18.0
+    elapsed = time.perf_counter() - started
+    assert elapsed < 0.9, f"TemperatureSensorGroup waited {elapsed} seconds"
+    ## a late read is dropped once it finished, the next one is used
+    sensors[0].temperature, sensors[0].delay = 16.0, 0.0
+    time.sleep(1.0)
+    assert (
+        group.get_temperature() == 16.0
+    ), "TemperatureSensorGroup used a late read or didn't read the sensor again"
+    assert not group.stale_sensors
+    group.close()
+
+    ## test that a failed sensor is stale and no read at all gives None
+    sensors = [SlowSensor(17.0, 0.0, broken=True), SlowSensor(18.0, 0.0)]
+    group = TemperatureSensorGroup(sensors, SensorFusions.MEAN, deadline=0.3)
+    assert group.get_temperature() == 18.0
+    assert group.stale_sensors == {0}
+    sensors[1].broken = True
+    assert group.get_temperature() is None
+    assert group.stale_sensors == {0, 1}
+    group.close()
+
+    print("TemperatureSensorGroup class: all unit tests passed")
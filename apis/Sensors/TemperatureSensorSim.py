@@ -7,8 +7,10 @@ import time
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 grand_parent_dir = os.path.dirname(parent_dir)
-sys.path.append(parent_dir)
-sys.path.append(grand_parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
 
@@ -28,7 +30,12 @@ class TemperatureSensorSim(TemperatureSensor):
     in if the heater device is on.
     """
 
-    def __init__(self):
+    def __init__(self, config_file=None):
+        if not config_file:
+            self.config_file = CONFIG_FILE
+        else:
+            self.config_file = config_file
+
         self.start_temp: float = None  # in celsius
         self.drop_rate: float = None  # how much the temp drops per second in winter
         self.rise_rate: float = (
@@ -44,11 +51,11 @@ class TemperatureSensorSim(TemperatureSensor):
         drop rate per second, and rise rate per second
         """
         try:
-            with open(CONFIG_FILE, "r") as file:
+            with open(self.config_file, "r") as file:
                 config_data: dict = json.load(file)
         except Exception as e:
             logger.error(
-                f"TemperatureSensorSim::__read_input_file failed to read file: {CONFIG_FILE}, exception: {str(e)}"
+                f"TemperatureSensorSim::__read_input_file failed to read file: {self.config_file}, exception: {str(e)}"
             )
             sys.exit()
 
@@ -0,0 +1,127 @@
+import csv
+import datetime
+import logging
+import os
+import sys
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Sensors.TemperatureSensor import TemperatureSensor
+
+logger = logging.getLogger(__name__)
+
+
+class TemperatureSensorTrace(TemperatureSensor):
+    """
+    Replays a recorded temperature trace instead of simulating one.
+    The trace is a csv file of timestamp,temperature rows, the timestamp
+    in seconds since epoch or ISO 8601, a header row and lines starting
+    with # are skipped. It is read one row at a time, so a trace of any
+    size replays in constant memory. The recorded temperatures already
+    include whatever the heater did at the time, so the device status
+    doesn't change them.
+    """
+
+    def __init__(self, trace_file: str):
+        self.trace_file = trace_file
+        self.current_timestamp: float = None
+        self.__current_temperature: float = None
+        self.skipped_samples: int = 0  # rows dropped for going back in time
+
+    def replay(self):
+        """
+        yields the timestamp of every sample of the trace in order, until
+        the next one get_temperature returns that sample's temperature.
+        Samples older than the previous one are skipped.
+        """
+        for timestamp, temperature in read_trace(self.trace_file):
+            if (
+                self.current_timestamp is not None
+                and timestamp < self.current_timestamp
+            ):
+                logger.warn(
+                    f"TemperatureSensorTrace::replay skipping a sample at {timestamp}, it is older than the previous one"
+                )
+                self.skipped_samples += 1
+                continue
+            self.current_timestamp = timestamp
+            self.__current_temperature = temperature
+            yield timestamp
+
+    def get_temperature(self, device_status: bool = False):
+        """
+        returns the temperature of the current sample of the trace
+        """
+        return self.__current_temperature
+
+
+def read_trace(trace_file: str):
+    """
+    yields the (timestamp, temperature) samples of a trace file one row
+    at a time, rows that can't be parsed are logged and skipped
+    """
+    with open(trace_file, "r", newline="") as file:
+        for line_number, row in enumerate(csv.reader(file), start=1):
+            if not row or row[0].lstrip().startswith("#"):
+                continue
+            try:
+                yield parse_timestamp(row[0]), float(row[1])
+            except (ValueError, IndexError):
+                if line_number > 1:  # the first one can be a header
+                    logger.warn(
+                        f"read_trace skipping line {line_number} of {trace_file}: {row}"
+                    )
+
+
+def parse_timestamp(value: str):
+    """
+    returns a timestamp given in seconds since epoch or in
+    ISO 8601 as seconds since epoch
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        trace_file = os.path.join(temp_dir, "trace.csv")
+        with open(trace_file, "w") as file:
+            file.write("timestamp,temperature\n")
+            file.write("# recorded in the bedroom\n")
+            file.write("100,16.5\n")
+            file.write("not a timestamp,17.0\n")
+            file.write("160,16.25\n")
+            file.write("130,30.0\n")
+            file.write(f"{datetime.datetime.fromtimestamp(220).isoformat()},16.75\n")
+
+        ## test that every valid sample is replayed in order
+        sensor = TemperatureSensorTrace(trace_file)
+        samples: list = []
+        for timestamp in sensor.replay():
+            samples.append((timestamp, sensor.get_temperature(device_status=True)))
+        assert samples == [
+            (100.0, 16.5),
+            (160.0, 16.25),
+            (220.0, 16.75),
+        ], f"TemperatureSensorTrace replayed {samples}"
+        assert (
+            sensor.skipped_samples == 1
+        ), "TemperatureSensorTrace didn't skip the sample going back in time"
+
+        ## test that the trace is read lazily
+        samples_read = read_trace(trace_file)
+        assert next(samples_read) == (100.0, 16.5), "read_trace missed the first row"
+        samples_read.close()
+
+    print("TemperatureSensorTrace class: all unit tests passed")
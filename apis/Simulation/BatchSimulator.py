@@ -0,0 +1,367 @@
+import logging
+import math
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Config import MINIMUM_ON_TIME, COOL_DOWN_PERIOD, MAXIMUM_ON_TIME
+from apis.Sensors.TemperatureSensorSim import TemperatureSensorSim
+from TemperatureSensorThread import DELAY_BETWEEN_READS, SAMPLE_SIZE
+from ThermoStatThread import MINIMUM_WAIT
+
+logger = logging.getLogger(__name__)
+
+SPLITTER = 134217729.0  # 2**27 + 1, splits a double into two 26 bit halves
+COMPENSATED_SUM = sys.version_info >= (3, 12)  # sum() of floats is compensated
+
+
+def python_round(values: np.ndarray, decimals: int = 2):
+    """
+    rounds every element exactly like python's round(x, decimals) does,
+    half to even on the exact binary value. np.round rounds the already
+    rounded product x * 10**decimals instead, which differs on near ties.
+    """
+    scale = 10.0**decimals
+    product = values * scale
+    # exact rounding error of the product, Dekker's two-product
+    split = SPLITTER * values
+    high = split - (split - values)
+    low = values - high
+    error = (high * scale - product) + low * scale
+
+    rounded = np.rint(product)
+    difference = product - rounded
+    # the product landed exactly on a half, the error says which side x is on
+    on_other_side = (np.abs(difference) == 0.5) & (
+        np.sign(error) == np.sign(difference)
+    )
+    rounded = np.where(on_other_side, rounded + np.sign(difference), rounded)
+    return rounded / scale
+
+
+def python_sum(rows: np.ndarray):
+    """
+    sums the rows of a 2d array element-wise in the same order and with
+    the same compensation as python's sum() of a list of floats
+    """
+    total = rows[0].copy()
+    if not COMPENSATED_SUM:
+        for row in rows[1:]:
+            total = total + row
+        return total
+
+    compensation = np.zeros_like(total)
+    for row in rows[1:]:
+        new_total = total + row
+        compensation += np.where(
+            np.abs(total) >= np.abs(row),
+            (total - new_total) + row,
+            (row - new_total) + total,
+        )
+        total = new_total
+    return np.where(
+        (compensation != 0) & np.isfinite(compensation), total + compensation, total
+    )
+
+
+def minutes_between(now, past):
+    """
+    the vectorized equivalent of Utility.get_time_delta
+    """
+    return python_round((now - past) / 60, 2)
+
+
+class BatchSimulator:
+    """
+    Simulates many rooms at once. The state of every scenario lives in
+    NumPy arrays and the rules of TemperatureSensorSim, TemperatureSensorThread,
+    ThermoStatThread and PowerControlGateKeeper are applied to all of them
+    together as masks, on the same virtual timeline SimulationRunner uses.
+    Every parameter can be a scalar or an array with one value per scenario.
+    """
+
+    def __init__(
+        self,
+        start_temp,
+        drop_rate,
+        rise_rate,
+        target_temperature,
+        minimum_on_time=MINIMUM_ON_TIME,
+        cool_down_period=COOL_DOWN_PERIOD,
+        maximum_on_time=MAXIMUM_ON_TIME,
+    ):
+        parameters = np.broadcast_arrays(
+            *[
+                np.atleast_1d(np.asarray(parameter, dtype=np.float64))
+                for parameter in (
+                    start_temp,
+                    drop_rate,
+                    rise_rate,
+                    target_temperature,
+                    minimum_on_time,
+                    cool_down_period,
+                    maximum_on_time,
+                )
+            ]
+        )
+        (
+            self.start_temp,
+            self.drop_rate,
+            self.rise_rate,
+            self.target_temperature,
+            self.minimum_on_time,
+            self.cool_down_period,
+            self.maximum_on_time,
+        ) = [np.array(parameter) for parameter in parameters]
+        self.size: int = self.start_temp.size
+
+    def __len__(self):
+        """
+        returns the number of scenarios
+        """
+        return self.size
+
+    def run(self, duration: float, start_time: float = 0.0, record_history=False):
+        """
+        simulates the given number of seconds for every scenario and returns
+        a dictionary of per scenario arrays: on_time (seconds), cycles
+        (number of times the device was turned on) and comfort_error (mean
+        absolute difference between each sensor read and the target).
+        With record_history, every sensor read and the device status it
+        was taken with are returned too, one row per read.
+        """
+        self.__reset()
+        end_time = start_time + duration
+        now = float(start_time)
+        read_count = 0
+        temperatures: list = []
+        statuses: list = []
+
+        while now <= end_time:
+            self.__run_due_wakeups(now)
+
+            ## TemperatureSensorThread::read_sensor
+            status_at_read = self.status.copy()
+            if read_count == 0:
+                self.temperature = self.start_temp.copy()
+            else:
+                self.temperature = python_round(
+                    np.where(
+                        status_at_read,
+                        self.temperature + self.rise_rate,
+                        self.temperature - self.drop_rate,
+                    )
+                )
+            self.window[read_count % SAMPLE_SIZE] = self.temperature
+            self.error_sum += np.abs(self.temperature - self.target_temperature)
+            if record_history:
+                temperatures.append(self.temperature)
+                statuses.append(status_at_read)
+
+            read_count += 1
+            if read_count % SAMPLE_SIZE == 0:
+                self.current_temperature = python_round(
+                    python_sum(self.window) / SAMPLE_SIZE
+                )
+                self.__evaluate(np.arange(self.size), np.full(self.size, now))
+
+            now += DELAY_BETWEEN_READS
+
+        self.__run_due_wakeups(end_time)
+
+        still_on = self.status & ~np.isnan(self.last_turned_on)
+        on_time = self.on_time + np.where(still_on, end_time - self.last_turned_on, 0)
+        results = {
+            "on_time": on_time,
+            "cycles": self.cycles,
+            "comfort_error": self.error_sum / max(read_count, 1),
+        }
+        if record_history:
+            results["temperatures"] = np.array(temperatures)
+            results["statuses"] = np.array(statuses)
+        return results
+
+    def __reset(self):
+        """
+        puts every scenario in the state a freshly started application is in
+        """
+        self.status = np.zeros(self.size, dtype=bool)
+        self.last_turned_on = np.full(self.size, np.nan)  # seconds since epoch
+        self.last_turned_off = np.full(self.size, np.nan)
+        self.current_temperature = np.full(self.size, np.nan)
+        self.temperature = self.start_temp.copy()
+        self.window = np.zeros((SAMPLE_SIZE, self.size))
+        self.wakeup = np.full(self.size, np.inf)  # pending maximum on time checks
+        self.on_time = np.zeros(self.size)  # seconds
+        self.cycles = np.zeros(self.size, dtype=np.int64)
+        self.error_sum = np.zeros(self.size)
+
+    def __run_due_wakeups(self, now: float):
+        """
+        runs the thermostat for the scenarios whose maximum on time check
+        is due at or before now, each at its own wakeup time
+        """
+        due = np.nonzero(self.wakeup <= now)[0]
+        while due.size:
+            self.__evaluate(due, self.wakeup[due])
+            due = np.nonzero(self.wakeup <= now)[0]
+
+    def __evaluate(self, scenarios: np.ndarray, now: np.ndarray):
+        """
+        ThermoStatThread::evaluate and PowerControlGateKeeper's rules for the
+        given scenarios, followed by ThermoStatThread::get_wait_timeout
+        """
+        status = self.status[scenarios]
+        last_on = self.last_turned_on[scenarios]
+        last_off = self.last_turned_off[scenarios]
+        current = self.current_temperature[scenarios]
+        target = self.target_temperature[scenarios]
+        minimum_on = self.minimum_on_time[scenarios]
+
+        has_last_on = ~np.isnan(last_on)
+        has_last_off = ~np.isnan(last_off)
+        on_for = minutes_between(now, last_on)
+        off_for = minutes_between(now, last_off)
+
+        ## ThermoStatThread::__check_device_on_time
+        forced_off = (
+            has_last_on
+            & (on_for >= self.maximum_on_time[scenarios])
+            & status
+            & (on_for >= minimum_on)
+        )
+
+        ## temperature rule, skipped when the device was just forced off
+        has_temperature = ~np.isnan(current) & (current != 0)
+        apply_rule = has_temperature & ~forced_off
+        below_target = current <= target
+        turn_on = (
+            apply_rule
+            & below_target
+            & ~status
+            & (~has_last_off | (off_for >= self.cool_down_period[scenarios]))
+        )
+        turn_off = forced_off | (
+            apply_rule
+            & ~below_target
+            & status
+            & (~has_last_on | (on_for >= minimum_on))
+        )
+
+        ## RelayControllerSim::turn_on / turn_off
+        self.on_time[scenarios] += np.where(turn_off & has_last_on, now - last_on, 0)
+        self.cycles[scenarios] += turn_on
+        status = (status | turn_on) & ~turn_off
+        last_on = np.where(turn_on, now, last_on)
+        self.status[scenarios] = status
+        self.last_turned_on[scenarios] = last_on
+        self.last_turned_off[scenarios] = np.where(turn_off, now, last_off)
+
+        ## ThermoStatThread::get_wait_timeout
+        time_left = (
+            self.maximum_on_time[scenarios] - minutes_between(now, last_on)
+        ) * 60
+        self.wakeup[scenarios] = np.where(
+            status & ~np.isnan(last_on),
+            now + np.maximum(time_left, MINIMUM_WAIT),
+            np.inf,
+        )
+
+
+if __name__ == "__main__":
+    from apis.DatabaseAccess.DbInterface import DbInterface
+    from apis.DatabaseAccess.DbTables import SharedDataColumns
+    from apis.DatabaseAccess.RollupEngine import RollupResolutions
+    from apis.Config import DeviceStatus
+    from apis.Simulation.SimulationRunner import SimulationRunner, prepare_database
+
+    ## test that python_round matches round() on near ties
+    values = np.array([12.195, 12.23 - 0.035, 0.125, 2.675, 1.005, -2.5, 17.015])
+    assert list(python_round(values)) == [
+        round(float(value), 2) for value in values
+    ], "python_round doesn't match round()"
+
+    ## test that a single scenario matches the scalar simulation exactly
+    logging.disable(logging.WARNING)
+    target = 17.0
+    duration = 4 * 60 * 60
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        prepare_database()
+        runner = SimulationRunner(target_temperature=target, start_time=0)
+        runner.run(duration)
+
+        history = list(runner.db_interface.get_history())
+        scalar_temperatures = [sample[1] for sample in history]
+        scalar_statuses = [sample[2] == DeviceStatus.ON.value for sample in history]
+        duty_cycle = list(
+            runner.sensor_thread.rollup_engine.get_duty_cycle_rollups(
+                RollupResolutions.DAY
+            )
+        )
+        scalar_cycles = sum([bucket[3] for bucket in duty_cycle])
+        scalar_on_time = sum([bucket[1] for bucket in duty_cycle])
+        status, last_turned_on = runner.db_interface.read_multiple_columns(
+            (
+                SharedDataColumns.DEVICE_STATUS.value,
+                SharedDataColumns.LAST_TURNED_ON.value,
+            )
+        )
+        if status == DeviceStatus.ON.value:
+            scalar_on_time += duration - last_turned_on
+        error_sum = 0.0
+        for temperature in scalar_temperatures:
+            error_sum += abs(temperature - target)
+        scalar_comfort_error = error_sum / len(scalar_temperatures)
+        runner.db_interface.close()
+        os.chdir(original_dir)
+
+    sensor = TemperatureSensorSim()
+    simulator = BatchSimulator(
+        start_temp=sensor.start_temp,
+        drop_rate=sensor.drop_rate,
+        rise_rate=sensor.rise_rate,
+        target_temperature=target,
+    )
+    results = simulator.run(duration, start_time=0, record_history=True)
+    assert (
+        list(results["temperatures"][:, 0]) == scalar_temperatures
+    ), "BatchSimulator temperatures don't match the scalar simulation"
+    assert (
+        list(results["statuses"][:, 0]) == scalar_statuses
+    ), "BatchSimulator device statuses don't match the scalar simulation"
+    assert (
+        results["cycles"][0] == scalar_cycles
+    ), "BatchSimulator cycle count doesn't match the scalar simulation"
+    assert math.isclose(
+        results["on_time"][0], scalar_on_time, abs_tol=1e-6
+    ), "BatchSimulator on time doesn't match the scalar simulation"
+    assert (
+        results["comfort_error"][0] == scalar_comfort_error
+    ), "BatchSimulator comfort error doesn't match the scalar simulation"
+
+    ## test that scenarios don't influence each other
+    simulator = BatchSimulator(
+        start_temp=sensor.start_temp,
+        drop_rate=sensor.drop_rate,
+        rise_rate=sensor.rise_rate,
+        target_temperature=[target, 20.0, 15.0],
+        maximum_on_time=[MAXIMUM_ON_TIME, 5, 30],
+    )
+    batch_results = simulator.run(duration, start_time=0)
+    for key in ("on_time", "cycles", "comfort_error"):
+        assert (
+            batch_results[key][0] == results[key][0]
+        ), f"BatchSimulator {key} changed when other scenarios were added"
+    print("BatchSimulator class: all unit tests passed")
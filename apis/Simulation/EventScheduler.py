@@ -0,0 +1,154 @@
+import heapq
+import logging
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Clock import SimulatedClock
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """
+    A callback due at a virtual timestamp
+    """
+
+    def __init__(self, event_time: float, sequence: int, callback):
+        self.event_time = event_time
+        self.sequence = sequence  # keeps events due at the same time in order
+        self.callback = callback
+        self.cancelled = False
+
+
+class EventScheduler:
+    """
+    Discrete event scheduler. Keeps the pending events in a priority queue
+    ordered by virtual time and jumps the simulated clock straight from
+    one event to the next instead of waiting in real time.
+    """
+
+    def __init__(self, clock: SimulatedClock):
+        self.clock = clock
+        self.__events: list = []  # heap of (event_time, sequence, event)
+        self.__sequence: int = 0
+
+    def __len__(self):
+        """
+        returns the number of pending events
+        """
+        return len(self.__events)
+
+    def schedule_at(self, event_time: float, callback):
+        """
+        schedules the callback at the given virtual time, returns the event
+        """
+        event = Event(event_time, self.__sequence, callback)
+        self.__sequence += 1
+        heapq.heappush(self.__events, (event_time, event.sequence, event))
+        return event
+
+    def schedule_after(self, delay: float, callback):
+        """
+        schedules the callback the given number of seconds from now
+        """
+        return self.schedule_at(self.clock.time() + delay, callback)
+
+    def schedule_every(self, interval: float, callback, first_time: float = None):
+        """
+        schedules the callback every interval seconds, starting now
+        or at first_time
+        """
+        if first_time is None:
+            first_time = self.clock.time()
+
+        def run_and_reschedule():
+            callback()
+            self.schedule_at(self.clock.time() + interval, run_and_reschedule)
+
+        return self.schedule_at(first_time, run_and_reschedule)
+
+    def cancel(self, event: Event):
+        """
+        cancels a pending event
+        """
+        event.cancelled = True
+
+    def get_next_event_time(self):
+        """
+        returns the time of the earliest pending event,
+        or None if nothing is pending
+        """
+        while self.__events and self.__events[0][2].cancelled:
+            heapq.heappop(self.__events)
+        if not self.__events:
+            return None
+        return self.__events[0][0]
+
+    def run_due(self, now: float):
+        """
+        runs every event due up to and including now in order, without
+        touching the clock. Lets a caller that waits on a real clock
+        service the events itself.
+        """
+        while self.__events and self.__events[0][0] <= now:
+            _, _, event = heapq.heappop(self.__events)
+            if not event.cancelled:
+                event.callback()
+
+    def run_until(self, end_time: float):
+        """
+        runs every event due up to and including end_time in order,
+        then leaves the clock at end_time
+        """
+        while self.__events and self.__events[0][0] <= end_time:
+            _, _, event = heapq.heappop(self.__events)
+            if event.cancelled:
+                continue
+            self.clock.advance_to(event.event_time)
+            event.callback()
+        self.clock.advance_to(end_time)
+
+
+if __name__ == "__main__":
+    clock = SimulatedClock(start_time=0)
+    scheduler = EventScheduler(clock)
+    fired: list = []
+
+    ## test that events run in time order, ties in scheduling order
+    scheduler.schedule_at(5, lambda: fired.append(("b", clock.time())))
+    scheduler.schedule_at(2, lambda: fired.append(("a", clock.time())))
+    scheduler.schedule_at(5, lambda: fired.append(("c", clock.time())))
+    scheduler.run_until(10)
+    assert fired == [
+        ("a", 2),
+        ("b", 5),
+        ("c", 5),
+    ], "EventScheduler ran events out of order"
+    assert clock.time() == 10, "EventScheduler didn't advance the clock to end_time"
+
+    ## test periodic and cancelled events
+    fired = []
+    scheduler.schedule_every(3, lambda: fired.append(clock.time()))
+    cancelled_event = scheduler.schedule_after(1, lambda: fired.append("cancelled"))
+    scheduler.cancel(cancelled_event)
+    scheduler.run_until(20)
+    assert fired == [10, 13, 16, 19], "EventScheduler::schedule_every misfired"
+
+    ## test servicing due events without moving the clock
+    fired = []
+    scheduler.cancel(scheduler.schedule_at(21, lambda: fired.append("cancelled")))
+    assert (
+        scheduler.get_next_event_time() == 22
+    ), "EventScheduler::get_next_event_time returned a cancelled event"
+    scheduler.run_due(22)
+    assert fired == [20], "EventScheduler::run_due ran the wrong events"
+    assert clock.time() == 20, "EventScheduler::run_due moved the clock"
+    print("EventScheduler class: all unit tests passed")
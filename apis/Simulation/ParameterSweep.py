@@ -0,0 +1,204 @@
+import csv
+import itertools
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Config import DeviceStatus
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.RollupEngine import RollupEngine, RollupResolutions
+from apis.Sensors.TemperatureSensorSim import TemperatureSensorSim, CONFIG_FILE
+from apis.Simulation.SimulationRunner import SimulationRunner, prepare_database
+from TemperatureSensorThread import DELAY_BETWEEN_READS
+
+DB_NAME = "DeviceHistory.db"
+START_TIME = 0.0  # every configuration is simulated from the same virtual time
+
+## parameters of one configuration, in the order they are written to the csv
+PARAMETER_FIELDS: tuple = (
+    "minimum_on_time",
+    "cool_down_period",
+    "maximum_on_time",
+    "target_temperature",
+    "profile",
+)
+METRIC_FIELDS: tuple = ("cycles", "on_time", "comfort_error")
+CSV_FIELDS: tuple = ("rank",) + PARAMETER_FIELDS + METRIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def build_grid(
+    minimum_on_times, cool_down_periods, maximum_on_times, target_temperatures, profiles
+):
+    """
+    returns one configuration dictionary per combination of the given values
+    """
+    return [
+        dict(zip(PARAMETER_FIELDS, values))
+        for values in itertools.product(
+            minimum_on_times,
+            cool_down_periods,
+            maximum_on_times,
+            target_temperatures,
+            profiles,
+        )
+    ]
+
+
+def run_configuration(configuration: dict, duration: float):
+    """
+    simulates one configuration in a scratch directory of its own and returns
+    it with its metrics: cycles (times the device was turned on), on_time
+    (seconds) and comfort_error (mean absolute difference between each
+    sensor read and the target). Runs in a worker process.
+    """
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # the database and its state transitions live here
+        try:
+            prepare_database()
+            runner = SimulationRunner(
+                target_temperature=configuration["target_temperature"],
+                start_time=START_TIME,
+                sensor=TemperatureSensorSim(config_file=configuration["profile"]),
+                minimum_on_time=configuration["minimum_on_time"],
+                cool_down_period=configuration["cool_down_period"],
+                maximum_on_time=configuration["maximum_on_time"],
+            )
+            runner.run(duration)
+
+            cycles = sum(
+                [
+                    turn_on_count
+                    for _, _, _, turn_on_count, _ in RollupEngine().get_duty_cycle_rollups(
+                        RollupResolutions.DAY
+                    )
+                ]
+            )
+            on_reads = 0
+            total_error = 0.0
+            read_count = 0
+            for _, temperature, device_status in runner.db_interface.get_history():
+                on_reads += device_status == DeviceStatus.ON.value
+                total_error += abs(temperature - configuration["target_temperature"])
+                read_count += 1
+
+        finally:
+            # the next configuration run by this process gets a fresh database
+            DbConnectionManager.get_manager(DB_NAME).close_all()
+            os.chdir(original_dir)
+
+    result = dict(configuration)
+    result["cycles"] = cycles
+    result["on_time"] = on_reads * DELAY_BETWEEN_READS
+    result["comfort_error"] = round(total_error / max(read_count, 1), 4)
+    return result
+
+
+def rank_results(results: list):
+    """
+    sorts the results by relay cycles, then on time, then comfort error,
+    and numbers them from 1
+    """
+    ranked = sorted(
+        results,
+        key=lambda result: tuple([result[field] for field in METRIC_FIELDS]),
+    )
+    for rank, result in enumerate(ranked, start=1):
+        result["rank"] = rank
+    return ranked
+
+
+def initialize_worker():
+    """
+    keeps the gatekeeper's warnings of thousands of simulations off the terminal
+    """
+    logging.getLogger().setLevel(logging.ERROR)
+
+
+def run_sweep(configurations: list, duration: float, output_file, max_workers=None):
+    """
+    runs the configurations on a process pool, one core each, and streams
+    every result to the csv file as soon as it is ready. Once every
+    configuration is done the file is rewritten ranked. Returns the
+    ranked results.
+    """
+    if not max_workers:
+        max_workers = os.cpu_count()
+
+    results: list = []
+    with open(output_file, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=initialize_worker
+        ) as executor:
+            futures = [
+                executor.submit(run_configuration, configuration, duration)
+                for configuration in configurations
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                writer.writerow(result)
+                file.flush()
+                logger.info(
+                    f"ParameterSweep::run_sweep {len(results)}/{len(futures)} configurations done"
+                )
+
+    ranked = rank_results(results)
+    with open(output_file, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(ranked)
+    return ranked
+
+
+if __name__ == "__main__":
+    initialize_worker()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "sweep.csv")
+        configurations = build_grid([2, 3], [3], [10, 15], [17.0], [CONFIG_FILE])
+
+        ## test that the grid covers every combination
+        assert (
+            len(configurations) == 4
+        ), "ParameterSweep::build_grid missed combinations"
+
+        ## test that the sweep ranks every configuration in the csv
+        ranked = run_sweep(configurations, 2 * 60 * 60, output_file, max_workers=2)
+        with open(output_file, newline="") as file:
+            rows = list(csv.DictReader(file))
+        assert [int(row["rank"]) for row in rows] == list(
+            range(1, len(configurations) + 1)
+        ), "ParameterSweep::run_sweep didn't write the ranked results"
+        assert [(int(row["cycles"]), float(row["on_time"])) for row in rows] == sorted(
+            [(int(row["cycles"]), float(row["on_time"])) for row in rows]
+        ), "ParameterSweep::run_sweep ranked the results in the wrong order"
+        assert all(
+            [result["cycles"] > 0 for result in ranked]
+        ), "ParameterSweep::run_configuration didn't cycle the device"
+
+        ## test that workers are isolated, the same configuration gives the
+        ## same result whichever process and order it runs in
+        rerun = run_configuration(configurations[3], 2 * 60 * 60)
+        assert [
+            {field: result[field] for field in METRIC_FIELDS}
+            for result in ranked
+            if all([result[field] == rerun[field] for field in PARAMETER_FIELDS])
+        ] == [
+            {field: rerun[field] for field in METRIC_FIELDS}
+        ], "ParameterSweep::run_configuration results depend on the worker"
+
+    print("ParameterSweep class: all unit tests passed")
@@ -0,0 +1,319 @@
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Clock import SimulatedClock
+from apis.Config import RUNNING_MODE, MAXIMUM_ON_TIME, ControlModes
+from apis.DatabaseAccess.DbTables import DbTables
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+from apis.DatabaseAccess.StateTransitionStore import (
+    StateTransitionStore,
+    TIMESTAMP_KEY,
+)
+from apis.Registrar import Registrar
+from apis.Relays.RelayControllerSim import RelayControllerSim
+from apis.Sensors.TemperatureSensor import TemperatureSensor
+from apis.Sensors.TemperatureSensorSim import TemperatureSensorSim
+from apis.Simulation.EventScheduler import EventScheduler
+from apis.StateTransitionRecorder import StateTransitionRecorder
+from TemperatureSensorThread import TemperatureSensorThread, DELAY_BETWEEN_READS
+from ThermoStatThread import ThermoStatThread, WATCHED_COLUMNS
+
+## raw samples stored at a time during a run, ten simulated minutes per
+## insert instead of one, the run stores whatever is left once it returns
+SIMULATION_HISTORY_BATCH_SIZE = 600
+
+logger = logging.getLogger(__name__)
+
+
+class SimulationRunner:
+    """
+    Runs the simulation mode on a virtual clock. The sensor read and the
+    thermostat decision of the two threads are driven by an event scheduler
+    with the same cadence and wake up rules the threads use in real time,
+    so a simulated day takes a fraction of a second.
+    """
+
+    def __init__(
+        self,
+        target_temperature: float,
+        db_interface=None,
+        start_time=None,
+        sensor: TemperatureSensor = None,
+        minimum_on_time=None,
+        cool_down_period=None,
+        maximum_on_time=None,
+        recorder=None,
+        control_mode=None,
+    ):
+        self.clock = SimulatedClock(start_time=start_time)
+        Registrar.register_clock(self.clock)
+        self.scheduler = EventScheduler(self.clock)
+
+        if not db_interface:
+            # nothing needs to survive a simulated run, skip the sqlite mirror
+            DbInterface.register_shared_backend(InMemoryBackend())
+            self.db_interface = DbInterface()
+        else:
+            self.db_interface = db_interface
+
+        if not sensor:
+            sensor = TemperatureSensorSim()
+        if not recorder:
+            self.recorder = StateTransitionRecorder.get_recorder(
+                self.db_interface.db_name
+            )
+        else:
+            self.recorder = recorder
+        Registrar.register_temperature_sensor(sensor, RUNNING_MODE)
+        Registrar.register_relay_controllers(
+            RelayControllerSim(db_interface=self.db_interface, recorder=self.recorder),
+            RUNNING_MODE,
+        )
+        self.sensor_thread = TemperatureSensorThread(db_interface=self.db_interface)
+        self.sensor_thread.history_batch_size = SIMULATION_HISTORY_BATCH_SIZE
+        self.thermostat_thread = ThermoStatThread(
+            target_temperature=target_temperature,
+            db_interface=self.db_interface,
+            minimum_on_time=minimum_on_time,
+            cool_down_period=cool_down_period,
+            maximum_on_time=maximum_on_time,
+            control_mode=control_mode,
+        )
+
+        self.__thermostat_version: int = -1  # last update seen by the thermostat
+        self.__checked_sequence: int = -1  # last write seen by __on_sensor_read
+        self.__thermostat_timeout = None  # pending maximum on time check
+
+    def run(self, duration: float):
+        """
+        simulates the given number of seconds, everything recorded
+        during the run is stored once it returns
+        """
+        start_time = self.clock.time()
+        end_time = start_time + duration
+        self.scheduler.schedule_at(start_time, self.__on_thermostat_wakeup)
+        ## the reads keep their cadence without going through the event
+        ## queue, maximum on time checks due first still run first
+        read_time = start_time
+        while read_time <= end_time:
+            self.scheduler.run_until(read_time)
+            self.__on_sensor_read()
+            read_time += DELAY_BETWEEN_READS
+        self.scheduler.run_until(end_time)
+        self.finish()
+
+    def read_sensor_at(self, timestamp: float):
+        """
+        moves the clock to the given time, running every maximum on time
+        check due on the way, and takes one sensor read there. Lets a
+        caller pick the time of every read instead of the regular cadence.
+        """
+        if self.__thermostat_version < 0:
+            self.__on_thermostat_wakeup()  # the first decision, as in run
+        self.scheduler.run_until(timestamp)
+        self.__on_sensor_read()
+
+    def finish(self):
+        """
+        stores everything recorded so far
+        """
+        self.sensor_thread.flush_history()
+        self.db_interface.flush()
+        self.recorder.flush()
+
+    def __on_sensor_read(self):
+        """
+        takes one sensor read, and wakes the thermostat up if the read
+        published a new temperature, just like the thread would
+        """
+        self.sensor_thread.read_sensor()
+        ## most reads write nothing, then there is no version to compare
+        sequence = self.db_interface.notifier.get_sequence()
+        if sequence == self.__checked_sequence:
+            return
+        self.__checked_sequence = sequence
+        version = self.db_interface.get_update_version(WATCHED_COLUMNS)
+        if version > self.__thermostat_version:
+            self.__on_thermostat_wakeup(version)
+
+    def __on_thermostat_wakeup(self, version: int = None):
+        """
+        runs one thermostat decision and schedules the next
+        maximum on time check, if the device is on
+        """
+        if version is None:
+            version = self.db_interface.get_update_version(WATCHED_COLUMNS)
+        self.__thermostat_version = version
+        self.thermostat_thread.evaluate()
+
+        if self.__thermostat_timeout:
+            self.scheduler.cancel(self.__thermostat_timeout)
+            self.__thermostat_timeout = None
+        timeout = self.thermostat_thread.get_wait_timeout()
+        if timeout is not None:
+            self.__thermostat_timeout = self.scheduler.schedule_after(
+                timeout, self.__on_thermostat_wakeup
+            )
+
+
+def prepare_database():
+    """
+    creates every table the simulation writes to, in the working directory
+    """
+    table_creator = DbTables()
+    table_creator.create_shared_data_table()
+    table_creator.create_temperature_history_table()
+    table_creator.create_rollup_tables()
+    table_creator.create_state_transition_table()
+
+
+if __name__ == "__main__":
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the simulation's database and records out of the way
+        prepare_database()
+        runner = SimulationRunner(target_temperature=17.0, start_time=0)
+
+        ## test that a simulated day runs in well under a second
+        simulated_seconds = 24 * 60 * 60
+        started = time.perf_counter()
+        runner.run(simulated_seconds)
+        elapsed = time.perf_counter() - started
+        assert (
+            runner.clock.time() == simulated_seconds
+        ), "SimulationRunner didn't advance the clock to the end of the run"
+        assert elapsed < 1.0, f"SimulationRunner took {elapsed} s to simulate a day"
+
+        ## test that the device cycled and never exceeded the maximum on time
+        on_times = [
+            transition["on_for_minutes"]
+            for transition in StateTransitionStore().get_transitions()
+            if transition["on_for_minutes"] != ""
+        ]
+        assert len(on_times) > 2, "SimulationRunner didn't cycle the device"
+        assert (
+            max(on_times) <= MAXIMUM_ON_TIME + DELAY_BETWEEN_READS / 60
+        ), "SimulationRunner let the device exceed its maximum on time"
+
+        ## test that the predictive mode learns the simulated room's rates
+        sensor = TemperatureSensorSim()
+        runner = SimulationRunner(
+            target_temperature=17.0,
+            start_time=0,
+            control_mode=ControlModes.PREDICTIVE,
+        )
+        runner.run(6 * 60 * 60)
+        model = runner.thermostat_thread.thermal_model
+        assert model.is_ready(True), "SimulationRunner didn't train the thermal model"
+        # the simulated reads are rounded to 0.01, so the rates are only close
+        assert (
+            abs(model.get_rate(True) - sensor.rise_rate) < 0.002
+        ), f"the thermal model learned a heat up rate of {model.get_rate(True)}"
+        assert (
+            abs(model.get_rate(False) + sensor.drop_rate) < 0.002
+        ), f"the thermal model learned a cool down rate of {model.get_rate(False)}"
+        assert "Predicted Temperature is above target temperature" in [
+            transition["state_change_cause"]
+            for transition in StateTransitionStore().get_transitions()
+        ], "SimulationRunner didn't switch on a predicted temperature"
+
+        ## test that the runner switches the device exactly like the real
+        ## threads on a simulated clock. The sensor thread only sleeps once
+        ## the thermostat thread took in its update, and the threads only
+        ## check the maximum on time on a real timeout, so it's never reached
+        def run_threads(start_time: float, duration: float):
+            clock = SimulatedClock(start_time=start_time)
+            Registrar.register_clock(clock)
+            DbInterface.register_shared_backend(InMemoryBackend())
+            db_api = DbInterface()
+            recorder = StateTransitionRecorder.get_recorder(db_api.db_name)
+            Registrar.register_temperature_sensor(TemperatureSensorSim(), RUNNING_MODE)
+            Registrar.register_relay_controllers(
+                RelayControllerSim(db_interface=db_api, recorder=recorder),
+                RUNNING_MODE,
+            )
+            sensor_thread = TemperatureSensorThread(db_interface=db_api)
+            thermostat_thread = ThermoStatThread(
+                target_temperature=17.0, db_interface=db_api, maximum_on_time=60
+            )
+
+            evaluated = threading.Condition()
+            evaluated_version = -1  # last update the thermostat thread took in
+            evaluate = thermostat_thread.evaluate
+
+            def evaluate_and_report(state: dict = None):
+                nonlocal evaluated_version
+                version = db_api.get_update_version(WATCHED_COLUMNS)
+                status = evaluate(state)
+                with evaluated:
+                    evaluated_version = version
+                    evaluated.notify_all()
+                return status
+
+            def wait_for_thermostat():
+                with evaluated:
+                    assert evaluated.wait_for(
+                        lambda: evaluated_version
+                        >= db_api.get_update_version(WATCHED_COLUMNS),
+                        timeout=10,
+                    ), "ThermoStatThread didn't take in the sensor's update"
+
+            def sleep(seconds: float):
+                wait_for_thermostat()
+                if clock.time() + seconds > start_time + duration:
+                    sensor_thread.keep_me_alive = False
+                else:
+                    clock.advance(seconds)
+
+            thermostat_thread.evaluate = evaluate_and_report
+            clock.sleep = sleep
+            thermostat_thread.start()
+            wait_for_thermostat()  # the first decision comes before the first read
+            sensor_thread.start()
+            sensor_thread.join()
+            thermostat_thread.terminate()
+            thermostat_thread.join()
+            recorder.flush()
+
+        def get_transitions(start_time: float, duration: float):
+            return [
+                (
+                    transition["state_change"],
+                    transition["state_change_cause"],
+                    transition[TIMESTAMP_KEY].timestamp() - start_time,
+                )
+                for transition in StateTransitionStore().get_transitions(
+                    start=start_time, end=start_time + duration + 1
+                )
+            ]
+
+        scenario_seconds = 60 * 60
+        threads_start, runner_start = 10**6, 2 * 10**6
+        run_threads(threads_start, scenario_seconds)
+        runner = SimulationRunner(
+            target_temperature=17.0, start_time=runner_start, maximum_on_time=60
+        )
+        runner.run(scenario_seconds)
+        threaded_transitions = get_transitions(threads_start, scenario_seconds)
+        assert len(threaded_transitions) > 2, "the threads didn't cycle the device"
+        assert threaded_transitions == get_transitions(
+            runner_start, scenario_seconds
+        ), "SimulationRunner switched the device unlike the threads"
+
+        runner.db_interface.close()
+        os.chdir(original_dir)
+
+    print("SimulationRunner class: all unit tests passed")
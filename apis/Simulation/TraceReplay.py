@@ -0,0 +1,213 @@
+import collections
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Sensors.TemperatureSensorTrace import TemperatureSensorTrace
+from apis.Simulation.SimulationRunner import SimulationRunner
+from apis.Registrar import Registrar
+
+logger = logging.getLogger(__name__)
+
+
+class TransitionCollector:
+    """
+    Recorder of the replay's relay controller. Builds the payload the state
+    transition table would store and only holds it until the replay hands
+    it out, so nothing piles up however long the trace is.
+    """
+
+    def __init__(self, target_temperature: float):
+        self.target_temperature = target_temperature
+        self.utility = Registrar.get_utility()
+        self.__switch_times: list = [None, None]  # last turned on, last turned off
+        self.__pending = collections.deque()
+
+    def start_session(self, zone_id):
+        pass
+
+    def record(self, zone_id, state_data: tuple, timestamp: float):
+        """
+        builds the payload of a (status, effective_temperature, reason)
+        state transition at the given time in seconds since epoch
+        """
+        self.__switch_times[0 if state_data[0] else 1] = timestamp
+        self.__pending.append(
+            self.utility.create_payload(
+                state_data,
+                zone_id,
+                self.target_temperature,
+                *self.__switch_times,
+                timestamp,
+            )
+        )
+
+    def flush(self):
+        """
+        nothing to store, payloads are built as they are recorded
+        """
+        pass
+
+    def drain(self):
+        """
+        yields and forgets every payload recorded so far
+        """
+        while self.__pending:
+            yield self.__pending.popleft()
+
+
+class TraceReplay:
+    """
+    Feeds a recorded temperature trace through the unchanged sensor,
+    thermostat and gatekeeper logic on a virtual clock. The clock jumps
+    to the timestamp of every sample, so the replay runs as fast as the
+    decisions can be made, and the same trace always gives the same
+    state transitions.
+    """
+
+    def __init__(
+        self,
+        trace_file: str,
+        target_temperature: float,
+        minimum_on_time=None,
+        cool_down_period=None,
+        maximum_on_time=None,
+    ):
+        self.sensor = TemperatureSensorTrace(trace_file)
+        self.target_temperature = target_temperature
+        self.minimum_on_time = minimum_on_time
+        self.cool_down_period = cool_down_period
+        self.maximum_on_time = maximum_on_time
+        self.samples: int = 0  # replayed so far
+        self.runner: SimulationRunner = None  # created at the first sample
+
+    def replay(self):
+        """
+        generator, reads the trace one sample at a time and yields every
+        state transition payload as soon as it happens
+        """
+        recorder = TransitionCollector(self.target_temperature)
+        for timestamp in self.sensor.replay():
+            if not self.runner:
+                self.runner = SimulationRunner(
+                    target_temperature=self.target_temperature,
+                    start_time=timestamp,
+                    sensor=self.sensor,
+                    minimum_on_time=self.minimum_on_time,
+                    cool_down_period=self.cool_down_period,
+                    maximum_on_time=self.maximum_on_time,
+                    recorder=recorder,
+                )
+            self.runner.read_sensor_at(timestamp)
+            self.samples += 1
+            yield from recorder.drain()
+
+        if self.runner:
+            self.runner.finish()
+        else:
+            logger.warn(f"TraceReplay::replay no samples in {self.sensor.trace_file}")
+
+
+def write_synthetic_trace(
+    trace_file: str, samples: int, start_time=0, interval=1, average=17.0
+):
+    """
+    writes a trace oscillating half a degree around the average every
+    hour, one row at a time
+    """
+    with open(trace_file, "w") as file:
+        file.write("timestamp,temperature\n")
+        for i in range(samples):
+            temperature = average + 0.5 * math.sin(2 * math.pi * i * interval / 3600)
+            file.write(f"{start_time + i * interval},{round(temperature, 3)}\n")
+
+
+def measure_peak_memory(trace_file: str):
+    """
+    replays a trace and returns the peak memory allocated on the way in bytes
+    """
+    tracemalloc.start()
+    for _ in TraceReplay(trace_file, target_temperature=17.0).replay():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == "__main__":
+    from apis.Simulation.SimulationRunner import prepare_database
+    from apis.StateTransitionRecorder import StateTransitionRecorder
+
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the replay's database out of the way
+        prepare_database()
+        hours = 6
+        write_synthetic_trace("trace.csv", hours * 3600, start_time=1_700_000_000)
+
+        ## test that every sample is replayed and the device cycles
+        trace_replay = TraceReplay(
+            "trace.csv",
+            target_temperature=17.0,
+            minimum_on_time=0,
+            cool_down_period=0,
+        )
+        started = time.perf_counter()
+        transitions = list(trace_replay.replay())
+        elapsed = time.perf_counter() - started
+        assert trace_replay.samples == hours * 3600, "TraceReplay skipped samples"
+        assert (
+            trace_replay.runner.clock.time() == 1_700_000_000 + hours * 3600 - 1
+        ), "TraceReplay didn't move the clock to the last sample"
+        assert len(transitions) >= 2 * hours, "TraceReplay didn't cycle the device"
+        assert [transition["state_change"] for transition in transitions[:2]] == [
+            "Device Turned On",
+            "Device Turned Off",
+        ]
+
+        ## test the replay's throughput, it runs about 100000 samples a second
+        samples_per_second = trace_replay.samples / elapsed
+        assert (
+            samples_per_second > 50_000
+        ), f"TraceReplay replayed {round(samples_per_second)} samples a second"
+
+        ## test that a replay is deterministic
+        transitions_again = list(
+            TraceReplay(
+                "trace.csv",
+                target_temperature=17.0,
+                minimum_on_time=0,
+                cool_down_period=0,
+            ).replay()
+        )
+        assert (
+            transitions_again == transitions
+        ), "TraceReplay gave different transitions for the same trace"
+
+        ## test that the memory used doesn't grow with the trace
+        write_synthetic_trace("short.csv", 3600)
+        write_synthetic_trace("long.csv", 4 * 3600)
+        short_peak = measure_peak_memory("short.csv")
+        long_peak = measure_peak_memory("long.csv")
+        assert (
+            long_peak < short_peak * 1.5
+        ), f"TraceReplay used {long_peak} bytes for a 4 times longer trace than {short_peak} bytes"
+
+        StateTransitionRecorder.terminate_all()
+        trace_replay.runner.db_interface.close()
+        os.chdir(original_dir)
+
+    print("TraceReplay class: all unit tests passed")
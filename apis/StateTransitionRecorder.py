@@ -0,0 +1,377 @@
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+grand_parent_dir = os.path.dirname(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.Config import (
+    DeviceStatus,
+    TRANSITION_QUEUE_SIZE,
+    TRANSITION_QUEUE_TIMEOUT,
+    TRANSITION_BATCH_SIZE,
+    TRANSITION_FLUSH_INTERVAL,
+)
+from apis.DatabaseAccess.DbTables import SharedDataColumns, DbTables, DB_NAME
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.StateTransitionStore import StateTransitionStore
+from apis.DatabaseAccess.RollupEngine import RollupEngine
+from apis.Registrar import Registrar
+from apis.Utility import Utility
+
+FLUSH = "flush"  # queued by flush to store the current batch right away
+
+logger = logging.getLogger(__name__)
+
+
+class StateTransitionRecorder(threading.Thread):
+    """
+    Background thread that stores the state transitions of every zone and
+    merges them into the duty cycle aggregates, so relays only queue an
+    event instead of reading the database, writing and logging before
+    they return. Events are stored in batches,
+    once a batch is full or its oldest event waited long enough. A batch
+    that fails is logged and dropped, and a full queue drops new events
+    after a short wait, so the relays never block on the recorder.
+    The last on and off times of a zone are taken from its own events,
+    the database is only read when a relay controller of the zone starts
+    a session, never while recording.
+    """
+
+    __recorders: dict = dict()  # one recorder per database file
+    __recorders_lock = threading.Lock()
+
+    def __init__(
+        self,
+        db_name=None,
+        queue_size=None,
+        batch_size=None,
+        flush_interval=None,
+        queue_timeout=None,
+        thread_name="StateTransitionRecorder",
+    ):
+        threading.Thread.__init__(self, name=thread_name, daemon=True)
+        if not db_name:
+            self.db_name = DB_NAME
+        else:
+            self.db_name = db_name
+
+        if not queue_size:
+            queue_size = TRANSITION_QUEUE_SIZE
+        if not batch_size:
+            self.batch_size = TRANSITION_BATCH_SIZE
+        else:
+            self.batch_size = batch_size
+        if not flush_interval:
+            self.flush_interval = TRANSITION_FLUSH_INTERVAL
+        else:
+            self.flush_interval = flush_interval
+        if queue_timeout is None:
+            self.queue_timeout = TRANSITION_QUEUE_TIMEOUT
+        else:
+            self.queue_timeout = queue_timeout
+
+        self.db_interface = DbInterface(db_name=self.db_name)
+        self.store = StateTransitionStore(db_name=self.db_name)
+        self.utility = Registrar.get_utility()
+        self.__events: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.__switch_times: dict = dict()  # zone id -> [last on, last off]
+        self.__rollup_engines: dict = dict()  # zone id -> RollupEngine
+        self.dropped_transitions: int = 0  # lost to a full queue or a failed batch
+
+    @staticmethod
+    def get_recorder(db_name=None):
+        """
+        returns the running recorder shared by every relay
+        of the given database file, starting it on first use
+        or if the previous one stopped
+        """
+        if not db_name:
+            db_name = DB_NAME
+        with StateTransitionRecorder.__recorders_lock:
+            recorder = StateTransitionRecorder.__recorders.get(db_name)
+            if not recorder or not recorder.is_alive():
+                recorder = StateTransitionRecorder(db_name=db_name)
+                recorder.start()
+                StateTransitionRecorder.__recorders[db_name] = recorder
+            return StateTransitionRecorder.__recorders[db_name]
+
+    @staticmethod
+    def terminate_all():
+        """
+        stores every pending state transition and stops every shared recorder
+        """
+        with StateTransitionRecorder.__recorders_lock:
+            recorders = list(StateTransitionRecorder.__recorders.values())
+            StateTransitionRecorder.__recorders.clear()
+        for recorder in recorders:
+            recorder.terminate()
+
+    def start_session(self, zone_id):
+        """
+        called by a new relay controller of the zone before it switches
+        anything, reads the last on and off times from the database and
+        queues them ahead of the controller's transitions, which start
+        a new duty cycle
+        """
+        switch_times = self.db_interface.for_zone(zone_id).read_multiple_columns(
+            (
+                SharedDataColumns.LAST_TURNED_ON.value,
+                SharedDataColumns.LAST_TURNED_OFF.value,
+            )
+        )
+        if switch_times is None:
+            switch_times = (None, None)  # the zone has no row yet
+        if not self.__queue((zone_id, None, None, switch_times)):
+            logger.error(
+                f"StateTransitionRecorder::start_session queue is full, the zone {zone_id} session keeps the last on and off times"
+            )
+
+    def record(self, zone_id, state_data: tuple, timestamp: float):
+        """
+        queues a zone's (status, effective_temperature, reason) state
+        transition, turned on or off at the given time in seconds since
+        epoch. If the queue is full, waits queue_timeout seconds for room
+        and then drops the transition.
+        """
+        if not self.__queue((zone_id, state_data, timestamp, None)):
+            self.dropped_transitions += 1
+            logger.error(
+                f"StateTransitionRecorder::record queue is full, dropped the zone {zone_id} transition"
+            )
+
+    def flush(self):
+        """
+        blocks until every queued state transition is stored
+        """
+        if self.is_alive():
+            self.__events.put(FLUSH)
+            self.__events.join()
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            batch = [self.__events.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] not in (None, FLUSH) and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.__events.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            stopped = batch[-1] is None
+            events = [event for event in batch if event not in (None, FLUSH)]
+            try:
+                self.__write_batch(events)
+            except Exception as e:
+                ## session events carry no state data, they aren't transitions
+                dropped = len([event for event in events if event[1] is not None])
+                self.dropped_transitions += dropped
+                logger.error(
+                    f"StateTransitionRecorder::run dropped {dropped} transitions, exception: {str(e)}"
+                )
+            finally:
+                for _ in batch:
+                    self.__events.task_done()
+
+    def terminate(self):
+        """
+        stores whatever is still pending, then stops the thread
+        """
+        if self.is_alive():
+            self.__events.put(None)
+            self.join()
+
+    def __queue(self, event: tuple):
+        """
+        queues a (zone_id, state_data, timestamp, switch_times) event,
+        waiting queue_timeout seconds for room. Returns False if it was dropped
+        """
+        try:
+            self.__events.put(event, timeout=self.queue_timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def __write_batch(self, batch: list):
+        """
+        builds the payload of every event of a batch and stores them
+        in a single transaction
+        """
+        if not batch:
+            return
+        targets: dict = self.db_interface.read_zones(
+            (SharedDataColumns.TARGET_TEMPERATURE.value,),
+            set([zone_id for zone_id, _, _, _ in batch]),
+        )
+
+        payloads: list = []
+        for zone_id, state_data, timestamp, session_switch_times in batch:
+            if state_data is None:
+                ## a relay controller of the zone started a session
+                self.__switch_times[zone_id] = list(session_switch_times)
+                self.__rollup_engines.pop(zone_id, None)
+                continue
+            switch_times = self.__switch_times.setdefault(zone_id, [None, None])
+            switch_times[0 if state_data[0] else 1] = timestamp
+            self.__get_rollup_engine(zone_id).record_device_state(
+                DeviceStatus.ON.value if state_data[0] else DeviceStatus.OFF.value,
+                timestamp,
+            )
+            target_temperature = targets.get(zone_id, (None,))[0]
+            payloads.append(
+                self.utility.create_payload(
+                    state_data, zone_id, target_temperature, *switch_times, timestamp
+                )
+            )
+
+        if self.store.add_transitions(payloads):
+            Utility.state_transition_counter += len(payloads)
+        for payload in payloads:
+            self.utility.log_payload(payload)
+
+    def __get_rollup_engine(self, zone_id):
+        """
+        returns the zone's rollup engine, it tracks since when the device is on
+        """
+        if zone_id not in self.__rollup_engines:
+            self.__rollup_engines[zone_id] = RollupEngine(
+                db_name=self.db_name, zone_id=zone_id
+            )
+        return self.__rollup_engines[zone_id]
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the database and records out of the way
+        table_creator = DbTables()
+        table_creator.create_shared_data_table()
+        table_creator.create_rollup_tables()
+        table_creator.create_state_transition_table()
+        db_api = DbInterface()
+        db_api.update_column(SharedDataColumns.TARGET_TEMPERATURE.value, 17.0)
+        recorder = StateTransitionRecorder(batch_size=4, flush_interval=60)
+        recorder.start()
+        start = 1704110400.0  # seconds since epoch
+
+        ## test that recording returns before anything is stored
+        for minute in range(6):
+            recorder.record(
+                1,
+                (minute % 2 == 0, 16.5, "test"),
+                start + minute * 10 * 60,
+            )
+        assert (
+            len(list(recorder.store.get_transitions())) < 6
+        ), "StateTransitionRecorder::record stored the transitions synchronously"
+
+        ## test that a flush stores the partial batch right away
+        flush_started = time.monotonic()
+        recorder.flush()
+        assert (
+            time.monotonic() - flush_started < recorder.flush_interval
+        ), "StateTransitionRecorder::flush waited for the batch to fill up"
+        transitions = list(recorder.store.get_transitions())
+        assert len(transitions) == 6, "StateTransitionRecorder lost transitions"
+
+        ## test that the payloads match the ones recorded synchronously
+        assert [
+            (transition["on_for_minutes"], transition["off_for_minutes"])
+            for transition in transitions
+        ] == [
+            (0.0, ""),
+            (10.0, 0.0),
+            (0.0, 10.0),
+            (10.0, 0.0),
+            (0.0, 10.0),
+            (10.0, 0.0),
+        ], "StateTransitionRecorder computed the wrong on and off times"
+        assert all(
+            [transition["target_temperature"] == 17.0 for transition in transitions]
+        ), "StateTransitionRecorder didn't read the target temperature"
+
+        ## test that terminating stores the pending transitions
+        recorder.record(1, (True, 16.5, "test"), start + 2 * 60 * 60)
+        recorder.terminate()
+        assert (
+            len(list(recorder.store.get_transitions())) == 7
+        ), "StateTransitionRecorder::terminate didn't store pending transitions"
+        assert (
+            not recorder.is_alive()
+        ), "StateTransitionRecorder::terminate didn't stop the thread"
+
+        ## test that a failed batch is dropped without stopping the thread
+        recorder = StateTransitionRecorder(batch_size=4, flush_interval=60)
+        recorder.start()
+        add_transitions = recorder.store.add_transitions
+
+        def fail_once(payloads):
+            recorder.store.add_transitions = add_transitions
+            raise RuntimeError("database is locked")
+
+        recorder.store.add_transitions = fail_once
+        recorder.record(1, (False, 16.5, "test"), start + 3 * 60 * 60)
+        recorder.flush()
+        assert recorder.is_alive(), "StateTransitionRecorder died on a failed batch"
+        assert recorder.dropped_transitions == 1
+        recorder.record(1, (True, 16.5, "test"), start + 4 * 60 * 60)
+        recorder.flush()
+        assert len(list(recorder.store.get_transitions())) == 8
+        recorder.terminate()
+
+        ## test that a session starts from the on and off times read when it
+        ## started, recording doesn't read them from the database
+        db_api.update_multiple_columns(
+            (
+                SharedDataColumns.LAST_TURNED_ON.value,
+                SharedDataColumns.LAST_TURNED_OFF.value,
+            ),
+            (start + 4 * 60 * 60, start + 5 * 60 * 60),
+        )
+        recorder = StateTransitionRecorder(batch_size=4, flush_interval=60)
+        recorder.start()
+        recorder.start_session(1)
+        db_api.update_column(SharedDataColumns.LAST_TURNED_OFF.value, start)
+        recorder.record(1, (True, 16.5, "test"), start + 5 * 60 * 60 + 30 * 60)
+        recorder.flush()
+        assert (
+            list(recorder.store.get_transitions())[-1]["off_for_minutes"] == 30.0
+        ), "StateTransitionRecorder didn't start the session from its on and off times"
+        recorder.terminate()
+
+        ## test that a full queue drops the transition instead of blocking
+        stalled = StateTransitionRecorder(queue_size=1, queue_timeout=0.05)
+        stalled.record(1, (True, 16.5, "test"), start)
+        record_started = time.monotonic()
+        stalled.record(1, (False, 16.5, "test"), start + 60)
+        assert (
+            time.monotonic() - record_started < 1
+        ), "StateTransitionRecorder::record blocked on a full queue"
+        assert stalled.dropped_transitions == 1
+
+        ## test that a stopped shared recorder is replaced
+        shared = StateTransitionRecorder.get_recorder()
+        shared.terminate()
+        assert StateTransitionRecorder.get_recorder().is_alive()
+        StateTransitionRecorder.terminate_all()
+
+        db_api.close()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print("StateTransitionRecorder class: all unit tests passed")
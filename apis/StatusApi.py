@@ -0,0 +1,375 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.Config import (
+    RUNNING_MODE,
+    RAW_HISTORY_STORAGE,
+    HistoryStorages,
+    STATUS_API_HOST,
+    STATUS_API_PORT,
+    STATUS_TRANSITIONS,
+    STATUS_HISTORY_MINUTES,
+)
+from apis.DatabaseAccess.DbTables import SharedDataColumns
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.DbInterface import DbInterface, DEVICE_STATE_COLUMNS
+from apis.DatabaseAccess.SampleCapture import CaptureReader, get_capture_file
+from apis.DatabaseAccess.StateTransitionStore import StateTransitionStore
+from apis.Registrar import Registrar
+from apis.Utility import Utility
+
+CONTENT_TYPE = "application/json"
+STATUS_PATH = "/status"
+TRANSITIONS_PATH = "/transitions"
+HISTORY_PATH = "/history"
+
+## a write to any of these columns makes the next request take a new snapshot
+WATCHED_COLUMNS: tuple = tuple([column.value for column in SharedDataColumns])
+
+logger = logging.getLogger(__name__)
+
+
+class StatusSnapshot:
+    """
+    The JSON body and ETag of every path, taken at once and never changed
+    afterwards, so request threads can share it without locking
+    """
+
+    def __init__(self, versions: tuple, documents: dict):
+        ## shared data version of every zone, then the transitions stored
+        self.versions = versions
+        self.__responses: dict = dict()  # path -> (etag, body)
+        for path, document in documents.items():
+            body = json.dumps(document, default=str).encode("utf-8")
+            etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+            self.__responses[path] = (etag, body)
+
+    def get_response(self, path: str):
+        """
+        returns the (etag, body) of a path, None if it isn't served
+        """
+        return self.__responses.get(path)
+
+
+class StatusCache:
+    """
+    Holds the latest StatusSnapshot of the shared data, the recent state
+    transitions and the temperature history of every zone. A request only
+    checks the zones' shared data versions and the number of transitions
+    stored, which are kept in memory, and takes a new snapshot from the
+    database if either moved since the last one, so polling between
+    updates queries nothing. Transitions are stored in the background
+    after the switch was published, counting them keeps /transitions
+    from missing the latest one.
+    """
+
+    def __init__(self, db_interface: DbInterface = None, zone_ids=None):
+        if not db_interface:
+            db_interface = DbInterface()
+        if zone_ids is None:
+            zone_ids = Registrar.get_registered_zones(RUNNING_MODE)
+        self.db_interface = db_interface
+        self.zone_interfaces: dict = {
+            zone_id: db_interface.for_zone(zone_id) for zone_id in zone_ids
+        }
+        self.store = StateTransitionStore(db_name=db_interface.db_name)
+        self.refreshes: int = 0  # snapshots taken from the database
+        self.__snapshot: StatusSnapshot = None
+        self.__refresh_lock = threading.Lock()
+
+    def get_snapshot(self):
+        """
+        returns the current snapshot, taking a new one first if any
+        zone's shared data was written since
+        """
+        versions = self.__get_versions()
+        snapshot = self.__snapshot
+        if snapshot and snapshot.versions == versions:
+            return snapshot
+        with self.__refresh_lock:
+            ## another request may have taken it meanwhile
+            versions = self.__get_versions()
+            if not self.__snapshot or self.__snapshot.versions != versions:
+                try:
+                    self.__snapshot = self.__take_snapshot(versions)
+                finally:
+                    ## every request has a thread of its own
+                    DbConnectionManager.get_manager(self.db_interface.db_name).close()
+            return self.__snapshot
+
+    def __get_versions(self):
+        return tuple(
+            [
+                zone_interface.get_update_version(WATCHED_COLUMNS)
+                for zone_interface in self.zone_interfaces.values()
+            ]
+            + [Utility.state_transition_counter]
+        )
+
+    def __take_snapshot(self, versions: tuple):
+        """
+        reads every document served from the database
+        """
+        self.refreshes += 1
+        zone_ids = list(self.zone_interfaces)
+        now = Registrar.get_clock().time()
+        states: dict = self.db_interface.read_device_states(zone_ids)
+        documents: dict = {
+            STATUS_PATH: {
+                "time": now,
+                "zones": {
+                    str(zone_id): states.get(
+                        zone_id, dict.fromkeys(DEVICE_STATE_COLUMNS)
+                    )
+                    for zone_id in zone_ids
+                },
+            },
+            TRANSITIONS_PATH: {
+                "transitions": self.store.get_last_transitions(STATUS_TRANSITIONS),
+            },
+            HISTORY_PATH: {
+                "minutes": STATUS_HISTORY_MINUTES,
+                "zones": {
+                    str(zone_id): self.__read_history(zone_id, now)
+                    for zone_id in zone_ids
+                },
+            },
+        }
+        return StatusSnapshot(versions, documents)
+
+    def __read_history(self, zone_id, now: float):
+        """
+        returns the zone's [timestamp, temperature, device_status] samples
+        of the last STATUS_HISTORY_MINUTES, wherever they are stored
+        """
+        start = now - STATUS_HISTORY_MINUTES * 60
+        if RAW_HISTORY_STORAGE == HistoryStorages.CAPTURE:
+            capture_file = get_capture_file(zone_id)
+            if not os.path.exists(capture_file):
+                return []
+            reader = CaptureReader(capture_file)
+            samples = [list(sample) for sample in reader.read_samples(start)]
+            reader.close()
+            return samples
+        return [
+            list(sample)
+            for sample in self.zone_interfaces[zone_id].get_history(start=start)
+        ]
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the status documents of the server's cache on GET, answers
+    304 Not Modified if the client already has the current ETag
+    """
+
+    def do_GET(self):
+        snapshot: StatusSnapshot = self.server.status_cache.get_snapshot()
+        response = snapshot.get_response(self.path.split("?")[0])
+        if not response:
+            self.send_error(404)
+            return
+        etag, body = response
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"StatusServer::{format % args}")
+
+
+class StatusServer(threading.Thread):
+    """
+    Background thread serving the read only status API over HTTP,
+    on the local interface by default. If the port can't be bound the
+    application runs on without the API.
+    """
+
+    def __init__(
+        self,
+        status_cache: StatusCache = None,
+        host=None,
+        port=None,
+        thread_name="StatusServer",
+    ):
+        threading.Thread.__init__(self, name=thread_name, daemon=True)
+        if not status_cache:
+            status_cache = StatusCache()
+        if not host:
+            self.host = STATUS_API_HOST
+        else:
+            self.host = host
+        if port is None:
+            self.port = STATUS_API_PORT
+        else:
+            self.port = port
+        self.status_cache = status_cache
+        self.server = None
+
+    def start(self):
+        """
+        binds the port and starts serving, logs and returns
+        without serving if the port can't be bound
+        """
+        try:
+            self.server = ThreadingHTTPServer(
+                (self.host, self.port), StatusRequestHandler
+            )
+        except OSError as e:
+            logger.error(
+                f"StatusServer::start can't listen on {self.host}:{self.port}, serving no status: {str(e)}"
+            )
+            return
+        self.server.daemon_threads = True
+        self.server.status_cache = self.status_cache
+        self.port = self.server.server_address[1]  # the one picked for port 0
+        threading.Thread.start(self)
+
+    def run(self):
+        logger.info(f"StatusServer::run serving the status API on port {self.port}")
+        self.server.serve_forever()
+
+    def terminate(self):
+        """
+        stops serving and releases the port
+        """
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    import tempfile
+    import urllib.error
+    import urllib.request
+    from apis.DatabaseAccess.DbTables import DbTables, DB_NAME
+    from apis.StateTransitionRecorder import StateTransitionRecorder
+
+    def get(port: int, path: str, etag=None):
+        """
+        returns the status, headers and decoded body of a request
+        """
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{path}")
+        if etag:
+            request.add_header("If-None-Match", etag)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, None
+
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the database out of the way
+        table_creator = DbTables()
+        table_creator.create_shared_data_table()
+        table_creator.create_temperature_history_table()
+        table_creator.create_state_transition_table()
+        table_creator.create_rollup_tables()
+        db_api = DbInterface()
+        db_api.update_multiple_columns(
+            (
+                SharedDataColumns.LAST_TEMPERATURE.value,
+                SharedDataColumns.TARGET_TEMPERATURE.value,
+            ),
+            (16.5, 17.0),
+        )
+        now = Registrar.get_clock().time()
+        db_api.insert_temperature_samples(
+            [(now - 120, 16.4, "OFF"), (now - 60, 16.5, "OFF")]
+        )
+        db_api.flush()
+        StateTransitionStore().add_transition(
+            Utility().create_payload(
+                (True, 16.5, "test"), db_api.zone_id, 17.0, now, None, now
+            )
+        )
+
+        status_cache = StatusCache(db_api, zone_ids=[db_api.zone_id])
+        server = StatusServer(status_cache, host="127.0.0.1", port=0)
+        server.start()
+
+        ## test that every document is served
+        code, headers, status = get(server.port, STATUS_PATH)
+        assert code == 200, f"StatusServer answered {code}"
+        zone = status["zones"][str(db_api.zone_id)]
+        assert zone[SharedDataColumns.LAST_TEMPERATURE.value] == 16.5
+        assert zone[SharedDataColumns.TARGET_TEMPERATURE.value] == 17.0
+        code, _, transitions = get(server.port, TRANSITIONS_PATH)
+        assert code == 200 and len(transitions["transitions"]) == 1
+        code, _, history = get(server.port, HISTORY_PATH)
+        assert [sample[1] for sample in history["zones"][str(db_api.zone_id)]] == [
+            16.4,
+            16.5,
+        ], "StatusServer served the wrong history"
+        assert get(server.port, "/missing")[0] == 404
+
+        ## test that polling without updates doesn't query the database
+        etag = headers["ETag"]
+        for _ in range(50):
+            assert get(server.port, STATUS_PATH, etag)[0] == 304
+        assert (
+            status_cache.refreshes == 1
+        ), f"StatusCache took {status_cache.refreshes} snapshots without an update"
+
+        ## test that a published update is served with a new etag
+        db_api.update_column(SharedDataColumns.LAST_TEMPERATURE.value, 16.8)
+        code, headers, status = get(server.port, STATUS_PATH, etag)
+        assert code == 200, "StatusServer didn't serve the update"
+        assert headers["ETag"] != etag
+        assert status["zones"][str(db_api.zone_id)]["last_temperature"] == 16.8
+        assert status_cache.refreshes == 2
+
+        ## test that unchanged documents keep their etag
+        _, history_headers, _ = get(server.port, HISTORY_PATH)
+        db_api.update_column(SharedDataColumns.LAST_TEMPERATURE.value, 16.8)
+        assert get(server.port, HISTORY_PATH, history_headers["ETag"])[0] == 304
+
+        ## test that a transition stored after the switch was published
+        ## is served without another shared data write
+        _, transitions_headers, _ = get(server.port, TRANSITIONS_PATH)
+        recorder = StateTransitionRecorder(flush_interval=60)
+        recorder.start()
+        recorder.record(db_api.zone_id, (False, 16.9, "test"), now + 60)
+        recorder.terminate()
+        code, _, transitions = get(
+            server.port, TRANSITIONS_PATH, transitions_headers["ETag"]
+        )
+        assert code == 200, "StatusServer served a stale /transitions"
+        assert len(transitions["transitions"]) == 2
+
+        ## test that a busy port is logged instead of raised
+        logging.disable(logging.ERROR)
+        busy_server = StatusServer(status_cache, host="127.0.0.1", port=server.port)
+        busy_server.start()
+        assert not busy_server.is_alive(), "StatusServer served on a busy port"
+        busy_server.terminate()
+        logging.disable(logging.WARNING)
+
+        server.terminate()
+        db_api.close()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print("StatusApi class: all unit tests passed")
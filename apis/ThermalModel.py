@@ -0,0 +1,158 @@
+import logging
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.Config import MODEL_FORGETTING_FACTOR, MODEL_WARMUP
+
+INITIAL_COVARIANCE = 1.0  # uncertainty of the rates before any observation
+MAXIMUM_COVARIANCE = 100.0  # forgetting stops once the uncertainty grows past this
+
+logger = logging.getLogger(__name__)
+
+
+class ThermalModel:
+    """
+    Learns how fast a room warms up with the heater on and cools down with
+    it off, the rise_rate and drop_rate of TemperatureSensorSim, from the
+    observed rate of change of the temperature. The fit is a recursive least
+    squares of rate = drift + heating * heater_on, older observations fade
+    by the forgetting factor at every update so the rates follow the
+    weather. An update and a prediction take constant time.
+    """
+
+    def __init__(self, forgetting_factor=None, warmup=None):
+        if not forgetting_factor:
+            self.forgetting_factor = MODEL_FORGETTING_FACTOR
+        else:
+            self.forgetting_factor = forgetting_factor
+        if warmup is None:
+            self.warmup = MODEL_WARMUP
+        else:
+            self.warmup = warmup
+
+        self.drift: float = 0.0  # degrees per second with the heater off
+        self.heating: float = 0.0  # degrees per second the heater adds
+        self.__covariance: list = [[INITIAL_COVARIANCE, 0.0], [0.0, INITIAL_COVARIANCE]]
+        self.observations: list = [0, 0]  # with the heater off, with it on
+
+    def update(self, rate: float, heater_on: bool):
+        """
+        adds an observed rate of change in degrees per second
+        """
+        u = 1.0 if heater_on else 0.0
+        (p00, p01), (p10, p11) = self.__covariance
+        ## gain of the regressor (1, u)
+        px0 = p00 + p01 * u
+        px1 = p10 + p11 * u
+        denominator = self.forgetting_factor + px0 + px1 * u
+        k0 = px0 / denominator
+        k1 = px1 / denominator
+
+        error = rate - (self.drift + self.heating * u)
+        self.drift += k0 * error
+        self.heating += k1 * error
+
+        forgetting = self.forgetting_factor
+        if p00 + p11 > MAXIMUM_COVARIANCE:
+            forgetting = 1.0  # nothing new was learned in some direction for long
+        self.__covariance = [
+            [(p00 - k0 * px0) / forgetting, (p01 - k0 * px1) / forgetting],
+            [(p10 - k1 * px0) / forgetting, (p11 - k1 * px1) / forgetting],
+        ]
+        self.observations[int(u)] += 1
+
+    def is_ready(self, heater_on: bool):
+        """
+        tells whether enough rates were observed to predict with the heater
+        in the given state, the heat up rate needs both states
+        """
+        if heater_on:
+            return min(self.observations) >= self.warmup
+        return self.observations[0] >= self.warmup
+
+    def get_rate(self, heater_on: bool):
+        """
+        returns the expected rate of change in degrees per second
+        """
+        if heater_on:
+            return self.drift + self.heating
+        return self.drift
+
+    def predict(self, temperature: float, heater_on: bool, seconds: float):
+        """
+        returns the temperature expected the given number of seconds
+        after the given one
+        """
+        return temperature + self.get_rate(heater_on) * seconds
+
+    def get_time_to_reach(self, temperature: float, target: float, heater_on: bool):
+        """
+        returns in how many seconds the temperature is expected to reach
+        the target, or None if it isn't heading there
+        """
+        rate = self.get_rate(heater_on)
+        difference = target - temperature
+        if difference == 0:
+            return 0.0
+        if rate == 0 or (difference > 0) != (rate > 0):
+            return None
+        return difference / rate
+
+
+if __name__ == "__main__":
+    import random
+
+    random.seed(3)
+    rise_rate, drop_rate = 0.009, 0.035
+
+    ## test that the rates are learned from noisy observations
+    model = ThermalModel(forgetting_factor=0.99, warmup=3)
+    assert not model.is_ready(True), "ThermalModel is ready without observations"
+    for i in range(200):
+        heater_on = (i // 10) % 2 == 1
+        rate = rise_rate if heater_on else -drop_rate
+        model.update(rate + random.gauss(0, 0.002), heater_on)
+    assert model.is_ready(True) and model.is_ready(False)
+    assert (
+        abs(model.get_rate(True) - rise_rate) < 0.002
+    ), f"ThermalModel learned a heat up rate of {model.get_rate(True)}"
+    assert (
+        abs(model.get_rate(False) + drop_rate) < 0.002
+    ), f"ThermalModel learned a cool down rate of {model.get_rate(False)}"
+
+    ## test that the rates follow a change
+    for i in range(300):
+        heater_on = (i // 10) % 2 == 1
+        rate = 2 * rise_rate if heater_on else -drop_rate / 2
+        model.update(rate, heater_on)
+    assert abs(model.get_rate(True) - 2 * rise_rate) < 0.001
+    assert abs(model.get_rate(False) + drop_rate / 2) < 0.001
+
+    ## test the predictions
+    heat_up = model.get_rate(True)
+    assert abs(model.predict(16.0, True, 100) - (16.0 + heat_up * 100)) < 1e-9
+    assert abs(model.get_time_to_reach(16.0, 17.0, True) - 1.0 / heat_up) < 1e-9
+    assert (
+        model.get_time_to_reach(16.0, 17.0, False) is None
+    ), "ThermalModel expects a cooling room to warm up"
+
+    ## test that a long stretch in one state doesn't blow the model up
+    for i in range(5000):
+        model.update(-drop_rate / 2, False)
+    model.update(2 * rise_rate, True)
+    assert abs(model.get_rate(True) - 2 * rise_rate) < 0.005
+
+    ## test that an update takes constant time
+    started = time.perf_counter()
+    for i in range(100000):
+        model.update(0.01, i % 2 == 0)
+    per_update = (time.perf_counter() - started) / 100000
+    assert per_update < 0.00002, f"ThermalModel::update takes {per_update * 1e6} us"
+
+    print("ThermalModel class: all unit tests passed")
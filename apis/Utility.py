@@ -1,24 +1,33 @@
-import datetime
 import json
 import logging
 from enum import Enum
 import os
 import sys
-
+import tempfile
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 grand_parent_dir = os.path.dirname(parent_dir)
-sys.path.append(parent_dir)
-sys.path.append(grand_parent_dir)
-
-from apis.DatabaseAccess.DbTables import SharedDataColumns
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+if grand_parent_dir not in sys.path:
+    sys.path.append(grand_parent_dir)
+
+from apis.DatabaseAccess.DbTables import (
+    SharedDataColumns,
+    DbTables,
+    DB_NAME,
+    get_local_time,
+)
 from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.StateTransitionStore import StateTransitionStore
+from apis.Registrar import Registrar
 
 logger = logging.getLogger(__name__)
 
 STATE_CHANGE_LOGGER = "state_transition_record.txt"
-MAX_RECORDS_TO_STORE = 20
+MAX_RECORDS_TO_STORE = 20  # latest state transitions exported to the text record
 
 
 class Utility:
@@ -29,8 +38,11 @@ class Utility:
 
     state_transition_counter = 0  # static attribute to track total events recorded
 
-    def __init__(self, state_record_file=None, max_capacity=None):
-        self.__db_interface = DbInterface()
+    def __init__(self, state_record_file=None, max_capacity=None, zone_id=None):
+        self.__db_interface = DbInterface(zone_id=zone_id)
+        self.state_transition_store = StateTransitionStore(
+            db_name=self.__db_interface.db_name
+        )
 
         if not state_record_file:
             self.state_record_storage = STATE_CHANGE_LOGGER
@@ -59,10 +71,6 @@ class Utility:
         """
         Record state transition events by providing specific information
         """
-        status: bool = state_data[0]
-        effective_temperature: float = state_data[1]
-        reason: str = state_data[2]
-
         ## read required values from database
         query_result: tuple = self.__db_interface.read_multiple_columns(
             (
@@ -71,6 +79,31 @@ class Utility:
                 SharedDataColumns.LAST_TURNED_OFF.value,
             )
         )
+        payload = self.create_payload(
+            state_data, self.__db_interface.zone_id, *query_result
+        )
+        self.__store_payload(payload)
+        self.log_payload(payload)
+
+    def create_payload(
+        self,
+        state_data: tuple,
+        zone_id,
+        target_temperature: float,
+        last_turned_on: float,
+        last_turned_off: float,
+        timestamp: float = None,
+    ):
+        """
+        builds the state transition payload of a zone from the
+        (status, effective_temperature, reason) state information,
+        times are given in seconds since epoch
+        """
+        status: bool = state_data[0]
+        effective_temperature: float = state_data[1]
+        reason: str = state_data[2]
+        if timestamp is None:
+            timestamp = Registrar.get_clock().time()
         payload = dict()
 
         ## populate payload from input state information
@@ -78,34 +111,32 @@ class Utility:
             payload["state_change"] = "Device Turned On"
         else:
             payload["state_change"] = "Device Turned Off"
+        payload["zone_id"] = zone_id
         payload["state_change_cause"] = reason
         payload["effective_temperature"] = effective_temperature
 
         ## populate payload from database
-        payload["target_temperature"] = query_result[0]
-        payload["last_turned_on"] = query_result[1]
-        payload["last_turned_off"] = query_result[2]
+        payload["target_temperature"] = target_temperature
+        payload["last_turned_on"] = get_local_time(last_turned_on)
+        payload["last_turned_off"] = get_local_time(last_turned_off)
 
         ## populate payload with time deltas
-        payload["current_timestamp"] = datetime.datetime.now()
-        payload["on_for_minutes"] = self.get_time_delta(payload["last_turned_on"])
-        payload["off_for_minutes"] = self.get_time_delta(payload["last_turned_off"])
+        payload["current_timestamp"] = get_local_time(timestamp)
+        payload["on_for_minutes"] = self.get_time_delta(last_turned_on, timestamp)
+        payload["off_for_minutes"] = self.get_time_delta(last_turned_off, timestamp)
+        return payload
 
-        self.write_to_file(payload)
-        self.__log_payload(payload)
-
-    def get_time_delta(self, past_timestamp: str):
+    def get_time_delta(self, past_timestamp: float, time_now: float = None):
         """
-        takes a timestamp in the past, calculates the delta from current time
-        in minutes and returns the delta
+        takes a timestamp in the past in seconds since epoch, calculates
+        the delta from current time (or the given time) in minutes and
+        returns the delta
         """
-        time_now = datetime.datetime.now()
         delta = ""
-        if past_timestamp:
-            past_timestamp = datetime.datetime.strptime(
-                past_timestamp, "%Y-%m-%d %H:%M:%S.%f"
-            )
-            delta = round((time_now - past_timestamp).total_seconds() / 60, 2)
+        if past_timestamp is not None:
+            if time_now is None:
+                time_now = Registrar.get_clock().time()
+            delta = round((time_now - past_timestamp) / 60, 2)
 
         return delta
 
@@ -113,28 +144,36 @@ class Utility:
         """
         Record state transition events by providing the full payload
         """
-        self.write_to_file(payload)
-        self.__log_payload(payload)
+        self.__store_payload(payload)
+        self.log_payload(payload)
 
-    def write_to_file(self, payload: dict):
+    def export_state_transitions(self, file_name=None):
         """
-        private method to write payload to a text file
+        writes the latest state transitions of every zone to the text
+        record, replacing its previous content. Returns the number of
+        transitions written.
         """
-        write_mode = None
-        if os.path.exists(os.path.join(os.getcwd(), self.state_record_storage)):
-            write_mode = "a"
-        else:
-            write_mode = "w"
+        if not file_name:
+            file_name = self.state_record_storage
 
-        with open(self.state_record_storage, write_mode) as file:
-            for key, value in payload.items():
-                file.write(f"{key}: {value} \n")
-            file.write("\n")
+        transitions: list = self.state_transition_store.get_last_transitions(
+            self.max_record_capacity
+        )
+        with open(file_name, "w") as file:
+            for payload in transitions:
+                for key, value in payload.items():
+                    file.write(f"{key}: {value} \n")
+                file.write("\n")
+        return len(transitions)
 
-        Utility.state_transition_counter += 1
-        self.__delete_older_records()
+    def __store_payload(self, payload: dict):
+        """
+        stores the payload in the state transition table
+        """
+        if self.state_transition_store.add_transition(payload):
+            Utility.state_transition_counter += 1
 
-    def __log_payload(self, payload: dict):
+    def log_payload(self, payload: dict):
         """
         logs the given payload to terminal
         """
@@ -145,64 +184,57 @@ class Utility:
             logging.info("====================================")
             return True
         else:
-            logger.error("Utility::__log_payload No payload is provided to log")
+            logger.error("Utility::log_payload No payload is provided to log")
             return False
 
-    def __delete_older_records(self):
-        """
-        delete old record logging file and start fresh,
-        if max storage limit reached
-        """
-        if Utility.state_transition_counter >= self.max_record_capacity:
-            path = os.path.join(os.getcwd(), self.state_record_storage)
-            os.remove(path)
-            Utility.state_transition_counter = 0  # restart counter
-
 
 if __name__ == "__main__":
-    utility = Utility(
-        state_record_file=STATE_CHANGE_LOGGER, max_capacity=MAX_RECORDS_TO_STORE
-    )
-    ## test get time delta
-    time_now = datetime.datetime.now()
-    delta = 15
-    past_time = str(time_now - datetime.timedelta(minutes=delta))
-    assert (
-        utility.get_time_delta(past_time) == delta
-    ), "Utility::get_time_delta failed to calculate time difference"
-
-    ## test write_to_file
-    test_payload = {"test_id": 100, "event": "off"}
-    utility.write_to_file(test_payload)
-    assert (
-        os.path.exists(os.path.join(os.getcwd(), STATE_CHANGE_LOGGER)) == True
-    ), "Utility::write_to_file failed to write to file"
-
-    ## test the magic method __len__
-    assert len(utility) == 1, "Utility::__len__ returns wrong counter"
-
-    ## test delete older record capability
-    if os.path.exists(os.path.join(os.getcwd(), STATE_CHANGE_LOGGER)):
-        os.remove(os.path.join(os.getcwd(), STATE_CHANGE_LOGGER))
-    Utility.state_transition_counter = 0
-
-    test_payload = {"test_id": 1, "event": "on"}
-    capacity_left = 2
-    for i in range(MAX_RECORDS_TO_STORE - capacity_left):
-        utility.record_state_transition_with_payload(test_payload)
-
-    assert (
-        os.path.exists(os.path.join(os.getcwd(), STATE_CHANGE_LOGGER)) == True
-    ), "State transition record didn't get created or got deleted prematuredly"
-
-    utility2 = Utility(
-        state_record_file=STATE_CHANGE_LOGGER, max_capacity=MAX_RECORDS_TO_STORE
-    )
-    ## force deletion of the state record file
-    for i in range(capacity_left):
-        utility2.record_state_transition_with_payload(test_payload)
-
-    assert (
-        os.path.exists(os.path.join(os.getcwd(), STATE_CHANGE_LOGGER)) == False
-    ), "State transition record didn't get deleted as expected"
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the database and records out of the way
+        table_creator = DbTables()
+        table_creator.create_shared_data_table()
+        table_creator.create_state_transition_table()
+        utility = Utility(
+            state_record_file=STATE_CHANGE_LOGGER, max_capacity=MAX_RECORDS_TO_STORE
+        )
+        ## test get time delta
+        delta = 15
+        past_time = Registrar.get_clock().time() - delta * 60
+        assert (
+            utility.get_time_delta(past_time) == delta
+        ), "Utility::get_time_delta failed to calculate time difference"
+
+        ## test that state transitions are stored in the database
+        utility.record_state_transition((True, 16.5, "too cold"))
+        transitions = list(utility.state_transition_store.get_transitions())
+        assert (
+            len(transitions) == 1
+            and transitions[0]["state_change"] == "Device Turned On"
+            and transitions[0]["state_change_cause"] == "too cold"
+        ), "Utility::record_state_transition failed to store the transition"
+
+        ## test the magic method __len__
+        assert len(utility) == 1, "Utility::__len__ returns wrong counter"
+
+        ## test that the text export keeps only the latest transitions
+        test_payload = {"state_change": "Device Turned Off", "zone_id": 1}
+        utility2 = Utility(
+            state_record_file=STATE_CHANGE_LOGGER, max_capacity=MAX_RECORDS_TO_STORE
+        )
+        for i in range(MAX_RECORDS_TO_STORE):
+            utility2.record_state_transition_with_payload(test_payload)
+        assert (
+            utility.export_state_transitions() == MAX_RECORDS_TO_STORE
+        ), "Utility::export_state_transitions exported the wrong transitions"
+        with open(STATE_CHANGE_LOGGER) as file:
+            state_changes = [line for line in file if line.startswith("state_change:")]
+        assert (
+            state_changes
+            == ["state_change: Device Turned Off \n"] * MAX_RECORDS_TO_STORE
+        ), "Utility::export_state_transitions lost the latest transitions"
+
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
     print("Utility class: all unit tests passed")
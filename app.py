@@ -1,15 +1,23 @@
+import time
+
+STARTED = time.perf_counter()  # taken before the application is imported
+
+import argparse
 import logging
 import os
+import sys
 
-from TemperatureSensorThread import TemperatureSensorThread
-from ThermoStatThread import ThermoStatThread
+from ZoneSchedulerThread import ZoneSchedulerThread
 from apis.DatabaseAccess.DbTables import DbTables
 from apis.DatabaseAccess.DbInterface import DbInterface
 from apis.Registrar import Registrar, RunningModes
-from apis.Sensors.TemperatureSensorSim import TemperatureSensorSim
-from apis.Sensors.TemperatureSensorTarget import TemperatureSensorTarget
-from apis.Relays.RelayControllerSim import RelayControllerSim
-from apis.Relays.RelayControllerTarget import RelayControllerTarget
+from apis.Config import RUNNING_MODE, METRICS_ENABLED, STARTUP_TIME_BUDGET
+from apis.Config import STATUS_API_ENABLED
+from apis.Metrics import MetricsServer
+from apis.StatusApi import StatusCache, StatusServer
+from apis.Utility import Utility
+from apis.Relays.RelayCommandQueue import RelayCommandQueue
+from apis.StateTransitionRecorder import StateTransitionRecorder
 
 STATE_CHANGE_LOGGER = "state_transition_record.txt"
 DATABASE = "DeviceHistory.db"
@@ -18,6 +26,30 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def build_simulation_sensor():
+    from apis.Sensors.TemperatureSensorSim import TemperatureSensorSim
+
+    return TemperatureSensorSim()
+
+
+def build_target_sensor():
+    from apis.Sensors.TemperatureSensorTarget import TemperatureSensorTarget
+
+    return TemperatureSensorTarget()
+
+
+def build_simulation_relay(db_api: DbInterface):
+    from apis.Relays.RelayControllerSim import RelayControllerSim
+
+    return RelayControllerSim(db_interface=db_api)
+
+
+def build_target_relay():
+    from apis.Relays.RelayControllerTarget import RelayControllerTarget
+
+    return RelayControllerTarget()
+
+
 def get_target_temperature():
     """
     gets desired temperature from user input
@@ -57,45 +89,120 @@ def delete_file(file_name):
         return False
 
 
-if __name__ == "__main__":
-    ## get target temperature
-    target_temp: float = get_target_temperature()
-
+def prepare_application():
+    """
+    cleans up the previous run, creates the database and registers
+    every sensor and relay controller. Returns the database interface.
+    """
     ## clean up directory
-    files_deleted = delete_file(STATE_CHANGE_LOGGER) and delete_file(DATABASE)
+    files_deleted = (
+        delete_file(STATE_CHANGE_LOGGER)
+        and delete_file(DATABASE)
+        and delete_file(f"{DATABASE}-wal")
+        and delete_file(f"{DATABASE}-shm")
+    )
 
     ## prepare database
     table_creator = DbTables()
     table_creator.create_shared_data_table()
+    table_creator.create_temperature_history_table()
+    table_creator.create_rollup_tables()
+    table_creator.create_state_transition_table()
     db_api = DbInterface()
 
-    ## register all sensors
-    simulation_sensor = TemperatureSensorSim()
-    target_sensor = TemperatureSensorTarget()
-    Registrar.register_temperature_sensor(simulation_sensor, RunningModes.SIM)
-    Registrar.register_temperature_sensor(target_sensor, RunningModes.TARGET)
-
-    ## register all relay controllers
-    simulation_relay = RelayControllerSim(db_interface=db_api)
-    target_relay = RelayControllerTarget()
-    Registrar.register_relay_controllers(simulation_relay, RunningModes.SIM)
-    Registrar.register_relay_controllers(target_relay, RunningModes.TARGET)
-
-    ## register all threads
-    sensor_thread: TemperatureSensorThread = TemperatureSensorThread(
-        db_interface=db_api
+    ## register the sensors and relay controllers of every mode, only
+    ## the ones of the running mode are built when they are first used
+    Registrar.register_temperature_sensor_factory(
+        build_simulation_sensor, RunningModes.SIM
+    )
+    Registrar.register_temperature_sensor_factory(
+        build_target_sensor, RunningModes.TARGET
+    )
+    Registrar.register_relay_controller_factory(
+        lambda: build_simulation_relay(db_api), RunningModes.SIM
+    )
+    Registrar.register_relay_controller_factory(build_target_relay, RunningModes.TARGET)
+
+    return db_api
+
+
+def create_zone_scheduler(target_temp: float, db_api: DbInterface):
+    """
+    registers one scheduler that services every zone of the running mode
+    """
+    zone_scheduler: ZoneSchedulerThread = ZoneSchedulerThread(
+        target_temperatures={
+            zone_id: target_temp
+            for zone_id in Registrar.get_registered_zones(RUNNING_MODE)
+        },
+        db_interface=db_api,
+    )
+    Registrar.register_thread(zone_scheduler)
+    return zone_scheduler
+
+
+def measure_startup_time(target_temp=17.0):
+    """
+    wires the application up without starting it and prints how long
+    the imports and the wiring took. Returns whether it was within
+    the startup time budget.
+    """
+    imported = time.perf_counter()
+    db_api = prepare_application()
+    create_zone_scheduler(target_temp, db_api)
+    wired = time.perf_counter()
+    RelayCommandQueue.terminate_all()
+    StateTransitionRecorder.terminate_all()
+
+    total = wired - STARTED
+    print(
+        f"imports: {round((imported - STARTED) * 1000, 1)} ms, "
+        f"wiring: {round((wired - imported) * 1000, 1)} ms, "
+        f"total: {round(total * 1000, 1)} ms, budget: {STARTUP_TIME_BUDGET * 1000} ms"
     )
-    Registrar.register_thread(sensor_thread)
+    return total <= STARTUP_TIME_BUDGET
+
 
-    thermostat_thread: ThermoStatThread = ThermoStatThread(
-        target_temperature=target_temp, db_interface=db_api
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Smart thermostat")
+    parser.add_argument(
+        "--startup-time",
+        action="store_true",
+        help="wire the application up, print the startup time and exit",
     )
-    Registrar.register_thread(thermostat_thread)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    if arguments.startup_time:
+        sys.exit(0 if measure_startup_time() else 1)
+
+    ## get target temperature
+    target_temp: float = get_target_temperature()
+
+    db_api = prepare_application()
+
+    ## register all threads, one scheduler services every zone
+    create_zone_scheduler(target_temp, db_api)
+
+    ## serve the metrics and the status, the servers stop with the application
+    if METRICS_ENABLED:
+        MetricsServer().start()
+    if STATUS_API_ENABLED:
+        StatusServer(StatusCache(db_api)).start()
 
     ## start all threads
     registered_threads: set = Registrar.get_registered_threads()
     for each_thread in registered_threads:
         each_thread.start()
 
-    for each_thread in registered_threads:
-        each_thread.join()
+    try:
+        for each_thread in registered_threads:
+            each_thread.join()
+    finally:
+        ## execute the queued relay commands, store the queued state
+        ## transitions and keep a plain text record of the latest ones
+        RelayCommandQueue.terminate_all()
+        StateTransitionRecorder.terminate_all()
+        Utility().export_state_transitions()
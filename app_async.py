@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import signal
+
+from AsyncRuntime import AsyncRuntime
+from app import get_target_temperature, prepare_application
+from apis.Config import RUNNING_MODE, METRICS_ENABLED, STATUS_API_ENABLED
+from apis.Metrics import MetricsServer
+from apis.StatusApi import StatusCache, StatusServer
+from apis.Registrar import Registrar
+from apis.Relays.RelayCommandQueue import RelayCommandQueue
+from apis.StateTransitionRecorder import StateTransitionRecorder
+from apis.Utility import Utility
+
+logger = logging.getLogger(__name__)
+
+
+async def main(target_temp: float):
+    """
+    runs every registered zone on one event loop until SIGINT or SIGTERM
+    """
+    db_api = prepare_application()
+    runtime = AsyncRuntime(
+        target_temperatures={
+            zone_id: target_temp
+            for zone_id in Registrar.get_registered_zones(RUNNING_MODE)
+        },
+        db_interface=db_api,
+    )
+    if METRICS_ENABLED:
+        MetricsServer().start()
+    if STATUS_API_ENABLED:
+        StatusServer(StatusCache(db_api)).start()
+    runtime_task = asyncio.create_task(runtime.run())
+
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, runtime_task.cancel)
+
+    try:
+        await runtime_task
+    except asyncio.CancelledError:
+        logger.info("app_async::main runtime stopped")
+    RelayCommandQueue.terminate_all()
+    db_api.flush()
+    StateTransitionRecorder.terminate_all()
+    Utility().export_state_transitions()
+
+
+if __name__ == "__main__":
+    ## get target temperature
+    target_temp: float = get_target_temperature()
+    asyncio.run(main(target_temp))
@@ -0,0 +1,375 @@
+"""
+Runs the micro-benchmarks of the storage layer, the time deltas, the
+state transition record and the gatekeeper decisions, and a macro-benchmark
+of full sensor -> thermostat -> relay iterations in simulation mode.
+Every call is timed on its own and the results are written as JSON
+percentiles. Run from the application directory:
+python3 benchmarks/benchmark_suite.py --output benchmark_results.json
+and flag regressions against a stored baseline with:
+python3 benchmarks/benchmark_suite.py --compare baseline.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import SharedDataColumns, DB_NAME
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.SqliteBackend import SqliteBackend
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+from apis.Clock import Clock
+from apis.Config import RUNNING_MODE, DeviceStatus
+from apis.Registrar import Registrar
+from apis.Relays.RelayControllerSim import RelayControllerSim
+from apis.Relays.PowerControlGateKeeper import PowerControlGateKeeper
+from apis.Simulation.SimulationRunner import SimulationRunner, prepare_database
+from apis.StateTransitionRecorder import StateTransitionRecorder
+from apis.Utility import Utility
+from TemperatureSensorThread import DELAY_BETWEEN_READS
+
+ITERATIONS = 2000  # timed calls per micro-benchmark
+LOOP_ITERATIONS = 2000  # sensor -> thermostat -> relay iterations
+WARMUP = 50  # untimed calls before each benchmark
+ROUNDS = 5  # runs of the whole suite, each in a fresh database
+TOLERANCE = 0.25  # slowdown relative to the baseline flagged as a regression
+METRIC = "p50_us"
+PERCENTILES: tuple = (50, 90, 99)
+GROUPS: tuple = ("db_interface", "utility", "gatekeeper", "simulation")
+
+logger = logging.getLogger(__name__)
+
+
+class DiscardingRecorder:
+    """
+    Drops every state transition, so relay commands only cost
+    the shared data writes
+    """
+
+    def start_session(self, zone_id):
+        pass
+
+    def record(self, zone_id, state_data, timestamp):
+        pass
+
+
+def time_calls(function, iterations: int, warmup=WARMUP):
+    """
+    calls the function warmup times, then times each of the next
+    iterations calls on its own. Returns the durations in seconds.
+    The garbage collector is kept out of the timed calls.
+    """
+    for i in range(warmup):
+        function(i)
+    durations: list = []
+    gc.collect()
+    gc.disable()
+    try:
+        for i in range(iterations):
+            start = time.perf_counter()
+            function(i)
+            durations.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return durations
+
+
+def get_stats(durations: list):
+    """
+    returns the count, mean, min, percentiles and max
+    of the durations in microseconds
+    """
+    samples = [duration * 1_000_000 for duration in durations]
+    cut_points = statistics.quantiles(samples, n=100, method="inclusive")
+    stats = {
+        "count": len(samples),
+        "mean_us": round(statistics.fmean(samples), 3),
+        "min_us": round(min(samples), 3),
+    }
+    for percentile in PERCENTILES:
+        stats[f"p{percentile}_us"] = round(cut_points[percentile - 1], 3)
+    stats["max_us"] = round(max(samples), 3)
+    return stats
+
+
+def benchmark_db_interface(backend_name: str, db_interface: DbInterface, iterations):
+    """
+    times the reads and writes of the control loop on one backend
+    """
+    temperature = SharedDataColumns.LAST_TEMPERATURE.value
+    return {
+        f"db_interface.{backend_name}.update_column": time_calls(
+            lambda i: db_interface.update_column(temperature, 17.0 + i % 10 / 10),
+            iterations,
+        ),
+        f"db_interface.{backend_name}.read_column": time_calls(
+            lambda i: db_interface.read_column(temperature), iterations
+        ),
+        f"db_interface.{backend_name}.read_device_state": time_calls(
+            lambda i: db_interface.read_device_state(), iterations
+        ),
+    }
+
+
+def benchmark_utility(iterations):
+    """
+    times the on and off time delta and the synchronous
+    record of a state transition
+    """
+    utility = Utility()
+    last_turned_on = Registrar.get_clock().time() - 15 * 60
+    return {
+        "utility.get_time_delta": time_calls(
+            lambda i: utility.get_time_delta(last_turned_on), iterations
+        ),
+        "utility.record_state_transition": time_calls(
+            lambda i: utility.record_state_transition((i % 2 == 0, 16.5, "benchmark")),
+            iterations,
+        ),
+    }
+
+
+def benchmark_gatekeeper(iterations):
+    """
+    times turn_on decisions on a device that is off and turn_off decisions
+    on a device that is on, each committed by the relay
+    """
+    db_api = DbInterface(backend=SqliteBackend())
+    Registrar.register_relay_controllers(
+        RelayControllerSim(db_interface=db_api, recorder=DiscardingRecorder()),
+        RUNNING_MODE,
+    )
+    gate_keeper = PowerControlGateKeeper(
+        db_interface=db_api, minimum_on_time=0, cool_down_period=0
+    )
+    db_api.update_column(SharedDataColumns.DEVICE_STATUS.value, DeviceStatus.OFF.value)
+
+    turn_on_durations: list = []
+    turn_off_durations: list = []
+
+    def switch(i):
+        start = time.perf_counter()
+        if i % 2 == 0:
+            gate_keeper.turn_on(17.0, reason="benchmark")
+            turn_on_durations.append(time.perf_counter() - start)
+        else:
+            gate_keeper.turn_off(17.0, reason="benchmark")
+            turn_off_durations.append(time.perf_counter() - start)
+
+    time_calls(switch, 2 * iterations, warmup=0)
+    return {
+        "gatekeeper.turn_on": turn_on_durations,
+        "gatekeeper.turn_off": turn_off_durations,
+    }
+
+
+def benchmark_control_loop(iterations):
+    """
+    times full iterations of the simulation mode on its virtual clock:
+    a sensor read, a thermostat decision and the relay command it leads to
+    """
+    runner = SimulationRunner(target_temperature=17.0, start_time=0)
+
+    def iterate(i):
+        runner.clock.advance(DELAY_BETWEEN_READS)
+        runner.sensor_thread.read_sensor()
+        runner.thermostat_thread.evaluate()
+
+    durations = time_calls(iterate, iterations)
+    StateTransitionRecorder.get_recorder(runner.db_interface.db_name).flush()
+    return {"simulation.control_loop": durations}
+
+
+def run_suite(
+    iterations=ITERATIONS, loop_iterations=LOOP_ITERATIONS, groups=None, rounds=ROUNDS
+):
+    """
+    runs every benchmark group, or only the given ones, rounds times
+    in a scratch directory each and returns the results, the samples of
+    every round are pooled so a single noisy round weighs less
+    """
+    durations: dict = dict()
+    for _ in range(rounds):
+        for name, round_durations in run_round(
+            iterations, loop_iterations, groups
+        ).items():
+            durations.setdefault(name, []).extend(round_durations)
+
+    return {
+        "metadata": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "loop_iterations": loop_iterations,
+            "rounds": rounds,
+        },
+        "benchmarks": {
+            name: get_stats(benchmark_durations)
+            for name, benchmark_durations in durations.items()
+        },
+    }
+
+
+def run_round(iterations, loop_iterations, groups):
+    """
+    runs the selected benchmark groups once in a scratch directory,
+    returns a dictionary of benchmark name -> durations
+    """
+
+    def is_selected(group):
+        return not groups or group in groups
+
+    durations: dict = dict()
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the benchmark's database and records out of the way
+        try:
+            prepare_database()
+            # undo what the previous round's simulation registered, the
+            # mirror of the default backend is asynchronous so it is left out
+            Registrar.register_clock(Clock())
+            DbInterface.register_shared_backend(InMemoryBackend())
+            if is_selected("db_interface"):
+                durations.update(
+                    benchmark_db_interface(
+                        "sqlite", DbInterface(backend=SqliteBackend()), iterations
+                    )
+                )
+                durations.update(
+                    benchmark_db_interface(
+                        "memory", DbInterface(backend=InMemoryBackend()), iterations
+                    )
+                )
+            if is_selected("utility"):
+                durations.update(benchmark_utility(iterations))
+            if is_selected("gatekeeper"):
+                durations.update(benchmark_gatekeeper(iterations))
+            # registers the simulation's shared backend and clock, so it runs last
+            if is_selected("simulation"):
+                durations.update(benchmark_control_loop(loop_iterations))
+
+        finally:
+            StateTransitionRecorder.terminate_all()
+            DbConnectionManager.get_manager(DB_NAME).close_all()
+            os.chdir(original_dir)
+    return durations
+
+
+def compare(results: dict, baseline: dict, metric=METRIC, tolerance=TOLERANCE):
+    """
+    compares the metric of every benchmark in both results, returns a
+    list of (name, baseline, current, ratio, regressed) rows, ratio is
+    current / baseline and regressed means slower by more than the tolerance
+    """
+    rows: list = []
+    for name, stats in results["benchmarks"].items():
+        baseline_stats = baseline["benchmarks"].get(name)
+        if not baseline_stats:
+            continue
+        ratio = stats[metric] / max(baseline_stats[metric], 1e-9)
+        rows.append(
+            (
+                name,
+                baseline_stats[metric],
+                stats[metric],
+                round(ratio, 3),
+                ratio > 1 + tolerance,
+            )
+        )
+    return rows
+
+
+def parse_arguments():
+    """
+    reads the iterations, output file and baseline from the command line
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the control loop and the storage layer"
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=ITERATIONS,
+        help="timed calls per micro-benchmark",
+    )
+    parser.add_argument(
+        "--loop-iterations",
+        type=int,
+        default=LOOP_ITERATIONS,
+        help="sensor -> thermostat -> relay iterations of the macro-benchmark",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=ROUNDS,
+        help="runs of the suite whose samples are pooled",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=GROUPS,
+        default=None,
+        help="only run these groups of benchmarks",
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_results.json",
+        help="json file to write the results to",
+    )
+    parser.add_argument(
+        "--compare", default=None, help="baseline json file to compare against"
+    )
+    parser.add_argument(
+        "--metric", default=METRIC, help="statistic compared with the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="slowdown flagged as a regression, 0.25 is 25%% slower",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    arguments = parse_arguments()
+    results = run_suite(
+        arguments.iterations,
+        arguments.loop_iterations,
+        arguments.only,
+        arguments.rounds,
+    )
+    with open(arguments.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{'benchmark':42} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10}")
+    for name, stats in results["benchmarks"].items():
+        print(
+            f"{name:42} {stats['p50_us']:>10} {stats['p90_us']:>10} {stats['p99_us']:>10}"
+        )
+    print(f"results are in {arguments.output}")
+
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        rows = compare(results, baseline, arguments.metric, arguments.tolerance)
+        print(f"\n{arguments.metric} compared with {arguments.compare}")
+        for name, baseline_value, value, ratio, regressed in rows:
+            flag = "REGRESSION" if regressed else "ok"
+            print(f"{name:42} {baseline_value:>10} -> {value:>10} x{ratio:<7} {flag}")
+        if any([regressed for _, _, _, _, regressed in rows]):
+            sys.exit(1)
@@ -0,0 +1,126 @@
+"""
+Compares DbInterface throughput for each storage backend against the
+previous connect-per-call implementation. Run from the application directory:
+python3 benchmarks/db_interface_benchmark.py
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import DbTables, SharedDataColumns
+from apis.DatabaseAccess.DbInterface import DbInterface, SHARED_DATA_TABLE
+from apis.DatabaseAccess.SqliteBackend import SqliteBackend
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+
+ITERATIONS = 2000
+
+
+class LegacyDbInterface:
+    """
+    The connect-per-call access pattern DbInterface used to have,
+    kept here only as the baseline for this benchmark
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+
+    def update_column(self, column_name, new_value):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM {SHARED_DATA_TABLE}")
+            cursor.fetchone()
+            cursor.execute(
+                f"UPDATE {SHARED_DATA_TABLE} SET {column_name} = ? WHERE id = 1",
+                (new_value,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def read_column(self, column_name):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {column_name} FROM {SHARED_DATA_TABLE} WHERE id = 1"
+            )
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+
+def measure(operation, iterations=ITERATIONS):
+    """
+    returns the operations per second achieved by the given callable
+    """
+    start = time.perf_counter()
+    for i in range(iterations):
+        operation(i)
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed
+
+
+def run_benchmark(iterations=ITERATIONS):
+    """
+    runs the read and write benchmark for every implementation and
+    returns a dictionary of operations per second
+    """
+    results = dict()
+    column = SharedDataColumns.LAST_TEMPERATURE.value
+    with tempfile.TemporaryDirectory() as temp_dir:
+        legacy_db = os.path.join(temp_dir, "legacy.db")
+        pooled_db = os.path.join(temp_dir, "pooled.db")
+        for db_name in (legacy_db, pooled_db):
+            table_creator = DbTables()
+            table_creator.db_name = db_name
+            table_creator.create_shared_data_table()
+
+        legacy = LegacyDbInterface(legacy_db)
+        pooled = DbInterface(backend=SqliteBackend(db_name=pooled_db))
+        in_memory = DbInterface(
+            backend=InMemoryBackend(mirror=SqliteBackend(db_name=pooled_db))
+        )
+
+        results["legacy_write_ops"] = measure(
+            lambda i: legacy.update_column(column, i / 10), iterations
+        )
+        results["legacy_read_ops"] = measure(
+            lambda i: legacy.read_column(column), iterations
+        )
+        results["pooled_write_ops"] = measure(
+            lambda i: pooled.update_column(column, i / 10), iterations
+        )
+        results["pooled_read_ops"] = measure(
+            lambda i: pooled.read_column(column), iterations
+        )
+        results["memory_write_ops"] = measure(
+            lambda i: in_memory.update_column(column, i / 10), iterations
+        )
+        results["memory_read_ops"] = measure(
+            lambda i: in_memory.read_column(column), iterations
+        )
+        pooled.close()
+        in_memory.close()
+
+    return results
+
+
+if __name__ == "__main__":
+    results = run_benchmark()
+    print(f"DbInterface benchmark ({ITERATIONS} operations each)")
+    for operation in ("write", "read"):
+        print(
+            f"{operation + 's:':7} "
+            f"{results[f'legacy_{operation}_ops']:10.0f} ops/s connect-per-call, "
+            f"{results[f'pooled_{operation}_ops']:10.0f} ops/s sqlite backend, "
+            f"{results[f'memory_{operation}_ops']:10.0f} ops/s in-memory backend"
+        )
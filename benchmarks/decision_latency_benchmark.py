@@ -0,0 +1,92 @@
+"""
+Measures the latency between a temperature update and the relay command
+ThermoStatThread issues for it. Run from the application directory:
+python3 benchmarks/decision_latency_benchmark.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import DbTables, SharedDataColumns
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.Registrar import Registrar
+from apis.Config import RUNNING_MODE, DeviceStatus
+from apis.Relays.RelayControllerSim import RelayControllerSim
+from ThermoStatThread import ThermoStatThread
+
+ITERATIONS = 50
+TARGET_TEMPERATURE = 20.0
+DECISION_TIMEOUT = 5  # seconds to wait for the thermostat to act
+
+
+def wait_for_decisions(thermostat: ThermoStatThread, expected_count: int):
+    """
+    blocks until the thermostat has recorded the expected number of decisions
+    """
+    deadline = time.monotonic() + DECISION_TIMEOUT
+    while len(thermostat.decision_latencies) < expected_count:
+        if time.monotonic() > deadline:
+            raise TimeoutError("ThermoStatThread did not act on a temperature update")
+        time.sleep(0.001)
+
+
+def run_benchmark(iterations=ITERATIONS):
+    """
+    alternates temperatures below and above the target, clearing the safety
+    timestamps in between so the gatekeeper never denies a request,
+    and returns the thermostat's latency statistics
+    """
+    db_api = DbInterface()
+    Registrar.register_relay_controllers(
+        RelayControllerSim(db_interface=db_api), RUNNING_MODE
+    )
+    thermostat = ThermoStatThread(
+        target_temperature=TARGET_TEMPERATURE, db_interface=db_api
+    )
+    thermostat.start()
+
+    for i in range(iterations):
+        db_api.update_multiple_columns(
+            (
+                SharedDataColumns.DEVICE_STATUS.value,
+                SharedDataColumns.LAST_TURNED_ON.value,
+                SharedDataColumns.LAST_TURNED_OFF.value,
+            ),
+            (DeviceStatus.OFF.value, None, None),
+        )
+        db_api.update_column(
+            SharedDataColumns.LAST_TEMPERATURE.value, TARGET_TEMPERATURE - 1
+        )
+        wait_for_decisions(thermostat, 2 * i + 1)
+
+        db_api.update_column(SharedDataColumns.LAST_TURNED_ON.value, None)
+        db_api.update_column(
+            SharedDataColumns.LAST_TEMPERATURE.value, TARGET_TEMPERATURE + 1
+        )
+        wait_for_decisions(thermostat, 2 * i + 2)
+
+    thermostat.terminate()
+    thermostat.join()
+    return thermostat.get_decision_latency_stats()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the benchmark's database and records out of the way
+        DbTables().create_shared_data_table()
+        stats = run_benchmark()
+        DbInterface().close()
+
+    print(f"ThermoStatThread decision latency over {stats['count']} relay commands")
+    print(
+        f"min: {stats['min_ms']} ms, avg: {stats['avg_ms']} ms, max: {stats['max_ms']} ms"
+    )
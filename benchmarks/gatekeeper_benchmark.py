@@ -0,0 +1,110 @@
+"""
+Compares how long a PowerControlGateKeeper decision takes when the last
+on time is stored as text and parsed with strptime, as it used to be, and
+when it is stored in seconds since epoch. Run from the application directory:
+python3 benchmarks/gatekeeper_benchmark.py
+"""
+
+import datetime
+import logging
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import SharedDataColumns
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+from apis.Config import RUNNING_MODE, DeviceStatus
+from apis.Registrar import Registrar
+from apis.Relays.RelayController import RelayController
+from apis.Relays.PowerControlGateKeeper import PowerControlGateKeeper, States
+from apis.Utility import Utility
+
+ITERATIONS = 100000
+
+
+class NoOpRelayController(RelayController):
+    """
+    Relay that never switches anything, so only the decision is measured
+    """
+
+    def turn_on(self, effective_temperature=0.0, reason=""):
+        pass
+
+    def turn_off(self, effective_temperature=0.0, reason=""):
+        pass
+
+
+class TextTimestampUtility(Utility):
+    """
+    Computes time deltas from text timestamps the way Utility used to,
+    kept here only as the baseline for this benchmark
+    """
+
+    def get_time_delta(self, past_timestamp: str, time_now=None):
+        if not time_now:
+            time_now = Registrar.get_clock().now()
+        delta = ""
+        if past_timestamp:
+            past_timestamp = datetime.datetime.strptime(
+                past_timestamp, "%Y-%m-%d %H:%M:%S.%f"
+            )
+            delta = round((time_now - past_timestamp).total_seconds() / 60, 2)
+
+        return delta
+
+
+def measure(gatekeeper: PowerControlGateKeeper, iterations=ITERATIONS):
+    """
+    asks the gatekeeper to turn off a device that was only just turned on,
+    which it denies after checking the minimum on time, and returns the
+    average decision time in microseconds
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        state = gatekeeper.turn_off(effective_temperature=17.0, reason="benchmark")
+    elapsed = time.perf_counter() - start
+    assert state == States.REQUEST_DENIED, "the gatekeeper didn't check the on time"
+    return round(elapsed / iterations * 1_000_000, 3)
+
+
+def run_benchmark(iterations=ITERATIONS):
+    """
+    returns the average decision time of both timestamp formats
+    """
+    db_api = DbInterface(backend=InMemoryBackend())
+    Registrar.register_relay_controllers(NoOpRelayController(), RUNNING_MODE)
+    gatekeeper = PowerControlGateKeeper(db_interface=db_api)
+    now = Registrar.get_clock().now()
+    results = dict()
+
+    db_api.update_multiple_columns(
+        (
+            SharedDataColumns.DEVICE_STATUS.value,
+            SharedDataColumns.LAST_TURNED_ON.value,
+        ),
+        (DeviceStatus.ON.value, now.isoformat(sep=" ", timespec="microseconds")),
+    )
+    gatekeeper.utility = TextTimestampUtility()
+    results["text"] = measure(gatekeeper, iterations)
+
+    db_api.update_column(SharedDataColumns.LAST_TURNED_ON.value, now.timestamp())
+    gatekeeper.utility = Utility()
+    results["epoch"] = measure(gatekeeper, iterations)
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    results = run_benchmark()
+
+    print(
+        f"PowerControlGateKeeper::turn_off decision time ({ITERATIONS} decisions each)"
+    )
+    for timestamp_format, average_us in results.items():
+        print(f"{timestamp_format + ':':7} avg: {average_us} us")
@@ -0,0 +1,129 @@
+"""
+Compares the threshold and the predictive control modes over a simulated
+day: relay cycles, how far the temperature overshoots the target and the
+cost of a thermal model update. Run from the application directory:
+python3 benchmarks/predictive_control_benchmark.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.Config import ControlModes
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.DbTables import DB_NAME
+from apis.Sensors.TemperatureSensorSim import TemperatureSensorSim
+from apis.Simulation.SimulationRunner import SimulationRunner, prepare_database
+from apis.StateTransitionRecorder import StateTransitionRecorder
+from apis.ThermalModel import ThermalModel
+
+TARGET_TEMPERATURE = 17.0
+SIMULATED_SECONDS = 24 * 60 * 60
+MODEL_UPDATES = 100000
+
+
+class TrackingRecorder:
+    """
+    Counts the relay switches, the state transitions aren't stored
+    """
+
+    def __init__(self):
+        self.switches = 0
+
+    def start_session(self, zone_id):
+        pass
+
+    def record(self, zone_id, state_data, timestamp):
+        self.switches += 1
+
+    def flush(self):
+        pass
+
+
+class TrackingSensor(TemperatureSensorSim):
+    """
+    Keeps the highest temperature reached while the heater was on
+    after it first got to the target
+    """
+
+    def __init__(self):
+        TemperatureSensorSim.__init__(self)
+        self.peaks: list = []  # highest temperature of every heating cycle
+        self.__heating = False
+
+    def get_temperature(self, device_status: bool):
+        temperature = TemperatureSensorSim.get_temperature(self, device_status)
+        if device_status and not self.__heating:
+            self.peaks.append(temperature)
+        elif device_status:
+            self.peaks[-1] = max(self.peaks[-1], temperature)
+        self.__heating = device_status
+        return temperature
+
+
+def run_day(control_mode: ControlModes):
+    """
+    simulates a day in the given mode, returns the relay cycles, the mean
+    and the highest overshoot of the heating peaks above the target
+    """
+    recorder = TrackingRecorder()
+    sensor = TrackingSensor()
+    runner = SimulationRunner(
+        target_temperature=TARGET_TEMPERATURE,
+        start_time=0,
+        sensor=sensor,
+        recorder=recorder,
+        control_mode=control_mode,
+    )
+    runner.run(SIMULATED_SECONDS)
+    ## the first cycle heats up from the start temperature
+    overshoots = [
+        round(peak - TARGET_TEMPERATURE, 3)
+        for peak in sensor.peaks[1:]
+        if peak >= TARGET_TEMPERATURE - 0.5
+    ]
+    return (
+        recorder.switches // 2,
+        round(sum(overshoots) / max(len(overshoots), 1), 3),
+        max(overshoots, default=0.0),
+    )
+
+
+def time_model_update():
+    """
+    returns the microseconds a thermal model update takes
+    """
+    model = ThermalModel()
+    started = time.perf_counter()
+    for i in range(MODEL_UPDATES):
+        model.update(0.01, i % 2 == 0)
+    return round((time.perf_counter() - started) / MODEL_UPDATES * 1_000_000, 3)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    results = dict()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the benchmark's database out of the way
+        prepare_database()
+        for control_mode in (ControlModes.THRESHOLD, ControlModes.PREDICTIVE):
+            results[control_mode.value] = run_day(control_mode)
+        StateTransitionRecorder.terminate_all()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print(f"A simulated day at a target of {TARGET_TEMPERATURE} C")
+    for mode, (cycles, mean_overshoot, max_overshoot) in results.items():
+        print(
+            f"{mode + ':':12} {cycles} relay cycles, overshoot mean: "
+            f"{mean_overshoot} C, max: {max_overshoot} C"
+        )
+    print(f"thermal model update: {time_model_update()} us")
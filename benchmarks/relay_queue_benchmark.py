@@ -0,0 +1,139 @@
+"""
+Feeds a noisy temperature hovering around the target to a thermostat that
+switches the relay right away and to one that queues its commands to a
+RelayCommandQueue, and counts the relay switches and the storage round
+trips of both. Run from the application directory:
+python3 benchmarks/relay_queue_benchmark.py
+"""
+
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import DbTables, SharedDataColumns, DB_NAME
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.SqliteBackend import SqliteBackend
+from apis.Config import RUNNING_MODE
+from apis.Registrar import Registrar
+from apis.Relays.RelayCommandQueue import RelayCommandQueue
+from apis.Relays.RelayControllerSim import RelayControllerSim
+from ThermoStatThread import ThermoStatThread
+
+TARGET_TEMPERATURE = 20.0
+UPDATES = 200
+UPDATE_INTERVAL = 0.02  # seconds between temperature updates
+NOISE = 0.2  # standard deviation of the temperature in celsius
+COMMAND_DELAY = 0.25  # seconds
+
+
+class CountingBackend(SqliteBackend):
+    """
+    Counts every call, each call is one round trip to the storage
+    """
+
+    def __init__(self):
+        SqliteBackend.__init__(self)
+        self.round_trips = 0
+
+    def write(self, *args, **kwargs):
+        self.round_trips += 1
+        return SqliteBackend.write(self, *args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        self.round_trips += 1
+        return SqliteBackend.read(self, *args, **kwargs)
+
+    def compare_and_write(self, *args, **kwargs):
+        self.round_trips += 1
+        return SqliteBackend.compare_and_write(self, *args, **kwargs)
+
+
+class CountingRecorder:
+    """
+    Counts the relay switches, the state transitions aren't stored
+    """
+
+    def __init__(self):
+        self.switches = 0
+
+    def start_session(self, zone_id):
+        pass
+
+    def record(self, zone_id, state_data, timestamp):
+        self.switches += 1
+
+
+def run(relay_queue: RelayCommandQueue = None):
+    """
+    runs a decision after every noisy temperature update, returns the
+    relay switches and the storage round trips of the decisions and
+    the relay commands
+    """
+    random.seed(7)
+    backend = CountingBackend()
+    db_api = DbInterface(backend=backend)
+    recorder = CountingRecorder()
+    Registrar.register_relay_controllers(
+        RelayControllerSim(db_interface=db_api, recorder=recorder), RUNNING_MODE
+    )
+    thermostat = ThermoStatThread(
+        target_temperature=TARGET_TEMPERATURE,
+        db_interface=db_api,
+        minimum_on_time=0,
+        cool_down_period=0,
+        relay_queue=relay_queue,
+    )
+
+    round_trips_before = backend.round_trips
+    for i in range(UPDATES):
+        temperature = (
+            TARGET_TEMPERATURE
+            + 0.3 * math.sin(2 * math.pi * i / UPDATES)
+            + random.gauss(0, NOISE)
+        )
+        db_api.update_column(SharedDataColumns.LAST_TEMPERATURE.value, temperature)
+        thermostat.evaluate()
+        time.sleep(UPDATE_INTERVAL)
+    if relay_queue:
+        relay_queue.flush()
+
+    ## the queue switches the relay in between the decisions, the
+    ## temperature updates aren't counted
+    round_trips = backend.round_trips - round_trips_before - UPDATES
+    return recorder.switches, round_trips
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the benchmark's database out of the way
+        DbTables().create_shared_data_table()
+        inline = run()
+        relay_queue = RelayCommandQueue(delay=COMMAND_DELAY)
+        relay_queue.start()
+        queued = run(relay_queue)
+        relay_queue.terminate()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print(
+        f"{UPDATES} temperature updates {int(UPDATE_INTERVAL * 1000)} ms apart, "
+        f"{NOISE} C of noise around the target"
+    )
+    print(f"switched right away: {inline[0]} relay switches, {inline[1]} round trips")
+    print(
+        f"command queue:       {queued[0]} relay switches, {queued[1]} round trips, "
+        f"{relay_queue.merged_commands} commands merged, "
+        f"{relay_queue.dropped_commands} dropped, {relay_queue.executed_commands} executed"
+    )
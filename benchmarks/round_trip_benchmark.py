@@ -0,0 +1,238 @@
+"""
+Counts the storage round trips of a thermostat decision when every column
+is read on its own and the new status is written unconditionally, as it
+used to be, and when the decision is made on one snapshot and committed
+with a compare and swap. Run from the application directory:
+python3 benchmarks/round_trip_benchmark.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import (
+    DbTables,
+    SharedDataColumns,
+    DB_NAME,
+    DEFAULT_ZONE,
+)
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.StorageBackend import StorageBackend
+from apis.DatabaseAccess.SqliteBackend import SqliteBackend
+from apis.Config import RUNNING_MODE, DeviceStatus
+from apis.Registrar import Registrar
+from apis.Relays.RelayControllerSim import RelayControllerSim
+from apis.Relays.PowerControlGateKeeper import PowerControlGateKeeper, States
+from apis.Utility import Utility
+from ThermoStatThread import ThermoStatThread
+
+ITERATIONS = 1000
+TARGET_TEMPERATURE = 20.0
+MAXIMUM_ON_TIME = 15
+
+
+class CountingBackend(StorageBackend):
+    """
+    Passes every call on to another backend and counts them,
+    each call is one round trip to the storage
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.round_trips = 0
+
+    def write(self, column_names, new_values, zone_id=DEFAULT_ZONE):
+        self.round_trips += 1
+        return self.backend.write(column_names, new_values, zone_id)
+
+    def read(self, column_names, zone_id=DEFAULT_ZONE):
+        self.round_trips += 1
+        return self.backend.read(column_names, zone_id)
+
+    def compare_and_write(
+        self,
+        expected_column,
+        expected_value,
+        column_names,
+        new_values,
+        zone_id=DEFAULT_ZONE,
+    ):
+        self.round_trips += 1
+        return self.backend.compare_and_write(
+            expected_column, expected_value, column_names, new_values, zone_id
+        )
+
+    def read_zones(self, column_names, zone_ids):
+        self.round_trips += 1
+        return self.backend.read_zones(column_names, zone_ids)
+
+    def add_zones(self, zone_ids):
+        return self.backend.add_zones(zone_ids)
+
+
+class NoOpRecorder:
+    """
+    Drops every state transition, so only the shared data is measured
+    """
+
+    def start_session(self, zone_id):
+        pass
+
+    def record(self, zone_id, state_data, timestamp):
+        pass
+
+
+class PerColumnGateKeeper(PowerControlGateKeeper):
+    """
+    Reads the status and the last on or off time one column at a time and
+    switches unconditionally, the way PowerControlGateKeeper used to,
+    kept here only as the baseline for this benchmark
+    """
+
+    def turn_on(self, effective_temperature=0.0, reason="", state=None):
+        if (
+            self.db_interface.read_column(SharedDataColumns.DEVICE_STATUS.value)
+            == DeviceStatus.ON.value
+        ):
+            return States.ALREADY_ON
+        last_turned_off = self.db_interface.read_column(
+            SharedDataColumns.LAST_TURNED_OFF.value
+        )
+        if (
+            last_turned_off is None
+            or self.utility.get_time_delta(last_turned_off) >= self.cool_down_period
+        ):
+            self.relay_controller.turn_on(effective_temperature, reason=reason)
+            return States.TURNED_ON
+        return States.REQUEST_DENIED
+
+    def turn_off(self, effective_temperature=0.0, reason="", state=None):
+        if (
+            self.db_interface.read_column(SharedDataColumns.DEVICE_STATUS.value)
+            == DeviceStatus.OFF.value
+        ):
+            return States.ALREADY_OFF
+        last_turned_on = self.db_interface.read_column(
+            SharedDataColumns.LAST_TURNED_ON.value
+        )
+        if (
+            last_turned_on is None
+            or self.utility.get_time_delta(last_turned_on) >= self.minimum_on_time
+        ):
+            self.relay_controller.turn_off(effective_temperature, reason=reason)
+            return States.TURNED_OFF
+        return States.REQUEST_DENIED
+
+
+def evaluate_per_column(db_interface: DbInterface, gate_keeper: PowerControlGateKeeper):
+    """
+    the decision ThermoStatThread::evaluate used to make, reading the
+    temperatures and the last on time separately
+    """
+    current_temp, target_temp = db_interface.read_multiple_columns(
+        (
+            SharedDataColumns.LAST_TEMPERATURE.value,
+            SharedDataColumns.TARGET_TEMPERATURE.value,
+        )
+    )
+    last_turned_on = db_interface.read_column(SharedDataColumns.LAST_TURNED_ON.value)
+    if (
+        last_turned_on is not None
+        and Utility().get_time_delta(last_turned_on) >= MAXIMUM_ON_TIME
+    ):
+        if gate_keeper.turn_off(current_temp, reason="maximum on time") == (
+            States.TURNED_OFF
+        ):
+            return
+    if current_temp <= target_temp:
+        gate_keeper.turn_on(current_temp, reason="below target")
+    else:
+        gate_keeper.turn_off(current_temp, reason="above target")
+
+
+def measure(db_interface: DbInterface, evaluate, switching: bool):
+    """
+    runs a decision after every temperature update, alternating below and
+    above the target if switching, and returns the round trips and the
+    microseconds per decision
+    """
+    backend: CountingBackend = db_interface.backend
+    round_trips = 0
+    elapsed = 0.0
+    for i in range(ITERATIONS):
+        offset = -1 if not switching or i % 2 == 0 else 1
+        db_interface.update_column(
+            SharedDataColumns.LAST_TEMPERATURE.value, TARGET_TEMPERATURE + offset
+        )
+        round_trips_before = backend.round_trips
+        start = time.perf_counter()
+        evaluate()
+        elapsed += time.perf_counter() - start
+        round_trips += backend.round_trips - round_trips_before
+    return round(round_trips / ITERATIONS, 2), round(
+        elapsed / ITERATIONS * 1_000_000, 1
+    )
+
+
+def run_benchmark():
+    """
+    returns the round trips and the time per decision of both
+    approaches, on ticks that switch the device and on ticks that don't
+    """
+    db_api = DbInterface(backend=CountingBackend(SqliteBackend()))
+    Registrar.register_relay_controllers(
+        RelayControllerSim(db_interface=db_api, recorder=NoOpRecorder()), RUNNING_MODE
+    )
+    thermostat = ThermoStatThread(
+        target_temperature=TARGET_TEMPERATURE,
+        db_interface=db_api,
+        minimum_on_time=0,
+        cool_down_period=0,
+        maximum_on_time=MAXIMUM_ON_TIME,
+    )
+    gate_keeper = PerColumnGateKeeper(
+        db_interface=db_api, minimum_on_time=0, cool_down_period=0
+    )
+
+    results = dict()
+    for switching in (True, False):
+        scenario = "switching" if switching else "steady"
+        results[scenario] = {
+            "per column": measure(
+                db_api, lambda: evaluate_per_column(db_api, gate_keeper), switching
+            ),
+            "snapshot": measure(db_api, thermostat.evaluate, switching),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the benchmark's database out of the way
+        DbTables().create_shared_data_table()
+        results = run_benchmark()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print(f"ThermoStatThread decision round trips ({ITERATIONS} decisions each)")
+    for scenario, approaches in results.items():
+        per_column, _ = approaches["per column"]
+        snapshot, _ = approaches["snapshot"]
+        for approach, (round_trips, average_us) in approaches.items():
+            print(
+                f"{scenario + ', ' + approach + ':':22} {round_trips} round trips, "
+                f"avg: {average_us} us"
+            )
+        print(
+            f"{scenario + ' eliminated:':22} {round(per_column - snapshot, 2)} round trips"
+        )
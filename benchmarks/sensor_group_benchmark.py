@@ -0,0 +1,64 @@
+"""
+Compares reading three 1-wire like sensors of 750 ms one after the other
+with reading them as a TemperatureSensorGroup, with and without a fourth
+sensor that hangs. Run from the application directory:
+python3 benchmarks/sensor_group_benchmark.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.Config import SensorFusions
+from apis.Sensors.TemperatureSensorGroup import TemperatureSensorGroup, SlowSensor
+
+CONVERSION_TIME = 0.75  # seconds a 1-wire sensor takes to read
+HUNG_SENSOR_TIME = 5.0  # seconds the hanging sensor takes to read
+DEADLINE = 0.9  # seconds
+READS = 3
+
+
+def time_reads(read):
+    """
+    returns the mean milliseconds of a read
+    """
+    started = time.perf_counter()
+    for _ in range(READS):
+        read()
+    return round((time.perf_counter() - started) / READS * 1000, 1)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    sensors = [
+        SlowSensor(17.0 + i / 10, CONVERSION_TIME) for i in range(3)
+    ]  # healthy sensors
+
+    sequential = time_reads(lambda: [sensor.get_temperature() for sensor in sensors])
+
+    group = TemperatureSensorGroup(sensors, SensorFusions.MEDIAN, DEADLINE)
+    parallel = time_reads(group.get_temperature)
+    group.close()
+
+    hung_group = TemperatureSensorGroup(
+        sensors + [SlowSensor(30.0, HUNG_SENSOR_TIME)], SensorFusions.MEDIAN, DEADLINE
+    )
+    with_hung = time_reads(hung_group.get_temperature)
+    fused = hung_group.get_temperature()
+    stale = sorted(hung_group.stale_sensors)
+    hung_group.close()
+
+    print(
+        f"{len(sensors)} sensors of {int(CONVERSION_TIME * 1000)} ms, mean of {READS} reads"
+    )
+    print(f"one after the other:          {sequential} ms")
+    print(f"sensor group:                 {parallel} ms")
+    print(
+        f"sensor group, a hung sensor:  {with_hung} ms, stale: {stale}, read: {fused} C"
+    )
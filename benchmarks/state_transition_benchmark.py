@@ -0,0 +1,125 @@
+"""
+Compares how long RelayControllerSim takes to switch the device when the
+state transition is recorded synchronously, as it used to be, and when it
+is queued for the background recorder. Run from the application directory:
+python3 benchmarks/state_transition_benchmark.py
+"""
+
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import DbTables, DB_NAME
+from apis.DatabaseAccess.DbInterface import DbInterface
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.RollupEngine import RollupEngine
+from apis.Config import DeviceStatus
+from apis.Registrar import Registrar
+from apis.Relays.RelayControllerSim import RelayControllerSim
+from apis.StateTransitionRecorder import StateTransitionRecorder
+from apis.Utility import Utility
+
+ITERATIONS = 1000
+
+
+class SynchronousRecorder:
+    """
+    Records every state transition and its duty cycle before the relay
+    returns, the way RelayControllerSim used to, kept here only as the
+    baseline for this benchmark
+    """
+
+    def __init__(self):
+        self.utilities: dict = dict()  # zone id -> Utility
+        self.rollup_engines: dict = dict()  # zone id -> RollupEngine
+
+    def start_session(self, zone_id):
+        self.utilities[zone_id] = Utility(zone_id=zone_id)
+        self.rollup_engines[zone_id] = RollupEngine(zone_id=zone_id)
+
+    def record(self, zone_id, state_data: tuple, timestamp: datetime.datetime):
+        self.rollup_engines[zone_id].record_device_state(
+            DeviceStatus.ON.value if state_data[0] else DeviceStatus.OFF.value,
+            Registrar.get_clock().time(),
+        )
+        self.utilities[zone_id].record_state_transition(state_data)
+
+    def flush(self):
+        pass
+
+
+def measure(controller: RelayControllerSim, iterations=ITERATIONS):
+    """
+    switches the device on and off and returns the latency of every
+    relay command in milliseconds, sorted
+    """
+    latencies: list = []
+    for i in range(iterations):
+        switch = controller.turn_on if i % 2 == 0 else controller.turn_off
+        start = time.perf_counter()
+        switch(effective_temperature=17.0, reason="benchmark")
+        latencies.append((time.perf_counter() - start) * 1000)
+    controller.recorder.flush()
+    return sorted(latencies)
+
+
+def get_stats(latencies: list):
+    """
+    returns the average, median and 99th percentile of sorted latencies
+    """
+    return {
+        "avg_ms": round(sum(latencies) / len(latencies), 4),
+        "p50_ms": round(latencies[len(latencies) // 2], 4),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)], 4),
+    }
+
+
+def run_benchmark(iterations=ITERATIONS):
+    """
+    returns the relay command latency statistics of both recorders
+    """
+    db_api = DbInterface()
+    results = dict()
+    results["synchronous"] = get_stats(
+        measure(
+            RelayControllerSim(db_interface=db_api, recorder=SynchronousRecorder()),
+            iterations,
+        )
+    )
+    recorder = StateTransitionRecorder()
+    recorder.start()
+    results["background"] = get_stats(
+        measure(RelayControllerSim(db_interface=db_api, recorder=recorder), iterations)
+    )
+    recorder.terminate()
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the benchmark's database out of the way
+        table_creator = DbTables()
+        table_creator.create_shared_data_table()
+        table_creator.create_rollup_tables()
+        table_creator.create_state_transition_table()
+        results = run_benchmark()
+        DbInterface().close()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print(f"RelayControllerSim relay command latency ({ITERATIONS} commands each)")
+    for recorder_type, stats in results.items():
+        print(
+            f"{recorder_type + ':':13} avg: {stats['avg_ms']} ms, "
+            f"p50: {stats['p50_ms']} ms, p99: {stats['p99_ms']} ms"
+        )
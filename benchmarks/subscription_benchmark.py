@@ -0,0 +1,107 @@
+"""
+Simulates an hour of the thermostat with the sensor and the thermostat
+polling the device status from the database, and with them following it
+from their cached columns, and counts the database queries of both.
+Run from the application directory:
+python3 benchmarks/subscription_benchmark.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from apis.DatabaseAccess.DbTables import DB_NAME
+from apis.DatabaseAccess.DbInterface import DbInterface, SHARED_DATA_COLUMNS
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.InMemoryBackend import InMemoryBackend
+from apis.Simulation.SimulationRunner import SimulationRunner, prepare_database
+from apis.StateTransitionRecorder import StateTransitionRecorder
+
+TARGET_TEMPERATURE = 17.0
+SIMULATED_SECONDS = 60 * 60
+
+
+class CountingBackend(InMemoryBackend):
+    """
+    Counts the reads and the writes of the shared data, the in memory
+    backend reads through read_zones and writes through write_zones
+    """
+
+    def __init__(self):
+        InMemoryBackend.__init__(self)
+        self.reads = 0
+        self.writes = 0
+
+    def read_zones(self, *args, **kwargs):
+        self.reads += 1
+        return InMemoryBackend.read_zones(self, *args, **kwargs)
+
+    def write_zones(self, *args, **kwargs):
+        self.writes += 1
+        return InMemoryBackend.write_zones(self, *args, **kwargs)
+
+    def compare_and_write(self, *args, **kwargs):
+        self.writes += 1
+        return InMemoryBackend.compare_and_write(self, *args, **kwargs)
+
+
+def run(cached: bool):
+    """
+    simulates an hour, returns the reads, the writes and the change
+    events dispatched for every column during the run
+    """
+    backend = CountingBackend()
+    db_api = DbInterface(backend=backend)
+    runner = SimulationRunner(
+        target_temperature=TARGET_TEMPERATURE, db_interface=db_api, start_time=0
+    )
+    if not cached:
+        ## the consumers poll the database, as before the subscriptions
+        runner.sensor_thread.cached_columns.close()
+        runner.thermostat_thread.cached_columns.close()
+        runner.sensor_thread.cached_columns = db_api
+        runner.thermostat_thread.cached_columns = db_api
+
+    events: dict = dict()  # column name -> change events seen
+
+    def count_event(column_name, value):
+        events[column_name] = events.get(column_name, 0) + 1
+
+    for column_name in SHARED_DATA_COLUMNS:
+        db_api.subscribe(column_name, count_event)
+    reads_before, writes_before = backend.reads, backend.writes
+    runner.run(SIMULATED_SECONDS)
+    return (
+        backend.reads - reads_before,
+        backend.writes - writes_before,
+        sum(events.values()),
+    )
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # keep the benchmark's database out of the way
+        prepare_database()
+        polled = run(cached=False)
+        cached = run(cached=True)
+        StateTransitionRecorder.terminate_all()
+        DbConnectionManager.get_manager(DB_NAME).close_all()
+        os.chdir(original_dir)
+
+    print(f"one simulated hour at {TARGET_TEMPERATURE} C")
+    print(f"polling the database: {polled[0]} queries, {polled[1]} writes")
+    print(
+        f"cached columns:       {cached[0]} queries, {cached[1]} writes, "
+        f"{cached[2]} change events dispatched"
+    )
+    print(
+        f"queries per simulated hour down {round((1 - cached[0] / polled[0]) * 100)} %"
+    )
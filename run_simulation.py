@@ -0,0 +1,54 @@
+import argparse
+import logging
+import time
+
+from app import delete_file, STATE_CHANGE_LOGGER, DATABASE
+from apis.Simulation.SimulationRunner import SimulationRunner, prepare_database
+from apis.Utility import Utility
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_HOUR = 3600
+
+
+def parse_arguments():
+    """
+    reads the target temperature and the simulated duration
+    from the command line
+    """
+    parser = argparse.ArgumentParser(
+        description="Runs the simulation mode faster than real time"
+    )
+    parser.add_argument(
+        "--target", type=float, default=17.0, help="target temperature in Celsius"
+    )
+    parser.add_argument(
+        "--hours", type=float, default=24, help="number of hours to simulate"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)  # app.py configures INFO
+    arguments = parse_arguments()
+
+    ## clean up directory, same as app.py
+    for file_name in (
+        STATE_CHANGE_LOGGER,
+        DATABASE,
+        f"{DATABASE}-wal",
+        f"{DATABASE}-shm",
+    ):
+        delete_file(file_name)
+    prepare_database()
+
+    runner = SimulationRunner(target_temperature=arguments.target)
+    started = time.perf_counter()
+    runner.run(arguments.hours * SECONDS_PER_HOUR)
+    elapsed = time.perf_counter() - started
+    Utility().export_state_transitions()
+
+    print(
+        f"Simulated {arguments.hours} hours in {round(elapsed, 3)} seconds, "
+        f"the latest state transitions are in {STATE_CHANGE_LOGGER}"
+    )
@@ -0,0 +1,98 @@
+import argparse
+import logging
+import os
+import time
+
+from apis.Config import MINIMUM_ON_TIME, COOL_DOWN_PERIOD, MAXIMUM_ON_TIME
+from apis.Sensors.TemperatureSensorSim import CONFIG_FILE
+from apis.Simulation.ParameterSweep import build_grid, run_sweep
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_HOUR = 3600
+RESULTS_TO_PRINT = 5
+
+
+def parse_arguments():
+    """
+    reads the grid of safety timings, targets and sensor profiles
+    from the command line
+    """
+    parser = argparse.ArgumentParser(
+        description="Simulates every combination of the given values on all cores "
+        "and ranks them by relay cycles, on time and temperature error"
+    )
+    parser.add_argument(
+        "--minimum-on",
+        type=float,
+        nargs="+",
+        default=[MINIMUM_ON_TIME],
+        help="minimum on times in minutes",
+    )
+    parser.add_argument(
+        "--cool-down",
+        type=float,
+        nargs="+",
+        default=[COOL_DOWN_PERIOD],
+        help="cool down periods in minutes",
+    )
+    parser.add_argument(
+        "--maximum-on",
+        type=float,
+        nargs="+",
+        default=[MAXIMUM_ON_TIME],
+        help="maximum on times in minutes",
+    )
+    parser.add_argument(
+        "--targets",
+        type=float,
+        nargs="+",
+        default=[17.0],
+        help="target temperatures in Celsius",
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=[CONFIG_FILE],
+        help="simulation_parameters.json style sensor profiles",
+    )
+    parser.add_argument(
+        "--hours", type=float, default=24, help="number of hours to simulate"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes, all cores by default",
+    )
+    parser.add_argument(
+        "--output", default="sweep_results.csv", help="csv file to write the results to"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    configurations = build_grid(
+        arguments.minimum_on,
+        arguments.cool_down,
+        arguments.maximum_on,
+        arguments.targets,
+        [os.path.abspath(profile) for profile in arguments.profiles],
+    )
+
+    started = time.perf_counter()
+    ranked = run_sweep(
+        configurations,
+        arguments.hours * SECONDS_PER_HOUR,
+        arguments.output,
+        max_workers=arguments.workers,
+    )
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"Simulated {len(configurations)} configurations of {arguments.hours} hours "
+        f"in {round(elapsed, 3)} seconds, results are in {arguments.output}"
+    )
+    for result in ranked[:RESULTS_TO_PRINT]:
+        print(result)
@@ -0,0 +1,72 @@
+import argparse
+import csv
+import logging
+import os
+import tempfile
+import time
+
+from apis.DatabaseAccess.DbConnectionManager import DbConnectionManager
+from apis.DatabaseAccess.DbTables import DB_NAME
+from apis.Simulation.SimulationRunner import prepare_database
+from apis.Simulation.TraceReplay import TraceReplay
+from apis.StateTransitionRecorder import StateTransitionRecorder
+
+logger = logging.getLogger(__name__)
+
+
+def parse_arguments():
+    """
+    reads the trace, the target temperature and the output file
+    from the command line
+    """
+    parser = argparse.ArgumentParser(
+        description="Replays a recorded temperature trace through the thermostat"
+    )
+    parser.add_argument(
+        "--trace", required=True, help="csv file of timestamp,temperature rows"
+    )
+    parser.add_argument(
+        "--target", type=float, default=17.0, help="target temperature in Celsius"
+    )
+    parser.add_argument(
+        "--output",
+        default="replayed_transitions.csv",
+        help="csv file to write the state transitions to",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    arguments = parse_arguments()
+    trace_file = os.path.abspath(arguments.trace)
+    output_file = os.path.abspath(arguments.output)
+
+    original_dir = os.getcwd()
+    transitions = 0
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as temp_dir, open(
+        output_file, "w", newline=""
+    ) as file:
+        os.chdir(temp_dir)  # the replay's database is thrown away
+        try:
+            prepare_database()
+            trace_replay = TraceReplay(trace_file, target_temperature=arguments.target)
+            writer = None
+            for payload in trace_replay.replay():
+                if not writer:
+                    writer = csv.DictWriter(file, fieldnames=list(payload.keys()))
+                    writer.writeheader()
+                writer.writerow(payload)
+                transitions += 1
+
+        finally:
+            StateTransitionRecorder.terminate_all()
+            DbConnectionManager.get_manager(DB_NAME).close_all()
+            os.chdir(original_dir)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"Replayed {trace_replay.samples} samples in {round(elapsed, 3)} seconds, "
+        f"{transitions} state transitions are in {arguments.output}"
+    )
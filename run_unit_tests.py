@@ -3,9 +3,32 @@ import subprocess
 # Define the command to run
 commands = [
     ["python3", "apis/Utility.py"],
+    ["python3", "apis/Metrics.py"],
+    ["python3", "apis/StatusApi.py"],
+    ["python3", "apis/ThermalModel.py"],
+    ["python3", "apis/StateTransitionRecorder.py"],
     ["python3", "apis/Sensors/TemperatureSensorSim.py"],
+    ["python3", "apis/Sensors/TemperatureSensorTrace.py"],
+    ["python3", "apis/Sensors/TemperatureSensorGroup.py"],
     ["python3", "apis/Relays/RelayControllerSim.py"],
+    ["python3", "apis/Relays/PowerControlGateKeeper.py"],
+    ["python3", "apis/Relays/RelayCommandQueue.py"],
+    ["python3", "apis/Filters/BatchMeanFilter.py"],
+    ["python3", "apis/Filters/MovingAverageFilter.py"],
+    ["python3", "apis/Filters/EwmaFilter.py"],
+    ["python3", "apis/Filters/RunningMedianFilter.py"],
     ["python3", "apis/DatabaseAccess/DbInterface.py"],
+    ["python3", "apis/DatabaseAccess/CachedColumns.py"],
+    ["python3", "apis/DatabaseAccess/RollupEngine.py"],
+    ["python3", "apis/DatabaseAccess/StateTransitionStore.py"],
+    ["python3", "apis/DatabaseAccess/SampleCapture.py"],
+    ["python3", "apis/Simulation/EventScheduler.py"],
+    ["python3", "apis/Simulation/SimulationRunner.py"],
+    ["python3", "apis/Simulation/TraceReplay.py"],
+    ["python3", "apis/Simulation/BatchSimulator.py"],
+    ["python3", "apis/Simulation/ParameterSweep.py"],
+    ["python3", "ZoneSchedulerThread.py"],
+    ["python3", "AsyncRuntime.py"],
 ]
 
 try: